@@ -5,15 +5,11 @@ from ScanParams import AimingScanParams
 from AcqParams import AcqParams
 from OCTUiParams import OCTUiParams
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout
-from vortex_tools.ui.display import CrossSectionImageWidget
-from TraceWidget import AscanTraceWidget, SpectraTraceWidget
-import matplotlib as mpl
 from math import radians
 
 from vortex.scan import RadialScan, RadialScanConfig
-from vortex.engine import StackDeviceTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, SpectraStackEndpoint, NullEndpoint
+from vortex.engine import StackDeviceTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, NullEndpoint
 from vortex.format import FormatPlanner, FormatPlannerConfig, StackFormatExecutorConfig, StackFormatExecutor, SimpleSlice
-from vortex.storage import SimpleStackUInt16
 from vortex.marker import Flags
 from vortex import get_console_logger as get_logger
 
@@ -25,8 +21,9 @@ class AimingScanGUIHelper(ScanGUIHelper):
     def __init__(self, name: str, flags: int, params: AimingScanParams, settings: Dict[str, Any], octui):
         super().__init__(name, flags, params, settings, octui)
 
-        self._edit_widget = AimingScanConfigWidget()
-        self._edit_widget.setAimingScanParams(self.params)
+        if not self.headless:
+            self._edit_widget = AimingScanConfigWidget()
+            self._edit_widget.setAimingScanParams(self.params)
         self._cross_widget_1 = None
         self._cross_widget_2 = None
         self._ascan_trace_widget = None
@@ -37,18 +34,20 @@ class AimingScanGUIHelper(ScanGUIHelper):
     def cb_ascan(self, v):
         if v:
             if v[-1]%2:
-                self._cross_widget_1.notify_segments(v)
+                self.notifySegments(self._cross_widget_1, v)
             else:
-                self._cross_widget_2.notify_segments(v)
+                self.notifySegments(self._cross_widget_2, v)
         else:
-            self._cross_widget_1.notify_segments(v)
-            self._cross_widget_2.notify_segments(v)
+            self.notifySegments(self._cross_widget_1, v)
+            self.notifySegments(self._cross_widget_2, v)
         self._ascan_trace_widget.update_trace(v)
 
     def cb_spectra(self, v):
             self._spectra_trace_widget.update_trace(v)
 
     def getParams(self):
+        if self.headless:
+            return self.params
         params = self._edit_widget.getAimingScanParams()
         return params
 
@@ -59,8 +58,8 @@ class AimingScanGUIHelper(ScanGUIHelper):
         settings = {}
         settings['cross1.range'] = self._cross_widget_1._range
         settings['cross2.range'] = self._cross_widget_2._range
-        settings['ascan.ylim'] = list(self._ascan_trace_widget._axes.get_ylim())
-        settings['spectra.ylim'] = list(self._spectra_trace_widget._axes.get_ylim())
+        settings['ascan.ylim'] = list(self._ascan_trace_widget.get_ylim())
+        settings['spectra.ylim'] = list(self._spectra_trace_widget.get_ylim())
         return settings
     
     def getScan(self):
@@ -95,10 +94,9 @@ class AimingScanGUIHelper(ScanGUIHelper):
         format_planner.initialize(fc)
 
         # For saving volumes, this NullEndpoint is used. The volume_callback for this 
-        # endpoint will be called before that of the other endpoints. If needed, we open
-        # the storage in the volume_callback for this endpoint when needed. The storage 
-        # is closed in the volume_callback for the SpectraStackEndpoint, which does the 
-        # saving/writing of volumes.
+        # endpoint will be called before that of the other endpoints. If needed, the
+        # VolumeWriter is opened in the volume_callback for this endpoint. Volumes are
+        # handed to the writer from the volume_callback of the spectra endpoint.
         null_endpoint = NullEndpoint(get_logger('Traffic cop(aiming)', self.log_level))
 
         # For DISPLAYING ascans (oct-processed data), slice away half the data. 
@@ -120,22 +118,21 @@ class AimingScanGUIHelper(ScanGUIHelper):
         self._logger.info('Create SpectraStackHostTensorEndpointUInt16 with shape {0:s}'.format(str(shape_spectra)))
         spectra_endpoint = SpectraStackHostTensorEndpointUInt16(sfe_spectra, shape_spectra, get_logger('stack', self.log_level))
 
-        # make an endpoint for saving spectra data
-        shape = (self.params.bscans_per_volume, self.params.ascans_per_bscan, samples_per_record, 1)
-        spectra_storage = SimpleStackUInt16(get_logger('npy-spectra', self.log_level))
-        sfec = StackFormatExecutorConfig()
-        sfe = StackFormatExecutor()
-        sfe.initialize(sfec)
-        storage_endpoint = SpectraStackEndpoint(sfe, spectra_storage, log=get_logger('npy-spectra', self.log_level))
 
-        self._components = ScanGUIHelperComponents(format_planner=format_planner, null_endpoint=null_endpoint, storage_endpoint=storage_endpoint, spectra_endpoint=spectra_endpoint, storage=spectra_storage, ascan_endpoint=ascan_endpoint, plot_widget=self.getPlotWidget(ascan_endpoint, spectra_endpoint))
+        self._components = ScanGUIHelperComponents(format_planner=format_planner, null_endpoint=null_endpoint, spectra_endpoint=spectra_endpoint, ascan_endpoint=ascan_endpoint, plot_widget=None if self.headless else self.getPlotWidget(ascan_endpoint, spectra_endpoint))
 
 
     def getPlotWidget(self, ascan_endpoint, spectra_endpoint) -> QWidget:
+        # plot modules (matplotlib etc) are imported here, not at startup
+        from vortex_tools.ui.display import CrossSectionImageWidget
+        from TraceWidget import AscanTraceWidget, SpectraTraceWidget
+        import matplotlib as mpl
+
         self._cross_widget_1 = CrossSectionImageWidget(ascan_endpoint, cmap=mpl.colormaps['gray'], title="horiz")
         self._cross_widget_2 = CrossSectionImageWidget(ascan_endpoint, cmap=mpl.colormaps['gray'], title="vert")
         self._ascan_trace_widget = AscanTraceWidget(ascan_endpoint, title="ascan")
         self._spectra_trace_widget = SpectraTraceWidget(spectra_endpoint, title="raw spectra")
+        self.registerPlots(self._cross_widget_1, self._cross_widget_2, self._ascan_trace_widget, self._spectra_trace_widget)
 
         # apply settings
         if 'cross1.range' in self.settings:
@@ -150,9 +147,13 @@ class AimingScanGUIHelper(ScanGUIHelper):
         if 'spectra.ylim' in self.settings:
             self._spectra_trace_widget.set_ylim(self.settings['spectra.ylim'])
 
+        if 'autoscale.percentiles' in self.settings:
+            self._ascan_trace_widget.set_autoscale_percentiles(self.settings['autoscale.percentiles'])
+            self._spectra_trace_widget.set_autoscale_percentiles(self.settings['autoscale.percentiles'])
+
         # callbacks
-        ascan_endpoint.aggregate_segment_callback = self.cb_ascan
-        spectra_endpoint.aggregate_segment_callback = self.cb_spectra
+        ascan_endpoint.aggregate_segment_callback = self.instrument(self.cb_ascan)
+        spectra_endpoint.aggregate_segment_callback = self.instrument(self.cb_spectra)
 
         # 
         vbox = QVBoxLayout()
@@ -0,0 +1,123 @@
+from dataclasses import dataclass, field
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Dict, List
+import threading
+import math
+from vortex import get_console_logger
+
+# Histogram bins are powers of 2 from HISTOGRAM_BASE: bin k counts calls taking [base*2^k, base*2^(k+1)),
+# bin 0 also counts faster calls and the last bin also counts slower ones.
+HISTOGRAM_BASE = 10e-6
+HISTOGRAM_BINS = 16
+
+
+@dataclass
+class CallbackStats:
+    '''Timing of one engine callback. Times are in seconds.'''
+    name: str
+    calls: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    over_budget: int = 0
+    histogram: List[int] = field(default_factory=lambda: [0] * HISTOGRAM_BINS)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+    def percentile(self, p: float) -> float:
+        '''Upper edge of the histogram bin holding the p'th percentile.'''
+        target = self.calls * p / 100
+        n = 0
+        for (k, count) in enumerate(self.histogram):
+            n += count
+            if n >= target and count > 0:
+                return min(HISTOGRAM_BASE * 2**(k + 1), self.max)
+        return self.max
+
+
+class CallbackTimers():
+    '''
+    Times callbacks that run on engine threads. instrument() is applied where a callback is wired to an
+    endpoint, and returns the callback unchanged when timing is not enabled - so enabled must be set
+    before the engine components are built, and there is no cost at all when it is off.
+
+    A callback that takes longer than its budget is counted, and logged at most once a second. The budget
+    is segment_time per segment for segment callbacks (the time the engine takes to acquire the segments),
+    and segment_time for volume callbacks. No budget is checked while segment_time is 0.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.segment_time = 0.0
+        self._logger = get_console_logger('CallbackTimers')
+        self._lock = threading.Lock()
+        self._stats: Dict[str, CallbackStats] = {}
+        self._warned: Dict[str, float] = {}
+
+    def instrument(self, name: str, segments: bool=True) -> Callable[[Callable], Callable]:
+        '''
+        Decorator that times a callback, if enabled.
+
+        :param name: Name in stats()
+        :param segments: The callback's first argument is a list of segments, and the budget is per segment
+        '''
+        def decorator(fn: Callable) -> Callable:
+            if not self.enabled:
+                return fn
+            with self._lock:
+                self._stats.setdefault(name, CallbackStats(name))
+
+            @wraps(fn)
+            def timed(*args):
+                t0 = perf_counter()
+                try:
+                    return fn(*args)
+                finally:
+                    self._record(name, perf_counter() - t0, len(args[0]) if segments and args else 1)
+            return timed
+        return decorator
+
+    def _record(self, name: str, dt: float, n: int):
+        k = min(HISTOGRAM_BINS - 1, int(math.log2(dt / HISTOGRAM_BASE))) if dt >= 2 * HISTOGRAM_BASE else 0
+        budget = self.segment_time * max(n, 1)
+        over = budget > 0 and dt > budget
+        with self._lock:
+            s = self._stats[name]
+            s.calls += 1
+            s.total += dt
+            s.max = max(s.max, dt)
+            s.histogram[k] += 1
+            if over:
+                s.over_budget += 1
+                t = perf_counter()
+                if t - self._warned.get(name, 0.0) < 1.0:
+                    over = False
+                else:
+                    self._warned[name] = t
+        if over:
+            self._logger.warning("{0:s} took {1:.2f}ms, budget {2:.2f}ms ({3:d} over budget so far)".format(name, dt * 1000, budget * 1000, s.over_budget))
+
+    def stats(self) -> List[CallbackStats]:
+        '''Copy of the stats for each instrumented callback.'''
+        with self._lock:
+            return [CallbackStats(s.name, s.calls, s.total, s.max, s.over_budget, list(s.histogram)) for s in self._stats.values()]
+
+    def reset(self):
+        with self._lock:
+            for s in self._stats.values():
+                (s.calls, s.total, s.max, s.over_budget) = (0, 0.0, 0.0, 0)
+                s.histogram = [0] * HISTOGRAM_BINS
+            self._warned = {}
+
+    def report(self) -> List[str]:
+        '''One line for each callback that has been called, times in ms.'''
+        lines = []
+        for s in self.stats():
+            if s.calls:
+                lines.append("{0:s}: {1:d} calls, mean {2:.3f} p99 {3:.3f} max {4:.3f}, {5:d} over budget".format(s.name, s.calls, s.mean * 1000, s.percentile(99) * 1000, s.max * 1000, s.over_budget))
+        return lines
+
+
+# shared by the scan helpers, OCTUi and the headless runner
+callback_timers = CallbackTimers()
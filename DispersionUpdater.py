@@ -0,0 +1,43 @@
+from typing import Tuple, Callable, Optional
+from PyQt5.QtCore import QObject, QTimer
+from vortex import get_console_logger
+
+class DispersionUpdater(QObject):
+    '''
+    Coalesces dispersion changes from the DispersionWidget. Spin box steps arrive much faster than the
+    processor can be reconfigured, so only the latest value is applied, at most once per interval.
+    The apply function should return the time (s) the change took.
+    '''
+    def __init__(self, apply: Callable[[Tuple[float, float]], float], interval_ms: int=50, parent: QObject=None):
+        super().__init__(parent)
+        self._logger = get_console_logger('DispersionUpdater')
+        self._apply = apply
+        self._pending: Optional[Tuple[float, float]] = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._timeout)
+        self._requested = 0
+        self._applied = 0
+        self._max_change_time = 0.0
+
+    def request(self, dispersion: Tuple[float, float]):
+        self._pending = dispersion
+        self._requested += 1
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        '''Apply any pending value now.'''
+        self._timer.stop()
+        self._timeout()
+
+    def _timeout(self):
+        if self._pending is None:
+            return
+        dispersion = self._pending
+        self._pending = None
+        dt = self._apply(dispersion)
+        self._applied += 1
+        self._max_change_time = max(self._max_change_time, dt)
+        self._logger.info("Updated dispersion to ({:e},{:e}) in {:.1f}ms ({:d} requests, {:d} applied, max {:.1f}ms)".format(*dispersion, dt*1000, self._requested, self._applied, self._max_change_time*1000))
@@ -0,0 +1,163 @@
+from qtpy.QtCore import QObject, QTimer, Qt
+from qtpy.QtWidgets import QWidget, QLabel
+from time import perf_counter
+from typing import Iterable, Dict, Tuple
+import threading
+
+class _DisplayEntry():
+    def __init__(self, widget: QWidget, name: str):
+        self.widget = widget
+        self.name = name
+        self.dirty = False
+        self.bscans: Dict[int, None] = {}       # ordered set of bscan indices since the last frame
+        self.render_time = 0.0                  # smoothed, seconds
+        self.frames = 0                         # repaints since the last widget_frames()
+        self.overlay: QLabel = None
+
+
+class DisplayScheduler(QObject):
+    '''
+    Repaints plot widgets from one timer on the GUI thread, at no more than max_fps. Engine callbacks only
+    mark widgets dirty (notify() or invalidate()), accumulating the B-scan indices for each widget until
+    its next frame. A frame that takes longer than the frame interval causes the frames it overran to be
+    skipped, so display load cannot back up acquisition.
+
+    Widgets must be registered (on the GUI thread) before they are notified.
+    '''
+    def __init__(self, max_fps: float=30.0, overlay: bool=False, parent: QObject=None):
+        '''
+        :param max_fps: Maximum frames (repaints of each dirty widget) per second
+        :param overlay: Show each widget's render time in its top left corner
+        '''
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        self._entries: Dict[int, _DisplayEntry] = {}
+        self._overlay = overlay
+        self._frames = 0
+        self._skipped = 0
+        self._skip = 0
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.timeout.connect(self._frame)
+        self.max_fps = max_fps
+
+    @property
+    def max_fps(self) -> float:
+        return 1000.0 / self._timer.interval()
+
+    @max_fps.setter
+    def max_fps(self, fps: float):
+        self._timer.setInterval(max(1, int(1000.0 / fps)))
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def register(self, widget: QWidget, name: str=None):
+        '''
+        Call on the GUI thread, after the widget is created.
+
+        :param name: Name of the widget in widget_frames(), default its objectName() or class name
+        '''
+        from TracePlot import TracePlot
+        key = id(widget)
+        with self._lock:
+            self._entries[key] = _DisplayEntry(widget, name or widget.objectName() or type(widget).__name__)
+        if isinstance(widget, TracePlot):
+            widget.display = self
+        widget.destroyed.connect(lambda *args, key=key: self._remove(key))
+
+    def notify(self, widget: QWidget, bscan_idxs: Iterable[int]):
+        '''
+        B-scans in bscan_idxs have new data. Safe to call from the engine thread. At the next frame the
+        widget's notify_segments() is called with all B-scans since the last frame, then it is repainted.
+        '''
+        with self._lock:
+            entry = self._entries.get(id(widget))
+            if entry is not None:
+                for b in bscan_idxs:
+                    # moves b to the end, so indices stay in the order they were last seen
+                    entry.bscans.pop(b, None)
+                    entry.bscans[b] = None
+                entry.dirty = True
+                return
+        widget.notify_segments(bscan_idxs)
+
+    def invalidate(self, widget: QWidget):
+        '''Repaint widget at the next frame. Safe to call from the engine thread.'''
+        with self._lock:
+            entry = self._entries.get(id(widget))
+            if entry is not None:
+                entry.dirty = True
+                return
+        widget.update()
+
+    def stats(self) -> Tuple[int, int]:
+        '''(frames that repainted at least one widget, skipped frames) since the last call.'''
+        with self._lock:
+            s = (self._frames, self._skipped)
+            self._frames = 0
+            self._skipped = 0
+        return s
+
+    def widget_frames(self) -> Dict[str, int]:
+        '''Repaints of each registered widget since the last call, by name.'''
+        with self._lock:
+            frames = {}
+            for entry in self._entries.values():
+                frames[entry.name] = frames.get(entry.name, 0) + entry.frames
+                entry.frames = 0
+        return frames
+
+    def _remove(self, key: int):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _frame(self):
+        if self._skip > 0:
+            self._skip -= 1
+            with self._lock:
+                self._skipped += 1
+            return
+
+        t0 = perf_counter()
+        with self._lock:
+            dirty = []
+            for (key, entry) in self._entries.items():
+                if entry.dirty:
+                    dirty.append((key, entry, list(entry.bscans)))
+                    entry.bscans = {}
+                    entry.dirty = False
+        for (key, entry, bscans) in dirty:
+            t = perf_counter()
+            try:
+                if bscans:
+                    entry.widget.notify_segments(bscans)
+                entry.widget.repaint()
+            except RuntimeError:
+                # underlying widget has been deleted
+                self._remove(key)
+                continue
+            dt = perf_counter() - t
+            entry.frames += 1
+            entry.render_time = dt if entry.render_time == 0 else 0.9 * entry.render_time + 0.1 * dt
+            if self._overlay:
+                self._showOverlay(entry)
+
+        # only ticks that repainted something are frames
+        if dirty:
+            with self._lock:
+                self._frames += 1
+        # skip the frames this one overran
+        self._skip = int((perf_counter() - t0) * 1000) // self._timer.interval()
+
+    def _showOverlay(self, entry: _DisplayEntry):
+        if entry.overlay is None:
+            entry.overlay = QLabel(entry.widget)
+            entry.overlay.setStyleSheet("background-color: rgba(0, 0, 0, 128); color: white; font-size: 9px; padding: 1px;")
+            entry.overlay.move(2, 2)
+            entry.overlay.show()
+        entry.overlay.setText("{0:.1f} ms".format(entry.render_time * 1000))
+        entry.overlay.adjustSize()
@@ -0,0 +1,222 @@
+from qtpy.QtCore import QObject, QTimer, Signal
+from qtpy.QtWidgets import QWidget, QLabel, QFormLayout, QVBoxLayout, QPushButton, QFileDialog
+from dataclasses import dataclass, field, fields
+from collections import deque
+from time import perf_counter, time
+from typing import Callable, Dict, List, Optional
+import threading
+import csv
+import math
+import numpy as np
+from vortex import get_console_logger
+from TracePlot import TracePlot
+from CallbackTimers import callback_timers
+
+
+@dataclass
+class HealthSample:
+    '''Engine and GUI metrics at one time. Values that are not available are NaN.'''
+    time: float                     # seconds since the epoch
+    block_utilization: float
+    inflight_blocks: int
+    dispatched_blocks: int
+    dispatch_completion: float
+    volumes_per_second: float
+    save_queued: int                # volumes waiting to be written, 0 if not saving
+    gpu_memory_used_mb: float
+    display_fps: Dict[str, float] = field(default_factory=dict)     # per registered plot widget
+
+
+def gpu_memory_used_mb() -> float:
+    '''Memory in use on the current CUDA device (all processes), NaN without cupy.'''
+    try:
+        import cupy
+        (free, total) = cupy.cuda.runtime.memGetInfo()
+    except Exception:
+        return math.nan
+    return (total - free) / 2**20
+
+
+class EngineHealth(QObject):
+    '''
+    Samples engine status and GUI metrics at a fixed rate (on the GUI thread) into a ring buffer of
+    HealthSample. A warning is emitted when block utilization crosses warn_utilization, or is rising fast
+    enough to reach 1 (no blocks left to preload) within warn_horizon seconds. It is re-armed once
+    utilization drops back below warn_utilization - 0.1.
+    '''
+
+    sampled = Signal(object)        # HealthSample
+    warning = Signal(str)
+
+    def __init__(self, status: Callable, display=None, save_queued: Callable[[], int]=None, rate: float=2.0, history: float=300.0,
+                 warn_utilization: float=0.8, warn_horizon: float=5.0, parent: QObject=None):
+        '''
+        :param status: Returns the engine's EngineStatus
+        :param display: DisplayScheduler, for the frame rate of each plot widget
+        :param save_queued: Returns the number of volumes waiting to be saved
+        :param rate: Samples per second
+        :param history: Seconds of samples kept
+        '''
+        super().__init__(parent)
+        self._logger = get_console_logger('EngineHealth')
+        self._status = status
+        self._display = display
+        self._save_queued = save_queued
+        self.warn_utilization = warn_utilization
+        self.warn_horizon = warn_horizon
+        self._samples = deque(maxlen=max(2, int(history * rate)))
+        self._lock = threading.Lock()
+        self._volumes = 0
+        self._last = None
+        self._warned = False
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.sample)
+        self._timer.setInterval(max(1, int(1000.0 / rate)))
+
+    def start(self):
+        self._last = perf_counter()
+        self._warned = False
+        with self._lock:
+            self._volumes = 0
+        if self._display is not None:
+            self._display.widget_frames()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def count_volume(self):
+        '''Call once per volume. Safe to call from the engine thread.'''
+        with self._lock:
+            self._volumes += 1
+
+    @property
+    def samples(self) -> List[HealthSample]:
+        return list(self._samples)
+
+    @property
+    def latest(self) -> Optional[HealthSample]:
+        return self._samples[-1] if self._samples else None
+
+    def sample(self):
+        now = perf_counter()
+        dt = max(now - self._last, 1e-6)
+        self._last = now
+        with self._lock:
+            volumes = self._volumes
+            self._volumes = 0
+        status = self._status()
+        fps = {}
+        if self._display is not None:
+            fps = {name: n / dt for (name, n) in self._display.widget_frames().items()}
+        s = HealthSample(time=time(), block_utilization=status.block_utilization, inflight_blocks=status.inflight_blocks,
+                         dispatched_blocks=status.dispatched_blocks, dispatch_completion=status.dispatch_completion,
+                         volumes_per_second=volumes / dt, save_queued=self._save_queued() if self._save_queued is not None else 0,
+                         gpu_memory_used_mb=gpu_memory_used_mb(), display_fps=fps)
+        self._samples.append(s)
+        self._check(s)
+        self.sampled.emit(s)
+
+    def seconds_to_full(self, window: int=10) -> float:
+        '''Seconds until block utilization reaches 1 at its rate of rise over the last window samples, inf if not rising.'''
+        samples = list(self._samples)[-window:]
+        if len(samples) < 2:
+            return math.inf
+        t = np.array([s.time for s in samples])
+        u = np.array([s.block_utilization for s in samples])
+        if t[-1] <= t[0]:
+            return math.inf
+        slope = np.polyfit(t - t[0], u, 1)[0]
+        if slope <= 0:
+            return math.inf
+        return max(0.0, (1.0 - u[-1]) / slope)
+
+    def _check(self, s: HealthSample):
+        if self._warned:
+            if s.block_utilization < self.warn_utilization - 0.1:
+                self._warned = False
+            return
+        message = None
+        if s.block_utilization >= self.warn_utilization:
+            message = "block utilization {0:.2f} is above {1:.2f}".format(s.block_utilization, self.warn_utilization)
+        else:
+            t = self.seconds_to_full()
+            if t < self.warn_horizon:
+                message = "block utilization {0:.2f} will reach 1 in {1:.1f}s".format(s.block_utilization, t)
+        if message is not None:
+            self._warned = True
+            self._logger.warning(message + " - preloaded blocks are running out")
+            self.warning.emit(message)
+
+    def to_csv(self, path: str):
+        '''Write the samples to a CSV file, one column for each metric and one for each plot widget's frame rate.'''
+        samples = self.samples
+        names = [f.name for f in fields(HealthSample) if f.name != 'display_fps']
+        widgets = sorted({name for s in samples for name in s.display_fps})
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(names + ["fps {0:s}".format(w) for w in widgets])
+            for s in samples:
+                writer.writerow([getattr(s, n) for n in names] + [s.display_fps.get(w, '') for w in widgets])
+
+
+class EngineHealthPanel(QWidget):
+    '''
+    Latest values from an EngineHealth, with a plot of block utilization and dispatch completion over the history.
+    Callback timings are shown too, if callbacks are instrumented.
+    '''
+
+    def __init__(self, health: EngineHealth, parent=None):
+        super().__init__(parent)
+        self._health = health
+        self._labels: Dict[str, QLabel] = {}
+        form = QFormLayout()
+        for (key, text) in [('block_utilization', 'Block utilization'), ('inflight_blocks', 'Inflight blocks'),
+                            ('dispatched_blocks', 'Dispatched blocks'), ('dispatch_completion', 'Dispatch completion'),
+                            ('volumes_per_second', 'Volumes/s'), ('save_queued', 'Save queue'),
+                            ('gpu_memory_used_mb', 'GPU memory (MB)'), ('display_fps', 'Display fps')]:
+            self._labels[key] = QLabel('-')
+            form.addRow(text, self._labels[key])
+        self._warning = QLabel('')
+        self._warning.setStyleSheet("color: red;")
+        self._warning.setWordWrap(True)
+        self._callbacks = QLabel('')
+        self._callbacks.setStyleSheet("font-family: monospace;")
+        self._callbacks.setVisible(callback_timers.enabled)
+        self._plot = TracePlot(self, width=3, height=2, title='utilization (red), dispatch completion (blue)')
+        self._plot.set_ylim((0, 1))
+        self._pbExport = QPushButton("Export CSV...")
+        self._pbExport.clicked.connect(self.exportClicked)
+        layout = QVBoxLayout(self)
+        layout.addLayout(form)
+        layout.addWidget(self._warning)
+        layout.addWidget(self._callbacks)
+        layout.addWidget(self._plot)
+        layout.addWidget(self._pbExport)
+        health.sampled.connect(self.showSample)
+        health.warning.connect(self._warning.setText)
+
+    def showSample(self, s: HealthSample):
+        self._labels['block_utilization'].setText("{0:.3f}".format(s.block_utilization))
+        self._labels['inflight_blocks'].setText(str(s.inflight_blocks))
+        self._labels['dispatched_blocks'].setText(str(s.dispatched_blocks))
+        self._labels['dispatch_completion'].setText("{0:.3f}".format(s.dispatch_completion))
+        self._labels['volumes_per_second'].setText("{0:.1f}".format(s.volumes_per_second))
+        self._labels['save_queued'].setText(str(s.save_queued))
+        self._labels['gpu_memory_used_mb'].setText("-" if math.isnan(s.gpu_memory_used_mb) else "{0:.0f}".format(s.gpu_memory_used_mb))
+        self._labels['display_fps'].setText("\n".join("{0:s}: {1:.0f}".format(name, fps) for (name, fps) in sorted(s.display_fps.items())) or "-")
+        if s.block_utilization < self._health.warn_utilization - 0.1:
+            self._warning.setText('')
+        if not self.isVisible():
+            return
+        if callback_timers.enabled:
+            self._callbacks.setText("\n".join(callback_timers.report()))
+        samples = self._health.samples
+        self._plot.set_line(0, np.array([x.block_utilization for x in samples]), (1, 0, 0))
+        self._plot.set_line(1, np.array([x.dispatch_completion for x in samples]), (0, 0, 1))
+        self._plot.update()
+
+    def exportClicked(self):
+        (path, _) = QFileDialog.getSaveFileName(self, "Export engine health", "engine-health.csv", "CSV files (*.csv)")
+        if path:
+            self._health.to_csv(path)
@@ -0,0 +1,230 @@
+from typing import Dict, List, Tuple, Iterator, Iterable, Optional, TextIO
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+import re
+import json
+import numpy as np
+import logging
+
+LOGGER = logging.getLogger('EngineLog')
+
+# Engine logs (log_level=0) have lines like
+#   [16-Oct-2025 10:30:34.170363] acquire    (T) acquired block 48 with 500 records
+# Console output from several threads can run together on one line, so entries are found with finditer,
+# each one ending where the next timestamp starts.
+ENTRY = re.compile(r'\[(\d{1,2}-\w{3}-\d{4}) (\d{1,2}):(\d{2}):(\d{2}(?:\.\d+)?)\] (\S+(?: \S+)*?)\s+\((\w)\) (.*?)(?=\[\d{1,2}-\w{3}-\d{4} |$)')
+
+# (event, source, message) for each block lifecycle event. Engine messages name the job and the block,
+# the others only the block.
+ENGINE_EVENTS = [
+    ('created', re.compile(r'created job (\d+) \(block (\d+)\)')),
+    ('acquired', re.compile(r'acquired job (\d+) \(block (\d+)\)')),
+    ('process_sent', re.compile(r'sending job (\d+) \(block (\d+)\) for processing')),
+    ('processed', re.compile(r'processed job (\d+) \(block (\d+)\)')),
+    ('format_sent', re.compile(r'sending job (\d+) \(block (\d+)\) for formatting')),
+    ('recycled', re.compile(r'formatted job (\d+) and recycling block (\d+)')),
+]
+BLOCK_EVENTS = [
+    ('acquire', 'posted', re.compile(r'posting block (\d+)')),
+    ('acquire', 'acquire_done', re.compile(r'acquired block (\d+) with \d+ records')),
+    ('process', 'dispatching', re.compile(r'dispatching block (\d+) \(slot \d+\)')),
+    ('process', 'dispatched', re.compile(r'dispatched block (\d+) \(slot \d+\)')),
+    ('process', 'process_done', re.compile(r'processed block (\d+) \(slot \d+\)')),
+]
+TRANSFER = re.compile(r'transferring chunk \[(\d+)-(\d+)\) to host')
+
+# Sources that are part of the engine rather than endpoints (formatters and tensor endpoints log under their own names)
+ENGINE_SOURCES = {'engine', 'acquire', 'process', 'output', 'strobe'}
+
+# (name, from event, to event) - latencies reported for each block
+STAGES = [
+    ('process queue', 'acquired', 'dispatching'),
+    ('process', 'dispatching', 'process_done'),
+    ('format queue', 'processed', 'format_sent'),
+    ('format', 'format_sent', 'recycled'),
+    ('acquire to recycle', 'acquired', 'recycled'),
+]
+
+
+@dataclass
+class Entry:
+    '''One log entry. time is seconds since the epoch (local time).'''
+    time: float
+    source: str
+    level: str
+    message: str
+
+
+@dataclass
+class Transfer:
+    '''A host transfer by an endpoint, timed until the next formatting entry.'''
+    time: float
+    endpoint: str
+    job: int
+    chunk: Tuple[int, int]
+    duration: float
+
+
+@dataclass
+class LatencySummary:
+    '''Distribution of a latency over blocks, in ms.'''
+    name: str
+    count: int
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+_dates: Dict[str, float] = {}
+
+def _timestamp(date: str, h: str, m: str, s: str) -> float:
+    # strptime is only called once per day in the log
+    if date not in _dates:
+        _dates[date] = datetime.strptime(date, '%d-%b-%Y').timestamp()
+    return _dates[date] + int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def read_entries(lines: Iterable[str]) -> Iterator[Entry]:
+    '''Entries from the lines of a log. Text that isn't part of an entry (e.g. the shell prompt) is skipped.'''
+    for line in lines:
+        if '[' not in line:
+            continue
+        for m in ENTRY.finditer(line.rstrip('\r\n')):
+            yield Entry(_timestamp(m.group(1), m.group(2), m.group(3), m.group(4)), m.group(5), m.group(6), m.group(7).rstrip())
+
+
+class EngineLog():
+    '''
+    Rebuilds the lifecycle of each block from the entries of an engine log, one entry at a time. A block's
+    events are kept until it is recycled, then reduced to latencies, so memory use doesn't grow with the log.
+
+    Entries from endpoints (any source not in ENGINE_SOURCES, e.g. 'raster format' or 'stack') are assigned
+    to the job most recently sent for formatting.
+    '''
+    def __init__(self, slow_transfer: float=0.002):
+        '''
+        :param slow_transfer: Host transfers that take longer than this (s) are kept in slow_transfers
+        '''
+        self.slow_transfer = slow_transfer
+        self.latencies: Dict[str, List[float]] = {name: [] for (name, _, _) in STAGES}
+        self.endpoint_latencies: Dict[str, List[float]] = {}
+        self.transfer_durations: List[float] = []
+        self.slow_transfers: List[Transfer] = []
+        self.entries = 0
+        self.blocks = 0
+        self._jobs: Dict[int, Dict[str, float]] = {}        # events of jobs in flight
+        self._endpoints: Dict[int, Dict[str, float]] = {}   # last entry time per endpoint, for jobs being formatted
+        self._block_job: Dict[int, int] = {}                # block -> job using it
+        self._formatting: Optional[int] = None
+        self._transfer = None                               # (time, endpoint, job, chunk) awaiting the next entry
+
+    def read(self, path: str):
+        with open(path, 'r', errors='replace') as f:
+            for entry in read_entries(f):
+                self.add(entry)
+
+    def add(self, entry: Entry):
+        self.entries += 1
+        (t, source, message) = (entry.time, entry.source, entry.message)
+
+        # a transfer ends with the next entry from the formatting thread
+        if self._transfer is not None and (source not in ENGINE_SOURCES or message.startswith('formatted job')):
+            self._end_transfer(t)
+
+        if source == 'engine':
+            for (event, pattern) in ENGINE_EVENTS:
+                m = pattern.match(message)
+                if m:
+                    (job, block) = (int(m.group(1)), int(m.group(2)))
+                    self._block_job[block] = job
+                    self._jobs.setdefault(job, {})[event] = t
+                    if event == 'format_sent':
+                        self._formatting = job
+                        self._endpoints[job] = {}
+                    elif event == 'recycled':
+                        self._finish(job)
+                    break
+        elif source in ENGINE_SOURCES:
+            for (s, event, pattern) in BLOCK_EVENTS:
+                if s != source:
+                    continue
+                m = pattern.match(message)
+                if m:
+                    job = self._block_job.get(int(m.group(1)))
+                    if job is not None:
+                        self._jobs.setdefault(job, {})[event] = t
+                    break
+        elif self._formatting is not None:
+            job = self._formatting
+            self._endpoints.setdefault(job, {})[source] = t
+            m = TRANSFER.match(message)
+            if m:
+                self._transfer = (t, source, job, (int(m.group(1)), int(m.group(2))))
+
+    def _end_transfer(self, t: float):
+        (start, endpoint, job, chunk) = self._transfer
+        self._transfer = None
+        duration = t - start
+        self.transfer_durations.append(duration)
+        if duration > self.slow_transfer:
+            self.slow_transfers.append(Transfer(start, endpoint, job, chunk, duration))
+
+    def _finish(self, job: int):
+        events = self._jobs.pop(job)
+        endpoints = self._endpoints.pop(job, {})
+        if self._formatting == job:
+            self._formatting = None
+        self.blocks += 1
+        for (name, begin, end) in STAGES:
+            if begin in events and end in events:
+                self.latencies[name].append(events[end] - events[begin])
+        if 'acquired' in events:
+            for (endpoint, t) in endpoints.items():
+                self.endpoint_latencies.setdefault(endpoint, []).append(t - events['acquired'])
+
+    @property
+    def in_flight(self) -> int:
+        '''Jobs with events that were not recycled (yet).'''
+        return len(self._jobs)
+
+    def summary(self) -> Tuple[List[LatencySummary], List[LatencySummary]]:
+        '''(per stage, per endpoint) latency summaries. Endpoint latency is from acquisition to the endpoint's last entry for the block.'''
+        return ([_summarize(name, v) for (name, v) in self.latencies.items() if v],
+                [_summarize(name, v) for (name, v) in self.endpoint_latencies.items() if v])
+
+
+def _summarize(name: str, values: List[float]) -> LatencySummary:
+    v = np.asarray(values) * 1000
+    (p50, p90, p99) = np.percentile(v, [50, 90, 99])
+    return LatencySummary(name, len(v), float(p50), float(p90), float(p99), float(v.max()))
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO)
+
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+    parser = ArgumentParser(description='Per-block latencies from an engine log (run with log_level=0).', formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('path', nargs='+', help='engine log(s)')
+    parser.add_argument('--slow-transfer', type=float, default=2.0, help='flag host transfers longer than this (ms)')
+    parser.add_argument('--json', default='', help='write the report to this file')
+    args = parser.parse_args()
+
+    log = EngineLog(slow_transfer=args.slow_transfer / 1000)
+    for path in args.path:
+        log.read(path)
+    print("{0:d} entries, {1:d} blocks recycled, {2:d} not recycled".format(log.entries, log.blocks, log.in_flight))
+    (stages, endpoints) = log.summary()
+    print("{0:<20s} {1:>7s} {2:>9s} {3:>9s} {4:>9s} {5:>9s}".format('latency(ms)', 'count', 'p50', 'p90', 'p99', 'max'))
+    for s in stages:
+        print("{0:<20s} {1:7d} {2:9.3f} {3:9.3f} {4:9.3f} {5:9.3f}".format(s.name, s.count, s.p50, s.p90, s.p99, s.max))
+    print("acquired to last entry, per endpoint")
+    for s in endpoints:
+        print("{0:<20s} {1:7d} {2:9.3f} {3:9.3f} {4:9.3f} {5:9.3f}".format(s.name, s.count, s.p50, s.p90, s.p99, s.max))
+    print("{0:d} host transfers, {1:d} slower than {2:.3f}ms".format(len(log.transfer_durations), len(log.slow_transfers), args.slow_transfer))
+    for x in log.slow_transfers:
+        print("  {0:s} {1:s} chunk [{2:d}-{3:d}) job {4:d}: {5:.3f}ms".format(datetime.fromtimestamp(x.time).strftime('%H:%M:%S.%f'), x.endpoint, x.chunk[0], x.chunk[1], x.job, x.duration * 1000))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'stages': [asdict(s) for s in stages], 'endpoints': [asdict(s) for s in endpoints], 'slow_transfers': [asdict(x) for x in log.slow_transfers]}, f, indent=2)
@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from typing import Tuple
+import numpy as np
+
+
+@dataclass
+class GalvoDelayEstimate:
+    '''Result of comparing forward and reverse line profiles from a bidirectional line scan.'''
+    shift: float                # forward profile lags the reverse profile by this many A-scans
+    correlation: float          # normalized cross-correlation at the peak, 0-1. Low values mean the estimate is unreliable
+    correction: float           # seconds to add to galvo_delay
+    galvo_delay: float          # suggested galvo_delay (s)
+
+
+def _array_module(a):
+    # cupy is only imported when it's given a cupy array
+    if isinstance(a, np.ndarray):
+        return np
+    import cupy
+    return cupy.get_array_module(a)
+
+
+def estimate_shift(forward, reverse, max_shift: int=None) -> Tuple[float, float]:
+    '''
+    Sub-sample shift between two profiles, from the peak of their FFT cross-correlation. forward[n] is
+    approximately reverse[n - shift]. Runs on the GPU if the profiles are cupy arrays.
+
+    :param forward: Mean profile (one value per A-scan) of the forward lines
+    :param reverse: Mean profile of the reverse lines, already flipped to the same orientation
+    :param max_shift: Largest shift (A-scans) considered, default a quarter of the profile length
+    :return: (shift, normalized correlation at the peak)
+    '''
+    xp = _array_module(forward)
+    f = xp.asarray(forward, dtype=xp.float64)
+    r = xp.asarray(reverse, dtype=xp.float64)
+    n = min(len(f), len(r))
+    (f, r) = (f[:n], r[:n])
+    f = xp.nan_to_num(f - xp.nanmean(f))
+    r = xp.nan_to_num(r - xp.nanmean(r))
+    if max_shift is None:
+        max_shift = n // 4
+    max_shift = max(1, min(max_shift, n - 2))
+
+    # zero padded to 2n so the correlation isn't circular. cc[k] = sum f[m+k] r[m]; negative lags wrap to the end
+    nfft = 2 * n
+    cc = xp.fft.irfft(xp.fft.rfft(f, nfft) * xp.conj(xp.fft.rfft(r, nfft)), nfft)
+    lags = xp.concatenate([cc[-max_shift:], cc[:max_shift + 1]])
+    lags = lags.get() if xp is not np else lags
+
+    k = int(np.argmax(lags))
+    shift = float(k - max_shift)
+    # parabolic interpolation of the peak
+    if 0 < k < len(lags) - 1:
+        (y0, y1, y2) = lags[k - 1:k + 2]
+        denom = y0 - 2 * y1 + y2
+        if denom < 0:
+            shift += 0.5 * (y0 - y2) / denom
+
+    norm = float(xp.sqrt(xp.sum(f * f) * xp.sum(r * r)))
+    correlation = float(lags[k]) / norm if norm > 0 else 0.0
+    return (shift, correlation)
+
+
+def estimate_galvo_delay(forward, reverse, galvo_delay: float, triggers_per_second: float, max_shift: int=None) -> GalvoDelayEstimate:
+    '''
+    Estimate the galvo delay from the forward and reverse profiles of a bidirectional line scan. An error
+    of e A-scans in the delay moves the forward lines by +e and the (flipped) reverse lines by -e, so the
+    profiles are shifted by 2e relative to each other.
+
+    :param forward: Mean profile of the forward lines (e.g. mean MIP of mip[::2])
+    :param reverse: Mean profile of the reverse lines (mip[1::2])
+    :param galvo_delay: Current galvo delay (s)
+    :param triggers_per_second: Sweep (A-scan) rate, ssrc_triggers_per_second
+    :param max_shift: Largest shift (A-scans) considered
+    '''
+    (shift, correlation) = estimate_shift(forward, reverse, max_shift)
+    correction = shift / 2 / triggers_per_second
+    return GalvoDelayEstimate(shift=shift, correlation=correlation, correction=correction, galvo_delay=max(0.0, galvo_delay + correction))
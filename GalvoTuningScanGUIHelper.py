@@ -4,16 +4,13 @@ from ScanConfigWidget import GalvoTuningScanConfigWidget
 from ScanParams import GalvoTuningScanParams
 from AcqParams import AcqParams
 from OCTUiParams import OCTUiParams
-from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout
-from vortex_tools.ui.display import CrossSectionImageWidget
-from LineScanTraceWidget import LineScanTraceWidget
-import matplotlib as mpl
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QMessageBox
+from GalvoDelayEstimator import estimate_galvo_delay
 
 from vortex import Range
 from vortex.scan import RasterScan, RasterScanConfig
-from vortex.engine import StackDeviceTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, SpectraStackEndpoint, NullEndpoint
+from vortex.engine import StackDeviceTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, NullEndpoint
 from vortex.format import FormatPlanner, FormatPlannerConfig, StackFormatExecutorConfig, StackFormatExecutor, SimpleSlice
-from vortex.storage import SimpleStackUInt16
 from vortex.marker import Flags
 from vortex import get_console_logger as get_logger
 
@@ -26,11 +23,13 @@ class GalvoTuningScanGUIHelper(ScanGUIHelper):
         super().__init__(name, flags, params, settings, octui)
 
 
-        self._edit_widget = GalvoTuningScanConfigWidget()
-        self._edit_widget.setGalvoTuningScanParams(self.params)
+        if not self.headless:
+            self._edit_widget = GalvoTuningScanConfigWidget()
+            self._edit_widget.setGalvoTuningScanParams(self.params)
         self._cross_widget_1 = None
         self._cross_widget_2 = None
         self._linescan_trace_widget = None
+        self._estimate_label = None
         #self._plot_widget = self.galvoTuningPlotWidget()
 
 
@@ -39,12 +38,12 @@ class GalvoTuningScanGUIHelper(ScanGUIHelper):
         #     print("{0:d}, ({1:d},{2:d},{3:d})".format(v[-1], volume.shape[0], volume.shape[1], volume.shape[2]))
         if v:
             if v[-1]%2:
-                self._cross_widget_1.notify_segments(v)
+                self.notifySegments(self._cross_widget_1, v)
             else:
-                self._cross_widget_2.notify_segments(v)
+                self.notifySegments(self._cross_widget_2, v)
         else:
-            self._cross_widget_1.notify_segments(v)
-            self._cross_widget_2.notify_segments(v)
+            self.notifySegments(self._cross_widget_1, v)
+            self.notifySegments(self._cross_widget_2, v)
         self._linescan_trace_widget.update_trace(v)
 
     # def cb_spectra(self, v):
@@ -64,7 +63,28 @@ class GalvoTuningScanGUIHelper(ScanGUIHelper):
 
 
 
+    def estimateDelayClicked(self):
+        '''
+        Estimate galvo delay from the forward and reverse traces (one volume is enough), and offer to use it. 
+        The new delay is used the next time the engine is started.
+        '''
+        traces = self._linescan_trace_widget.traces()
+        if traces is None:
+            self._estimate_label.setText("No data yet.")
+            return
+        vtx = self.octui._params.vtx
+        est = estimate_galvo_delay(traces[0], traces[1], vtx.galvo_delay, vtx.ssrc_triggers_per_second)
+        text = "shift {0:.2f} ascans, corr {1:.2f}, delay {2:.6f}s -> {3:.6f}s".format(est.shift, est.correlation, vtx.galvo_delay, est.galvo_delay)
+        self._estimate_label.setText(text)
+        self._logger.info("galvo delay estimate: {0:s}".format(text))
+
+        button = QMessageBox.question(self._estimate_label, "Galvo delay", "Change galvo delay from {0:.6f}s to {1:.6f}s (correlation {2:.2f})?\n\nThe new delay is used the next time the engine is started.".format(vtx.galvo_delay, est.galvo_delay, est.correlation))
+        if button == QMessageBox.Yes:
+            self.octui.setGalvoDelay(est.galvo_delay)
+
     def getParams(self):
+        if self.headless:
+            return self.params
         params = self._edit_widget.getGalvoTuningScanParams()
         return params
 
@@ -75,7 +95,7 @@ class GalvoTuningScanGUIHelper(ScanGUIHelper):
         settings = {}
         settings['cross1.range'] = self._cross_widget_1._range
         settings['cross2.range'] = self._cross_widget_2._range
-        settings['linescan.ylim'] = list(self._linescan_trace_widget._axes.get_ylim())
+        settings['linescan.ylim'] = list(self._linescan_trace_widget.get_ylim())
         return settings
     
     def getScan(self):
@@ -109,10 +129,9 @@ class GalvoTuningScanGUIHelper(ScanGUIHelper):
         format_planner.initialize(fc)
 
         # For saving volumes, this NullEndpoint is used. The volume_callback for this 
-        # endpoint will be called before that of the other endpoints. If needed, we open
-        # the storage in the volume_callback for this endpoint when needed. The storage 
-        # is closed in the volume_callback for the SpectraStackEndpoint, which does the 
-        # saving/writing of volumes.
+        # endpoint will be called before that of the other endpoints. If needed, the
+        # VolumeWriter is opened in the volume_callback for this endpoint. Volumes are
+        # handed to the writer from the volume_callback of the spectra endpoint.
         null_endpoint = NullEndpoint(get_logger('Traffic cop(aiming)', self.log_level))
 
         # For DISPLAYING ascans (oct-processed data), slice away half the data. 
@@ -134,21 +153,20 @@ class GalvoTuningScanGUIHelper(ScanGUIHelper):
         self._logger.info('Create SpectraStackHostTensorEndpointUInt16 with shape {0:s}'.format(str(shape_spectra)))
         spectra_endpoint = SpectraStackHostTensorEndpointUInt16(sfe_spectra, shape_spectra, get_logger('stack', self.log_level))
 
-        # make an endpoint for saving spectra data
-        shape = (self.params.lines_per_volume, self.params.ascans_per_bscan, samples_per_record, 1)
-        spectra_storage = SimpleStackUInt16(get_logger('npy-spectra', self.log_level))
-        sfec = StackFormatExecutorConfig()
-        sfe = StackFormatExecutor()
-        sfe.initialize(sfec)
-        storage_endpoint = SpectraStackEndpoint(sfe, spectra_storage, log=get_logger('npy-spectra', self.log_level))
 
-        self._components = ScanGUIHelperComponents(format_planner=format_planner, null_endpoint=null_endpoint, storage_endpoint=storage_endpoint, spectra_endpoint=spectra_endpoint, storage=spectra_storage, ascan_endpoint=ascan_endpoint, plot_widget=self.getPlotWidget(ascan_endpoint))
+        self._components = ScanGUIHelperComponents(format_planner=format_planner, null_endpoint=null_endpoint, spectra_endpoint=spectra_endpoint, ascan_endpoint=ascan_endpoint, plot_widget=None if self.headless else self.getPlotWidget(ascan_endpoint))
 
 
     def getPlotWidget(self, ascan_endpoint) -> QWidget:
+        # plot modules (matplotlib etc) are imported here, not at startup
+        from vortex_tools.ui.display import CrossSectionImageWidget
+        from LineScanTraceWidget import LineScanTraceWidget
+        import matplotlib as mpl
+
         self._cross_widget_1 = CrossSectionImageWidget(ascan_endpoint, cmap=mpl.colormaps['gray'], title="one way")
         self._cross_widget_2 = CrossSectionImageWidget(ascan_endpoint, cmap=mpl.colormaps['gray'], title="other way")
         self._linescan_trace_widget = LineScanTraceWidget(ascan_endpoint, title="Galvo tuning")
+        self.registerPlots(self._cross_widget_1, self._cross_widget_2, self._linescan_trace_widget)
 
         # apply settings
         if 'cross1.range' in self.settings:
@@ -160,8 +178,11 @@ class GalvoTuningScanGUIHelper(ScanGUIHelper):
         if 'linescan.ylim' in self.settings:
             self._linescan_trace_widget.set_ylim(self.settings['linescan.ylim'])
 
+        if 'autoscale.percentiles' in self.settings:
+            self._linescan_trace_widget.set_autoscale_percentiles(self.settings['autoscale.percentiles'])
+
         # callbacks
-        ascan_endpoint.aggregate_segment_callback = self.cb_ascan
+        ascan_endpoint.aggregate_segment_callback = self.instrument(self.cb_ascan)
 
         # 
         hbox = QHBoxLayout()
@@ -170,6 +191,13 @@ class GalvoTuningScanGUIHelper(ScanGUIHelper):
         vbox_left.addWidget(self._cross_widget_2)
         vbox_right = QVBoxLayout()
         vbox_right.addWidget(self._linescan_trace_widget)
+        hbox_estimate = QHBoxLayout()
+        pb_estimate = QPushButton("Estimate delay")
+        pb_estimate.clicked.connect(self.estimateDelayClicked)
+        self._estimate_label = QLabel("")
+        hbox_estimate.addWidget(pb_estimate)
+        hbox_estimate.addWidget(self._estimate_label, 1)
+        vbox_right.addLayout(hbox_estimate)
         hbox.addLayout(vbox_left)
         hbox.addLayout(vbox_right)
         w = QWidget()
@@ -0,0 +1,79 @@
+from typing import Iterable, List
+import threading
+import numpy as np
+
+
+class IncrementalMIP():
+    '''
+    Maximum intensity projection (over depth) of an endpoint's volume, shape (B, A), kept up to date one
+    segment batch at a time. update() projects only the B-scans in the batch, on the endpoint's stream for
+    a cupy volume, so the work is spread across the volume instead of being done all at once at the end.
+
+    finish() projects any B-scans that were not updated (e.g. segments that arrived before the last
+    reset()), returns a host copy of the projection and starts the next volume.
+    '''
+    def __init__(self, endpoint):
+        '''
+        :param endpoint: Endpoint with a volume tensor of shape (B, A, samples)
+        '''
+        self._endpoint = endpoint
+        self._lock = threading.Lock()
+        self._is_cuda = False
+        self._mip = None            # (B, A), numpy or cupy
+        self._filled = None         # (B,) bool, B-scans projected since the last finish()
+
+    def update(self, bscan_idxs: Iterable[int]):
+        '''Project the B-scans in bscan_idxs. Call from the endpoint's segment callback.'''
+        if len(bscan_idxs) == 0:
+            return
+        with self._endpoint.tensor as volume:
+            with self._lock:
+                self._allocate(volume)
+                self._project(volume, list(bscan_idxs))
+
+    def finish(self) -> np.ndarray:
+        '''Complete the projection for this volume and return a host copy. Waits for the endpoint's stream.'''
+        with self._endpoint.tensor as volume:
+            with self._lock:
+                self._allocate(volume)
+                missing = np.flatnonzero(~self._filled)
+                if len(missing) > 0:
+                    self._project(volume, missing.tolist())
+                if self._is_cuda:
+                    image = self._mip.get(stream=self._endpoint.stream)
+                else:
+                    image = self._mip.copy()
+                self._filled[:] = False
+        return image
+
+    def reset(self):
+        '''Forget the B-scans projected so far - they are projected again by the next finish().'''
+        with self._lock:
+            if self._filled is not None:
+                self._filled[:] = False
+
+    def _project(self, volume, idxs: List[int]):
+        # a contiguous run of B-scans is sliced, not gathered
+        if idxs == list(range(idxs[0], idxs[-1] + 1)):
+            sel = slice(idxs[0], idxs[-1] + 1)
+        else:
+            sel = idxs
+        if self._is_cuda:
+            with self._endpoint.stream:
+                self._mip[sel] = volume[sel].max(axis=2)
+        else:
+            self._mip[sel] = volume[sel].max(axis=2)
+        self._filled[sel] = True
+
+    def _allocate(self, volume):
+        if self._mip is not None and self._mip.shape == volume.shape[:2]:
+            return
+        # anything that isn't a numpy array is a cupy array - cupy is only imported in that case
+        self._is_cuda = not isinstance(volume, np.ndarray)
+        if self._is_cuda:
+            import cupy
+            with self._endpoint.stream:
+                self._mip = cupy.zeros(volume.shape[:2], dtype=volume.dtype)
+        else:
+            self._mip = np.zeros(volume.shape[:2], dtype=volume.dtype)
+        self._filled = np.zeros(volume.shape[0], dtype=bool)
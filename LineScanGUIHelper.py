@@ -5,21 +5,16 @@ from ScanParams import LineScanParams
 from AcqParams import AcqParams
 from OCTUiParams import OCTUiParams
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout
-from vortex_tools.ui.display import CrossSectionImageWidget
-from TraceWidget import AscanTraceWidget
-import matplotlib as mpl
 import numpy as np
 
 
 from vortex import Range
 from vortex.scan import RasterScanConfig, FreeformScan, FreeformScanConfig
-from vortex.engine import StackDeviceTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, SpectraStackEndpoint, NullEndpoint, EventStrobe, ScanQueue
+from vortex.engine import StackDeviceTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, NullEndpoint, EventStrobe, ScanQueue
 from vortex.format import FormatPlanner, FormatPlannerConfig, StackFormatExecutorConfig, StackFormatExecutor, SimpleSlice
-from vortex.storage import SimpleStackUInt16
 from vortex.marker import Flags, Event
 from vortex import get_console_logger as get_logger
 
-from MultiPlotSelectWidget import MPSW
 
 
 class LineScanGUIHelper(ScanGUIHelper):
@@ -29,9 +24,10 @@ class LineScanGUIHelper(ScanGUIHelper):
     def __init__(self, name: str, number: int, params: LineScanParams, settings: Dict[str, Any], octui):
         super().__init__(name, number, params, settings, octui)
 
-        self._edit_widget = LineScanConfigWidget()
-        self._edit_widget.setLineScanParams(self.params)
-        self._edit_widget.pbTriggerAndSave.clicked.connect(self.triggerAndSave) 
+        if not self.headless:
+            self._edit_widget = LineScanConfigWidget()
+            self._edit_widget.setLineScanParams(self.params)
+            self._edit_widget.pbTriggerAndSave.clicked.connect(self.triggerAndSave) 
 
         # These are saved here (they are also in _components, as part of the plot_widget)
         # for convenience
@@ -60,7 +56,7 @@ class LineScanGUIHelper(ScanGUIHelper):
         # with self.spectra_endpoint.tensor as volume:
         #     print("{0:d}, ({1:d},{2:d},{3:d})".format(v[-1], volume.shape[0], volume.shape[1], volume.shape[2]))
         if v:
-            self._cross_widget.notify_segments(v)
+            self.notifySegments(self._cross_widget, v)
             self._ascan_trace_widget.update_trace(v)
 
     def volume(self, sample_idx, scan_idx, volume_idx):
@@ -74,6 +70,8 @@ class LineScanGUIHelper(ScanGUIHelper):
         pass
 
     def getParams(self):
+        if self.headless:
+            return self.params
         params = self._edit_widget.getLineScanParams()
         return params
 
@@ -84,7 +82,7 @@ class LineScanGUIHelper(ScanGUIHelper):
         settings = {}
         # settings['cross1.range'] = self._cross_widget_1._range
         # settings['cross2.range'] = self._cross_widget_2._range
-        # settings['linescan.ylim'] = list(self._linescan_trace_widget._axes.get_ylim())
+        # settings['linescan.ylim'] = list(self._linescan_trace_widget.get_ylim())
         return settings
     
     def getScan(self, doStrobe=False):
@@ -151,10 +149,9 @@ class LineScanGUIHelper(ScanGUIHelper):
         format_planner.initialize(fc)
 
         # For saving volumes, this NullEndpoint is used. The volume_callback for this 
-        # endpoint will be called before that of the other endpoints. If needed, we open
-        # the storage in the volume_callback for this endpoint when needed. The storage 
-        # is closed in the volume_callback for the SpectraStackEndpoint, which does the 
-        # saving/writing of volumes.
+        # endpoint will be called before that of the other endpoints. If needed, the
+        # VolumeWriter is opened in the volume_callback for this endpoint. Volumes are
+        # handed to the writer from the volume_callback of the spectra endpoint.
         null_endpoint = NullEndpoint(get_logger('Traffic cop(line)', self.log_level))
 
         # For DISPLAYING ascans (oct-processed data), slice away half the data. 
@@ -177,20 +174,19 @@ class LineScanGUIHelper(ScanGUIHelper):
         self._logger.info('Create SpectraStackHostTensorEndpointUInt16 with shape {0:s}'.format(str(shape_spectra)))
         spectra_endpoint = SpectraStackHostTensorEndpointUInt16(sfe_spectra, shape_spectra, get_logger('stack', self.log_level))
 
-        # make an endpoint for saving spectra data
-        shape = (self.params.lines_per_volume, self.params.ascans_per_bscan, samples_per_record, 1)
-        spectra_storage = SimpleStackUInt16(get_logger('npy-spectra', self.log_level))
-        sfec = StackFormatExecutorConfig()
-        sfe = StackFormatExecutor()
-        sfe.initialize(sfec)
-        storage_endpoint = SpectraStackEndpoint(sfe, spectra_storage, log=get_logger('npy-spectra', self.log_level))
 
-        self._components = ScanGUIHelperComponents(format_planner=format_planner, null_endpoint=null_endpoint, storage_endpoint=storage_endpoint, spectra_endpoint=spectra_endpoint, storage=spectra_storage, ascan_endpoint=ascan_endpoint, plot_widget=self.getPlotWidget(ascan_endpoint))
+        self._components = ScanGUIHelperComponents(format_planner=format_planner, null_endpoint=null_endpoint, spectra_endpoint=spectra_endpoint, ascan_endpoint=ascan_endpoint, plot_widget=None if self.headless else self.getPlotWidget(ascan_endpoint))
     
     def getPlotWidget(self, ascan_endpoint) -> QWidget:
+        # plot modules (matplotlib etc) are imported here, not at startup
+        from vortex_tools.ui.display import CrossSectionImageWidget
+        from TraceWidget import AscanTraceWidget
+        import matplotlib as mpl
+
         #self._mpsw = MPSW()
         self._cross_widget = CrossSectionImageWidget(ascan_endpoint, cmap=mpl.colormaps['gray'], title="Cross section")
         self._ascan_trace_widget = AscanTraceWidget(ascan_endpoint, title="Ascan")
+        self.registerPlots(self._cross_widget, self._ascan_trace_widget)
 
         # apply settings
         if 'cross.range' in self.settings:
@@ -199,8 +195,11 @@ class LineScanGUIHelper(ScanGUIHelper):
         if 'ascan.ylim' in self.settings:
             self._ascan_trace_widget.set_ylim(self.settings['ascan.ylim'])
 
+        if 'autoscale.percentiles' in self.settings:
+            self._ascan_trace_widget.set_autoscale_percentiles(self.settings['autoscale.percentiles'])
+
         # callbacks
-        ascan_endpoint.aggregate_segment_callback = self.cb_ascan
+        ascan_endpoint.aggregate_segment_callback = self.instrument(self.cb_ascan)
 
         # 
         hbox = QHBoxLayout()
@@ -1,115 +1,140 @@
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-from qtpy.QtGui import QKeyEvent, QPaintEvent
-from qtpy.QtCore import Qt
+from qtpy.QtGui import QPaintEvent
 
 import numpy as np
-import cupy as cp
-from typing import Iterable, List
-from qtpy.QtGui import QPaintEvent
-from typing import Tuple
+import threading
+from typing import Iterable, List, Optional
+from TracePlot import TracePlot
 
-# Inheriting from FigureCanvasQTAgg. 
-# FigureCanvasQTAgg is a widget. Call update() to invalidate and trigger a paintEvent.
+# Inheriting from TracePlot, a QWidget that draws lines with QPainter.
+# Call update() to invalidate and trigger a paintEvent.
+#
+# Line 0 is the mean (over B-scans) MIP of the even (forward) B-scans, line 1 the odd (reverse)
+# B-scans. update_trace() projects the new B-scans (on the endpoint's stream for a cupy volume),
+# copies the rows to host memory and marks them in a bitmap. At paint time only those rows are
+# read, and running sums/counts for each direction are updated by the difference.
 
-class LineScanTraceWidget(FigureCanvas):
+class LineScanTraceWidget(TracePlot):
 
     def __init__(self, endpoint, parent=None, width=5, height=4, dpi=100, title=None, cuda=True):
+        super().__init__(parent, width, height, dpi, title=title)
+        self.set_ylim((0, 100))
         self._endpoint = endpoint
         self._cuda = cuda
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self._axes = fig.add_subplot(111)
-        self._axes.set_ylim(0, 100)
-        #self._axes.get_yaxis().set_visible(False)
-        if title:
-            self._axes.set_title(title)
-        fig.tight_layout()
-        self._line2d_a = None
-        self._line2d_b = None
         self._ydata_a = None
         self._ydata_b = None
         self._color_a = (1,0,0)
         self._color_b = (0,0,1)
-        self._update_ylim = False
-        self._mip = None
+        self._lock = threading.Lock()
+        self._is_cuda = False
+        self._staged = None             # (B, A) host MIP rows written by update_trace() (pinned for a cupy volume)
+        self._event = None              # cupy event recorded after the last copy to _staged
+        self._pending = None            # (B,) bool, B-scans with new rows in _staged since the last paint
+        self._mip = None                # (B, A) MIP of each B-scan, as read by the last paint
+        self._have = None               # (B,) bool, B-scans in _mip (and in the sums)
+        self._sums = None               # (2, A) sum of _mip rows, forward and reverse
+        self._counts = None             # (2,) number of rows in each sum
         self._invalidated = False
-        self._bscan_index_list = []     # when _invalidated is true, this is list of bscans to fetch
-        self._not_ylim_yet = True
-        super().__init__(fig)
-        self.setFocusPolicy(Qt.FocusPolicy.ClickFocus)
-
-    def set_ylim(self, lim):
-        self._axes.set_ylim(lim[0], lim[1])
 
-    def flush(self):
-        if self._axes is not None:
-            self._is_flushed = True
-            self._axes.clear()
-            self._line2d = None
+    def traces(self):
+        '''(forward, reverse) mean MIP traces, or None if there is no data yet.'''
+        if self._ydata_a is None:
+            return None
+        return (self._ydata_a, self._ydata_b)
 
+    def clear(self):
+        with self._lock:
+            (self._staged, self._event, self._pending) = (None, None, None)
+            (self._mip, self._have, self._sums, self._counts) = (None, None, None, None)
+        self._ydata_a = None
+        self._ydata_b = None
+        self._invalidated = False
+        super().clear()
+
+    def _allocate(self, volume):
+        (nb, na) = volume.shape[:2]
+        # anything that isn't a numpy array is a cupy array - cupy is only imported in that case
+        self._is_cuda = not isinstance(volume, np.ndarray)
+        if self._is_cuda:
+            import cupy
+            mem = cupy.cuda.alloc_pinned_memory(nb * na * np.dtype(np.float32).itemsize)
+            self._staged = np.frombuffer(mem, np.float32, nb * na).reshape((nb, na))
+            self._event = cupy.cuda.Event()
+        else:
+            self._staged = np.zeros((nb, na), dtype=np.float32)
+            self._event = None
+        self._pending = np.zeros(nb, dtype=bool)
+        self._mip = np.zeros((nb, na), dtype=np.float64)
+        self._have = np.zeros(nb, dtype=bool)
+        self._sums = np.zeros((2, na), dtype=np.float64)
+        self._counts = np.zeros(2, dtype=np.int64)
+
+    def get_data(self) -> Optional[bool]:
+        '''Fold the new rows into the traces. None if they are still being copied from the GPU.'''
+        with self._lock:
+            if self._pending is None:
+                return False
+            if self._event is not None and not self._event.done:
+                return None
+            idxs = np.flatnonzero(self._pending)
+            self._pending[idxs] = False
+            rows = self._staged[idxs].astype(np.float64)
+            # buffers are replaced (not modified) by update_trace() if the volume shape changes
+            (mip, have, sums, counts) = (self._mip, self._have, self._sums, self._counts)
+        if len(idxs) == 0:
+            return False
+
+        # replace the old rows in the running sums
+        parity = idxs % 2
+        had = have[idxs]
+        for p in (0, 1):
+            new = parity == p
+            old = new & had
+            sums[p] += rows[new].sum(axis=0) - mip[idxs[old]].sum(axis=0)
+            counts[p] += np.count_nonzero(new & ~had)
+        mip[idxs] = rows
+        have[idxs] = True
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._ydata_a = sums[0] / counts[0]
+            self._ydata_b = sums[1] / counts[1]
+        self.autoscale.update(idxs, np.stack([self._ydata_a, self._ydata_b]))
+        return True
 
-    def get_data(self) -> bool:
-        retval = False
-        if self._invalidated:
-            # make a copy of list
-            temp_list = self._bscan_index_list
-            retval = True
-            with self._endpoint.tensor as volume:
-                if self._mip is None:
-                    self._mip = np.full((volume.shape[0], volume.shape[1]), np.nan)
-                if isinstance(volume, cp.ndarray):
-                    self._mip[temp_list] = cp.max(volume[temp_list], axis=2).get()
-                else:
-                    self._mip[temp_list] = cp.max(volume[temp_list], axis=2)
-
-                # compute averages
-                self._ydata_a = np.nanmean(self._mip[::2], axis=0)
-                self._ydata_b = np.nanmean(self._mip[1::2], axis=0)
-        return retval
-    
     def paintEvent(self, e: QPaintEvent) -> None:
-        if not self._invalidated:
-            return
-
-        if self.get_data():
-
-            if self._update_ylim:
-                maxa = np.max(self._ydata_a)
-                mina = np.min(self._ydata_a)
-                self._axes.set_ylim(mina, maxa)
-                self._update_ylim = False
-
-            if self._line2d_a:
-                self._line2d_a.set_ydata(self._ydata_a)
-            else:
-                l2ds = self._axes.plot(self._ydata_a, 'r')
-                self._line2d_a = l2ds[0]
-            if self._line2d_b:
-                self._line2d_b.set_ydata(self._ydata_b)
-            else:
-                l2ds = self._axes.plot(self._ydata_b, 'b')
-                self._line2d_b = l2ds[0]
-        self._bscan_index_list.clear()
-        self._invalidated = False
+        if self._invalidated:
+            self._invalidated = False
+            updated = self.get_data()
+            if updated is None:
+                # copy still running, look again at the next frame
+                self._invalidated = True
+                self.request_paint()
+            elif updated:
+                self.set_line(0, self._ydata_a, self._color_a)
+                self.set_line(1, self._ydata_b, self._color_b)
 
-        self.draw()
         super().paintEvent(e)
 
 
     def update_trace(self, bscan_idxs: Iterable[int] = []):
-        # Set _invalidated to true, save the bscan indices, and call update(). The update() call will move the actual update
-        # to the gui thread, not the daq thread.
+        # Project the new bscans into the host rows, mark them in the bitmap, set _invalidated to true,
+        # and request a paint. The paint happens on the gui thread, not the daq thread.
 
         if len(bscan_idxs) > 0:
-            self._bscan_index_list = [*self._bscan_index_list, *bscan_idxs]
+            # a single slice covers the whole batch, so the rows copy to host in one piece
+            sel = slice(min(bscan_idxs), max(bscan_idxs) + 1)
+            with self._endpoint.tensor as volume:
+                with self._lock:
+                    if self._staged is None or self._staged.shape != volume.shape[:2]:
+                        self._allocate(volume)
+                    if self._is_cuda:
+                        import cupy
+                        stream = self._endpoint.stream
+                        with stream:
+                            rows = volume[sel].max(axis=2).astype(cupy.float32)
+                            rows.get(stream=stream, out=self._staged[sel], blocking=False)
+                            self._event.record(stream)
+                    else:
+                        self._staged[sel] = volume[sel].max(axis=2)
+                    self._pending[list(bscan_idxs)] = True
             self._invalidated = True
-            self.update()
-
-    def clear(self):
-        self._axes.clear()
-
-    def keyPressEvent(self, e: QKeyEvent) -> None:
-        if e.key() == Qt.Key.Key_Y:
-            if not self._update_ylim:
-                self._update_ylim = True
-
+            self.request_paint()
@@ -5,15 +5,52 @@ from image_display import ImageDisplay
 from PIL import Image
 
 import numpy as np
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from typing import Any, Optional, Tuple, List
+from VolumeArena import VolumeArena, VolumeLease
+from vortex import get_console_logger
 
 
+# Thumbnails for all MyImageWidgets are made on this thread, not the GUI thread.
+_thumbnail_executor = None
+
+def _thumbnail_worker() -> ThreadPoolExecutor:
+    global _thumbnail_executor
+    if _thumbnail_executor is None:
+        _thumbnail_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+    return _thumbnail_executor
+
+
+def make_thumbnails(data: np.ndarray, min_size: int=64, window=(0.5, 99.5)) -> List[QImage]:
+    '''
+    Window-level data to 8 bits (between the window percentiles) and make a mip-map: the full size image, 
+    then images downsampled by 2 (mean of 2x2 blocks), until the larger dimension is no more than min_size.
+    QImages (unlike QPixmaps) can be made off the GUI thread.
+    '''
+    level = np.asarray(data, dtype=np.float32)
+    (lo, hi) = np.percentile(level[::4, ::4], window)
+    scale = 255.0 / (hi - lo) if hi > lo else 1.0
+    images = []
+    while True:
+        gray = np.ascontiguousarray(np.clip((level - lo) * scale, 0, 255).astype(np.uint8))
+        (h, w) = gray.shape
+        # copy() so the QImage owns its pixels
+        images.append(QImage(gray.data, w, h, w, QImage.Format_Grayscale8).copy())
+        if max(h, w) <= min_size or min(h, w) < 2:
+            break
+        level = level[:h - h % 2, :w - w % 2]
+        level = 0.25 * (level[0::2, 0::2] + level[1::2, 0::2] + level[0::2, 1::2] + level[1::2, 1::2])
+    return images
 
 
 class MyImageWidget(QLabel):
 
     __clicked_signal = Signal(int, int, name='clicked')
     __doubleclicked_signal = Signal(int, int, name='doubleclicked')
+    __thumbnails_signal = Signal(int, object, name='thumbnailsReady')
  #  __selected_color = QColor(102, 255, 51)
     __selected_color = QColor(0, 255, 0)
     __selected_width = 8
@@ -31,7 +68,12 @@ class MyImageWidget(QLabel):
         self._selected = False
         self._latest = False
         self._original_pixmap = None
+        self._thumbnails: List[QImage] = []     # mip-map, largest first
+        self._pixmaps = {}                      # level -> QPixmap, made when a level is first shown
+        self._image_serial = 0
+        self._lock = threading.Lock()
         self._first_show = False
+        self.thumbnailsReady.connect(self._thumbnailsReady)
 
     @property
     def userdata(self):
@@ -50,17 +92,31 @@ class MyImageWidget(QLabel):
         self._latest = bool(value)
 
     def set_image(self, data: np.ndarray):
-        #        qrgb_dict = {'r': lambda x: QtGui.qRgb(x, 0, 0),
-        #              'g': lambda x: QtGui.qRgb(0, x, 0),
-        #              'b': lambda x: QtGui.qRgb(0, 0, x)}
-        # colortable = [qrgb_dict[color](i) for i in range(256)]
-        s=data.shape
-        img = QImage(data, s[1], s[0], s[1], QImage.Format_Indexed8)
-        qpix = QPixmap(QImage(img))
-        self._original_pixmap = qpix
+        '''Show data (2-D). Thumbnails are made on a worker thread, so this can be called from any thread.'''
+        with self._lock:
+            self._image_serial += 1
+            serial = self._image_serial
+        _thumbnail_worker().submit(self._makeThumbnails, serial, data)
+
+    def _makeThumbnails(self, serial: int, data: np.ndarray):
+        self.thumbnailsReady.emit(serial, make_thumbnails(data))
+
+    def _thumbnailsReady(self, serial: int, thumbnails: List[QImage]):
+        # GUI thread. Drop results for images that have already been replaced.
+        with self._lock:
+            if serial != self._image_serial:
+                return
+        self._thumbnails = thumbnails
+        self._pixmaps = {}
+        self._original_pixmap = self._pixmap(0)
         self._scaleAndSetPixmap()
         self.update()
 
+    def _pixmap(self, level: int) -> QPixmap:
+        if level not in self._pixmaps:
+            self._pixmaps[level] = QPixmap.fromImage(self._thumbnails[level])
+        return self._pixmaps[level]
+
 
     def mousePressEvent(self, ev):
         if self._original_pixmap is not None:
@@ -98,8 +154,13 @@ class MyImageWidget(QLabel):
         painter.drawRect(x0, y0, W - hpw+1, H - hpw+1)
 
     def _scaleAndSetPixmap(self):
-        if self._original_pixmap:
-            scaled = self._original_pixmap.scaled(self.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        if self._thumbnails:
+            # scale down from the smallest level that is still at least as big as the widget
+            level = 0
+            for (i, image) in enumerate(self._thumbnails):
+                if min(self.width() / image.width(), self.height() / image.height()) <= 1:
+                    level = i
+            scaled = self._pixmap(level).scaled(self.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
             self.setPixmap(scaled)
 
     def showEvent(self, event):
@@ -120,7 +181,9 @@ class MyImageWidget(QLabel):
 @dataclass
 class MPSWData:
     ascan_data: None | np.ndarray = None
-    spectra_data: None | np.ndarray = None
+    spectra_data: None | np.ndarray = None      # None if this cell only kept the image
+    lease: Any = None       # VolumeLease that owns spectra_data, released when the data is replaced
+    serial: int = 0         # order added, for finding the oldest cell
 
 
 class MPSW(QWidget):
@@ -129,15 +192,33 @@ class MPSW(QWidget):
     User can select an image with a mouse click - the image is outlined, and will not be replaced while it is outlined. A double-click on an image
     causes the save(row,col) signal to be emitted. Calling get_data(row,col) will get the data passed when the image was added. The first
     object returned is the image that was displayed. The second is the data passed along with the image - presumaby the data you want to save.
+
+    The data for each cell goes in a buffer from borrow(), from a fixed pool of buffers. The buffer of the cell being replaced is reused
+    in place. If the pool is used up (by max_bytes), the oldest cells that are not selected give up their buffers and keep only the image.
+    With spill_dir, cells beyond max_bytes use memory-mapped files in that folder before any cell gives up its buffer.
     '''
 
     __save_signal = Signal(int, int, name='save')
 
-    def __init__(self, parent=None, columns=2, rows=2):
+    def __init__(self, parent=None, columns=2, rows=2, max_bytes: int=0, spill_dir: str=None):
+        '''
+        :param max_bytes: Memory for cell data buffers, 0 for one buffer per cell. These are pageable - page-locked memory is
+            left to the engine arena, whose buffers cells share (through add_data's lease) while volumes are saved.
+        :param spill_dir: Folder for memory-mapped buffers beyond max_bytes, None to not use the disk
+        '''
         super().__init__(parent)
         self._rows = rows
         self._columns = columns
         self._last_position = (0, 0)   # this will keep track of the last position that was updated
+        self._max_bytes = max_bytes
+        if spill_dir is not None and not (os.path.isdir(spill_dir) and os.access(spill_dir, os.W_OK)):
+            get_console_logger('MPSW').warn("Spill folder {0:s} is not a writable folder, cells beyond max_bytes keep only their image".format(str(spill_dir)))
+            spill_dir = None
+        self._spill_dir = spill_dir
+        self._pools: Tuple[VolumeArena, ...] = ()
+        self._pool_key = None
+        self._serial = 0
+        self._lock = threading.Lock()
 
         layout = QGridLayout()
 
@@ -165,6 +246,62 @@ class MPSW(QWidget):
         else:
             raise RuntimeError("Indices out of range for this widget.")
 
+    def acquire_data(self, r, c) -> MPSWData:
+        '''Like get_data(), but the cell's buffer (if any) is held until data.lease.release(), so it cannot be reused meanwhile.'''
+        with self._lock:
+            data = self.get_data(r, c)
+            if data is not None and data.lease is not None:
+                data.lease.acquire()
+            return data
+
+    def borrow(self, shape, dtype) -> Optional[VolumeLease]:
+        '''
+        Buffer for the spectra passed to the next add_data(), or None if every buffer is held by a selected 
+        (or saving) cell - then pass spectra_data=None.
+        '''
+        with self._lock:
+            self._createPools(shape, dtype)
+            (r, c) = self._next_position(advance=False)
+            self._dropBuffer(r, c)
+            lease = self._borrow(shape, dtype)
+            if lease is None:
+                # pool is used up - oldest unselected cells keep only their image
+                cells = [(self._data[j][i].serial, j, i) for j in range(self._rows) for i in range(self._columns)
+                         if self._data[j][i] is not None and self._data[j][i].lease is not None and not self._widgets[j][i]._selected]
+                for (_, j, i) in sorted(cells):
+                    self._dropBuffer(j, i)
+                    lease = self._borrow(shape, dtype)
+                    if lease is not None:
+                        break
+            return lease
+
+    def _createPools(self, shape, dtype):
+        key = (tuple(shape), np.dtype(dtype).str)
+        if key == self._pool_key:
+            return
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        cells = self._rows * self._columns
+        in_memory = cells if self._max_bytes <= 0 else max(1, min(cells, self._max_bytes // nbytes))
+        pools = [VolumeArena(pinned=False, max_buffers=in_memory)]
+        if self._spill_dir is not None and in_memory < cells:
+            pools.append(VolumeArena(max_buffers=cells - in_memory, spill_dir=self._spill_dir))
+        # buffers still held by cells go back to the old pools, which are then dropped
+        self._pools = tuple(pools)
+        self._pool_key = key
+
+    def _borrow(self, shape, dtype) -> Optional[VolumeLease]:
+        for pool in self._pools:
+            lease = pool.borrow(shape, dtype)
+            if lease is not None:
+                return lease
+        return None
+
+    def _dropBuffer(self, r, c):
+        data = self._data[r][c]
+        if data is not None and data.lease is not None:
+            data.lease.release()
+            self._data[r][c] = MPSWData(data.ascan_data, None, None, data.serial)
+
 
     def _update_selected(self, r, c):
         for i in range(self._columns):
@@ -189,16 +326,23 @@ class MPSW(QWidget):
         c = i % self._columns
         return (r, c)
 
-    def _next_position(self):
+    def _next_position(self, advance=True):
+        count = self._count
         while True:
-            self._count+=1
-            (r,c) = self._ind2sub(self._count)
+            count+=1
+            (r,c) = self._ind2sub(count)
             if self._data[r][c] is None or not self._widgets[r][c]._selected:
+                if advance:
+                    self._count = count
                 return (r,c)
 
-    def add_data(self, ascan_data, spectra_data):
-        (r, c) = self._next_position()
-        self._data[r][c] = MPSWData(ascan_data, spectra_data)
+    def add_data(self, ascan_data, spectra_data, lease=None):
+        with self._lock:
+            (r, c) = self._next_position()
+            if self._data[r][c] is not None and self._data[r][c].lease is not None:
+                self._data[r][c].lease.release()
+            self._serial += 1
+            self._data[r][c] = MPSWData(ascan_data, spectra_data, lease, self._serial)
         self._widgets[r][c].set_image(ascan_data)
         self._widgets[self._last_position[0]][self._last_position[1]].latest = False
         self._widgets[r][c].latest = True
@@ -1,61 +1,108 @@
+from time import perf_counter
+_t_import = perf_counter()
 import sys
 import os
 from VtxEngineParams import AcquisitionType
 from VtxEngineParamsDialog import VtxEngineParamsDialog
 from VtxEngine import VtxEngine
 from OCTUiMainWindow import OCTUiMainWindow
-from OCTUiParams import OCTUiParams
-from PyQt5.QtWidgets import QApplication, QMessageBox, QLabel
+from OCTUiParams import OCTUiParams, to_json
+from PyQt5.QtWidgets import QApplication, QMessageBox, QLabel, QWidget, QDockWidget, QToolButton
 from PyQt5.QtCore import QTimer,QDateTime, pyqtSignal, Qt, QObject
 from vortex.engine import Engine, EngineConfig, EngineStatus
 from vortex import get_console_logger, __version__ as vortex_version
-from vortex.storage import SimpleStackConfig, SimpleStackHeader
 from vortex.log import Logger
 from ScanGUIHelper import ScanGUIHelper
 from scanGUIHelperFactory import scanGUIHelperFactory
 from LaserSource import LaserSource
+from DispersionUpdater import DispersionUpdater
+from VolumeWriter import VolumeWriter, VolumeWriterStats, StorageFormat
+from DisplayScheduler import DisplayScheduler
+from EngineHealth import EngineHealth, EngineHealthPanel
+from CallbackTimers import callback_timers
 from typing import Tuple
+from dataclasses import replace
 import traceback
-import matplotlib as mpl
 from datetime import datetime
 from json import dumps
-from git import Repo
+import threading
 from pathlib import Path
 import logging
 
+# version file written at install time (python OCTUi.py --write-version), so git isn't needed at startup
+version_file = Path(__file__).parent.resolve() / 'version.txt'
+
+def getVersion() -> str:
+    if version_file.exists():
+        return version_file.read_text().strip()
+    from git import Repo
+    repo = Repo(Path(__file__).parent.resolve())
+    return repo.git.describe(tags=True, always=True, dirty=True, long=True)
+
+class StartupTimer():
+    '''Collects the time spent in each phase of startup.'''
+    def __init__(self, t0: float):
+        self._t0 = t0
+        self._last = t0
+        self._phases = []
+
+    def mark(self, phase: str):
+        t = perf_counter()
+        self._phases.append((phase, t - self._last))
+        self._last = t
+
+    def report(self, logger):
+        for (phase, dt) in self._phases:
+            logger.info("startup: {0:<24s} {1:8.1f}ms".format(phase, dt*1000))
+        logger.info("startup: {0:<24s} {1:8.1f}ms".format('total', (self._last - self._t0)*1000))
+
+# volumes waiting to be written before new ones are dropped, if not in the 'save' settings
+DEFAULT_MAX_QUEUED_VOLUMES = 4
+DEFAULT_SAVE_CODEC = 'lz4'
+DEFAULT_SAVE_WORKERS = 4
+DEFAULT_MAX_FPS = 30
+# engine health sampling, if not in the 'health' settings
+DEFAULT_HEALTH_RATE = 2.0
+DEFAULT_HEALTH_HISTORY = 300.0
+DEFAULT_WARN_UTILIZATION = 0.8
+
 class OCTUi(QObject):
     
     stopengine = pyqtSignal()
+    savingfinished = pyqtSignal(object)
 
-    def __init__(self):
+    def __init__(self, startup_timer: StartupTimer=None):
         super().__init__() # Call the inherited class' __init__ method
 
         #self._testlogger = get_console_logger("OCTUI-Main")
         self._logger = get_console_logger('OCTUi')
+        self._startup_timer = startup_timer
         self._vtxengine = None
         self._cross_widget = None
         self._trace_widget = None
-        self._savingVolumesNow = False
-        self._savingVolumesStopNow = False
         self._savingVolumesThisMany = 0
-        self._savingVolumesThisManySaved = 0
         self._savingVolumesRequested = False
         self._timer=QTimer()
         self._timer.timeout.connect(self.showTime)
         self._guihelpers = []
-
-        # check git tags and dump to screen
-        repo_directory = Path(__file__).parent.resolve()
-        repo = Repo(repo_directory)
-        self._logger.info("OCTUi {0:s} starting...".format(repo.git.describe(tags=True, always=True, dirty=True, long=True)))
+        self._startTime = 0
+        self._startKind = ''
+        self._waitingForFirstSegment = False
+        self.stopengine.connect(self._engineErrorCallback, Qt.QueuedConnection)
+        self.savingfinished.connect(self._savingFinished, Qt.QueuedConnection)
+        self._dispersionUpdater = DispersionUpdater(self._applyDispersion, parent=self)
+
+        # check git tags and dump to screen. git describe is slow, so don't wait for it.
+        threading.Thread(target=self._logVersion, daemon=True).start()
         self._logger.info("Using vortex {0:s}".format(vortex_version))
 
-
         # load config file - default file only!
         # TODO - make it configurable, or be able to load a diff't config.
         self._params = OCTUiParams()
+        self._markStartup('load config')
 
         self._octDialog = OCTUiMainWindow()
+        self._markStartup('main window')
 
         # add a permanent status widget to the status bar
         self._labelEngineStatus = QLabel("Not started...")
@@ -65,6 +112,28 @@ class OCTUi(QObject):
         self._octDialog.stackedWidgetDummy.removeWidget(self._octDialog.stackedWidgetDummyPage1)
 
 
+        # All plots are repainted by the display scheduler, at no more than max_fps.
+        display_settings = self._params.settings.get('display', {})
+        self.display = DisplayScheduler(max_fps=display_settings.get('max_fps', DEFAULT_MAX_FPS), overlay=display_settings.get('overlay', False), parent=self)
+        self.display.start()
+
+        # Callbacks on engine threads are timed if enabled, when they are wired to endpoints (so before any are).
+        callback_timers.enabled = self._params.settings.get('callbacks', {}).get('instrument', False)
+
+        # Engine health is sampled while the engine runs, and shown in a dock toggled from the status bar.
+        health_settings = self._params.settings.get('health', {})
+        self.health = EngineHealth(lambda: self._vtxengine._engine.status(), display=self.display, save_queued=self._saveQueued, 
+                                   rate=health_settings.get('rate', DEFAULT_HEALTH_RATE), history=health_settings.get('history', DEFAULT_HEALTH_HISTORY), 
+                                   warn_utilization=health_settings.get('warn_utilization', DEFAULT_WARN_UTILIZATION), parent=self)
+        self._healthDock = QDockWidget("Engine health", self._octDialog)
+        self._healthDock.setWidget(EngineHealthPanel(self.health))
+        self._octDialog.addDockWidget(Qt.RightDockWidgetArea, self._healthDock)
+        self._healthDock.hide()
+        tbHealth = QToolButton()
+        tbHealth.setDefaultAction(self._healthDock.toggleViewAction())
+        self._octDialog.statusBar().addPermanentWidget(tbHealth)
+        self.health.warning.connect(lambda message: self._octDialog.statusBar().showMessage("Warning: " + message, 5000))
+
         # Create and initialize GUI Helpers
         for number,(name,cfg) in enumerate(self._params.scn.scans.items()):
             flag = 1<<number
@@ -80,6 +149,7 @@ class OCTUi(QObject):
             self._octDialog.widgetScanConfig.addScanType(name, self._guihelpers[-1].edit_widget)
 
         self._octDialog.widgetScanConfig.setCurrentIndex(self._params.scn.current_index)
+        self._markStartup('scan helpers')
 
         # must initialize dispersion widget. Scan config widgets are initialized on creation 
         self._octDialog.widgetDispersion.setDispersion(self._params.vtx.dispersion)
@@ -90,6 +160,13 @@ class OCTUi(QObject):
         self._octDialog.gbSaveVolumes.saveNVolumes.connect(self.saveNVolumes)
         self._octDialog.gbSaveVolumes.saveContVolumes.connect(self.saveContVolumes)
         self._octDialog.gbSaveVolumes.enableSaving(False)
+        if 'format' in self._params.settings.get('save', {}):
+            name = self._params.settings['save']['format']
+            if name in StorageFormat.__members__:
+                self._octDialog.gbSaveVolumes.storageFormat = StorageFormat[name]
+            else:
+                self._logger.warn("Unknown save format \"{0:s}\" in settings, using NPY.".format(str(name)))
+                self._octDialog.gbSaveVolumes.storageFormat = StorageFormat.NPY
         self._octDialog.dialogClosing.connect(self.dialogClosing)
         self._octDialog.pbEtc.clicked.connect(self.etcClicked)
         self._octDialog.pbStart.clicked.connect(self.startClicked)
@@ -98,26 +175,91 @@ class OCTUi(QObject):
         self._octDialog.pbStop.enabled = False  
         self._octDialog.resize(1600,1200)              
         self._octDialog.show()
+        self._markStartup('show')
+
+        # first pass through the event loop is when the window actually appears
+        if self._startup_timer is not None:
+            QTimer.singleShot(0, self._windowShown)
+
+    def _markStartup(self, phase: str):
+        if self._startup_timer is not None:
+            self._startup_timer.mark(phase)
+
+    def _windowShown(self):
+        self._markStartup('first event loop')
+        self._startup_timer.report(self._logger)
+
+    def _logVersion(self):
+        try:
+            self._logger.info("OCTUi {0:s} starting...".format(getVersion()))
+        except Exception as e:
+            self._logger.warn("Cannot get OCTUi version: {0:s}".format(str(e)))
 
     def scanTypeChanged(self, index: int):
+        # volumes only come from the current scan, so a file being saved would never be finished
+        self._closeVolumeWriters()
         self._params.scn.current_index = index
+        helper = self._guihelpers[index]
+
+        # In lazy mode, the components for this scan might not exist yet. If the engine
+        # is stopped, they are built at the next Start. 
+        if self._vtxengine and not self._vtxengine._engine.done and not self._vtxengine.is_attached(helper):
+            self._attachCurrentScan()
+
         # only do this if the engine exists. 
         # This isn't a clean way to test, as the existence of the engine might
         # not be the best test here. 
         if self._vtxengine:        
             self._octDialog.stackedWidgetDummy.setCurrentIndex(index)
-        helper = self._guihelpers[index]
         self.connectCurrentScan(helper)
 
+    def _attachCurrentScan(self):
+        """Build components for the current scan and attach them to the running engine. The 
+        engine is stopped while it is rebuilt, then restarted. 
+        """
+        self._vtxengine.stop()
+        try:
+            self._vtxengine.attach_current(self._params, self._guihelpers)
+            self._vtxengine._engine.event_callback = self.engineEventCallback
+            self._replacePlotWidgets()
+            self._vtxengine._engine.scan_queue.clear()
+            self.connectCurrentScan(self._guihelpers[self._params.scn.current_index])
+            self._vtxengine._engine.start()
+        except RuntimeError as e:
+            print("RuntimeError:")
+            traceback.print_exception(e)
+            self._stopGUI(False)
+
+    def _replacePlotWidgets(self):
+        # Clear out widgets previously located in the stacked widget, then add
+        # plots. Scans without components (lazy mode) get an empty placeholder, so 
+        # that the stacked widget index matches the scan index.
+        for i in range(self._octDialog.stackedWidgetDummy.count()):
+            self._octDialog.stackedWidgetDummy.removeWidget(self._octDialog.stackedWidgetDummy.widget(0))
+            
+        for helper in self._guihelpers:
+            if helper.has_components():
+                self._octDialog.stackedWidgetDummy.addWidget(helper.components.plot_widget)
+            else:
+                self._octDialog.stackedWidgetDummy.addWidget(QWidget())
+
+        # make plots visible
+        self._octDialog.stackedWidgetDummy.setCurrentIndex(self._params.scn.current_index)
+
     def dispersionChanged(self, dispersion: Tuple[float, float]):
         if self._vtxengine is not None:
             # set updated value in parameters
             # must do this here so the change will trigger "want to save?"
             self._params.dispersion = self._octDialog.widgetDispersion.getDispersion()
 
-            # separately tell engine to update
-            self._vtxengine.update_dispersion(dispersion)   
-            self._logger.info("Updated dispersion to ({:e},{:e})".format(*dispersion))
+            # separately tell engine to update. Spin box changes come in bursts, 
+            # the updater applies only the latest value.
+            self._dispersionUpdater.request(dispersion)
+
+    def _applyDispersion(self, dispersion: Tuple[float, float]) -> float:
+        if self._vtxengine is not None:
+            return self._vtxengine.update_dispersion(dispersion)
+        return 0.0
 
     def dialogClosing(self):
         self.stopClicked()
@@ -143,6 +285,11 @@ class OCTUi(QObject):
         if v == 1:
             self._params.vtx = self._cfgDialog.getEngineParameters()
 
+    def setGalvoDelay(self, galvo_delay: float):
+        '''Change galvo delay. Changing it requires a new engine, so it is used the next time the engine is started.'''
+        self._logger.info("galvo delay changed from {0:f} to {1:f}".format(self._params.vtx.galvo_delay, galvo_delay))
+        self._params.vtx = replace(self._params.vtx, galvo_delay=galvo_delay)
+
     def _getAllParams(self):
         # fetch current configuration for acq and scan params. The items 
         # in the engineConfig are updated when that dlg is accepted, so no 
@@ -155,33 +302,46 @@ class OCTUi(QObject):
     def _getPlotSettings(self):
 
         # get settings if components have been created. 
-        # If one of the helpers has no components, then they all probably do not. 
-        if all(helper.has_components() for helper in self._guihelpers):
-            settings = {}
-            for helper in self._guihelpers:
+        # Helpers without components (never started, or not selected in lazy mode) 
+        # keep the settings they were loaded with.
+        settings = dict(self._params.settings)
+        settings['save'] = dict(settings.get('save', {}), format=self._octDialog.gbSaveVolumes.storageFormat.name)
+        for helper in self._guihelpers:
+            if helper.has_components():
                 settings[helper.name] = helper.getSettings()
-            self._params.settings = settings
+        self._params.settings = settings
 
     def startClicked(self):
 
+        # apply a dispersion change still waiting in the updater before the engine is (re)built
+        self._dispersionUpdater.flush()
+
         # check if profiling was requested
         if self._params.vtx.save_profiler_data:
             os.environ['VORTEX_PROFILER_LOG'] = 'profiler.log'
         elif os.environ.get('VORTEX_PROFILER_LOG') is not None:
             os.environ['VORTEX_PROFILER_LOG'] = ''
 
+        # matplotlib settings, deferred until plots are needed
+        setup_plotting()
+
         # now build engine
         try:
             # update params with ui 
             self._getAllParams()
 
-            # get oct engine ready
+            # get oct engine ready. If the engine parameters have not changed since 
+            # the last start, keep the engine (warm restart). Otherwise rebuild it all.
+            bWarm = False
             if self._vtxengine:
                 if not self._vtxengine._engine.done:
                     self._logger.warn('engine is not stopped')
                     return
-                del self._vtxengine
-            self._vtxengine = None
+                if self._vtxengine.is_compatible(self._params):
+                    bWarm = True
+                else:
+                    del self._vtxengine
+                    self._vtxengine = None
 
             # check if laser source is present and on. If not, throw an error.
             if self._params.vtx.acquisition_type == AcquisitionType.ALAZAR_ACQUISITION:
@@ -192,22 +352,22 @@ class OCTUi(QObject):
                     self._logger.info(laser.info())
     
             # create engine
-            self._logger.info('Setting up OCT engine...')
-            self._vtxengine = VtxEngine(self._params, self._guihelpers)
+            self._startTime = perf_counter()
+            if bWarm:
+                self._logger.info('Restarting OCT engine...')
+                if self._vtxengine.restart(self._params, self._guihelpers):
+                    self._startKind = 'warm'
+                else:
+                    self._startKind = 'warm(partial)'
+            else:
+                self._logger.info('Setting up OCT engine...')
+                self._vtxengine = VtxEngine(self._params, self._guihelpers)
+                self._startKind = 'cold'
             self._vtxengine._engine.event_callback = self.engineEventCallback
-            self.stopengine.connect(self._engineErrorCallback, Qt.QueuedConnection)
-
-            # Clear out widgets previously located in the stacked widget, then add
-            # newly-created plots. 
-            for i in range(self._octDialog.stackedWidgetDummy.count()):
-                self._octDialog.stackedWidgetDummy.removeWidget(self._octDialog.stackedWidgetDummy.widget(0))
-                
-            for helper in self._guihelpers:
-                self._octDialog.stackedWidgetDummy.addWidget(helper.components.plot_widget)
-
-            # make plots visible
-            self._octDialog.stackedWidgetDummy.setCurrentIndex(self._params.scn.current_index)
+            self._logger.info('{0:s} engine setup took {1:.3f}s'.format(self._startKind, perf_counter() - self._startTime))
+            self._waitingForFirstSegment = True
 
+            self._replacePlotWidgets()
 
             self._vtxengine._engine.scan_queue.clear()
             self.connectCurrentScan(self._guihelpers[self._params.scn.current_index])
@@ -218,6 +378,7 @@ class OCTUi(QObject):
 
             # status timer
             self._timer.start(1000)
+            self.health.start()
 
             # engine has started without error, so fix up buttons
             self._octDialog.pbEtc.setEnabled(False)
@@ -233,8 +394,9 @@ class OCTUi(QObject):
 
         if helper.has_components():
 
-            helper.components.null_endpoint.volume_callback = self.volumeCallback
-            helper.components.storage_endpoint.volume_callback = self.volumeCallback2
+            helper.components.null_endpoint.volume_callback = callback_timers.instrument('OCTUi.volumeCallback', segments=False)(self.volumeCallback)
+            helper.components.null_endpoint.aggregate_segment_callback = callback_timers.instrument('OCTUi.firstSegmentCallback')(self.firstSegmentCallback)
+            callback_timers.segment_time = helper.params.ascans_per_bscan / self._params.vtx.ssrc_triggers_per_second
 
             # the engine might not yet be created, if this is initialization
             if self._vtxengine:
@@ -255,7 +417,14 @@ class OCTUi(QObject):
         self._octDialog.statusBar().showMessage(formatted_time)
         status = self._vtxengine._engine.status()
         if status.active:
-            self._labelEngineStatus.setText("Active: blk_util {0:f} disp_blks {2:d}".format(status.block_utilization, status.dispatched_blocks, status.inflight_blocks))
+            text = "Active: blk_util {0:f} disp_blks {1:d} inflight {2:d}".format(status.block_utilization, status.dispatched_blocks, status.inflight_blocks)
+            writer = self._guihelpers[self._params.scn.current_index].volume_writer
+            if writer is not None:
+                ws = writer.stats
+                text += " | saving: {0:d} written, {1:d} queued, {2:d} dropped, {3:.1f} MB/s, {4:.2f}x".format(ws.written, ws.queued, ws.dropped, ws.mb_per_second, ws.compression_ratio)
+            (frames, skipped) = self.display.stats()
+            text += " | display: {0:d} fps, {1:d} skipped".format(frames, skipped)
+            self._labelEngineStatus.setText(text)
         else:
             self._labelEngineStatus.setText("Not running.")
 
@@ -276,6 +445,8 @@ class OCTUi(QObject):
 
     def _stopGUI(self, bStopEngineToo):
         self._timer.stop()
+        self.health.stop()
+        self._closeVolumeWriters()
         if self._vtxengine is not None:
             self._octDialog.pbEtc.setEnabled(True)
             self._octDialog.pbStart.setEnabled(True)
@@ -287,6 +458,8 @@ class OCTUi(QObject):
         self._stopGUI(False)
 
     def stopClicked(self):
+        # the last spin box step should not be lost when the engine stops
+        self._dispersionUpdater.flush()
         self._stopGUI(True)
 
     def scanCallback(self, arg0, arg1):
@@ -295,13 +468,23 @@ class OCTUi(QObject):
     def segmentCallback(self, arg0, arg1, arg2, arg3):
         self._logger.info("segmentCallback({0:d}, {1:d}, {2:d}, {3:d})".format(arg0, arg1, arg2, arg3))
 
+    def firstSegmentCallback(self, v):
+        """Segment callback for the NullEndpoint of the current scan. Reports the time from 
+        Start to the first segment delivered, for cold and warm starts.
+        """
+        if self._waitingForFirstSegment and v:
+            self._waitingForFirstSegment = False
+            self._logger.info("Start-to-first-segment latency ({0:s} start): {1:.3f}s".format(self._startKind, perf_counter() - self._startTime))
+
     def aggregateSegmentCallback(self, v):
         self._logger.info("aggregateSegmentCallback({0:s})".format(str(v)))
 
     def volumeCallback(self, arg0, arg1, arg2):
         """volume callback that is (should be) called prior to other volume callbacks. 
-        Because of that arrangement, this callback will open storage. Same storage is closed 
-        in volumeCallback2
+        Because of that arrangement, this callback will open the VolumeWriter. The helper 
+        hands volumes to the writer from its spectra endpoint's volume callback, and the 
+        writer closes the file itself after the requested number of volumes (or when 
+        closed by saveContVolumes).
 
         Args:
             sample_idx (int): sample index
@@ -314,62 +497,66 @@ class OCTUi(QObject):
         # For an aiming scan, each "cross" consists of 2 b-scans
 
         helper = self._guihelpers[self._params.scn.current_index]
+        self.health.count_volume()
 
         # call helper's volume method
         helper.volume(arg0, arg1, arg2)
         
-        shape = helper.components.spectra_endpoint.tensor.shape
-        #self._logger.info("volumeCallback({0:d}, {1:d}, {2:d}),helper={3:s},shape=({4:d},{5:d},{6:d})".format(arg0, arg1, arg2, helper.name,shape[0], shape[1], shape[2]))
         if self._savingVolumesRequested:
+            self._savingVolumesRequested = False
             (bOK, baseFilename) = self.checkFileSaveStuff()
             if bOK:
-                # Create SimpleStackConfig to config storage
-                npsc = SimpleStackConfig()
-
                 # shape is a mystery. Let's just copy what the endpoint is. 
                 # TODO Must figure out why this volume doesn't match acq params (see esp. non-raster scan)
-                #npsc.shape = (self._params.scn.bscans_per_volume, self._params.scn.ascans_per_bscan, self._params.acq.samples_per_ascan, 1)
+                tensor = helper.components.spectra_endpoint.tensor
+                shape = tensor.shape
                 self._logger.info("volumeCallback:({0:d}, {1:d}, {2:d}),helper={3:s},shape=({4:d},{5:d},{6:d})".format(arg0, arg1, arg2, helper.name,shape[0], shape[1], shape[2]))
-                npsc.shape = (shape[0], shape[1], shape[2], 1)
-                npsc.header = SimpleStackHeader.NumPy
-                npsc.path = baseFilename + ".npy"
-                self._logger.info('Open storage.')
-                helper.components.storage.open(npsc)
-                self._savingVolumesNow = True
-                self._savingVolumesRequested = False
+                save_settings = self._params.settings.get('save', {})
+                storage_format = self._octDialog.gbSaveVolumes.storageFormat
+                attrs = {'vtx': to_json(self._params.vtx), 'scan_name': helper.name, 'scan': to_json(helper.params), 
+                         'vortex_version': vortex_version, 'created': datetime.now().isoformat()}
+                try:
+                    helper.volume_writer = VolumeWriter(baseFilename + storage_format.extension, (shape[0], shape[1], shape[2], 1), tensor.dtype, 
+                                                        arena=self._vtxengine.arena, count=self._savingVolumesThisMany, 
+                                                        max_queued=save_settings.get('max_queued_volumes', DEFAULT_MAX_QUEUED_VOLUMES), 
+                                                        finished=self.savingfinished.emit, format=storage_format, attrs=attrs, 
+                                                        codec=save_settings.get('codec', DEFAULT_SAVE_CODEC), 
+                                                        workers=save_settings.get('workers', DEFAULT_SAVE_WORKERS))
+                except Exception as e:
+                    # any failure here is on the engine's callback thread - report it and re-enable saving
+                    self._logger.warn("Cannot open file {0:s} for saving: {1:s}".format(baseFilename, str(e)))
+                    self._octDialog.gbSaveVolumes.enableSaving(True)
+                    return
                 #self._savingVolumesThisMany = SHOULD HAVE BEEN SET IN PB CALLBACK WHEN SAVING VOLUMES REQUESTED
-                self._savingVolumesThisManySaved = 0
                 self._octDialog.gbSaveVolumes.enableSaving(False, self._savingVolumesThisMany==0)
             else:
                 self._logger.warn("Cannot open file {0:s} for saving.".format(baseFilename))
-                self._savingVolumesRequested = False
 
-    def volumeCallback2(self, arg0, arg1, arg2):
-        """This callback will close a file if opened.
+    def _savingFinished(self, stats: VolumeWriterStats):
+        """Slot for the VolumeWriter's finished callback, which is called on the writer thread.
 
         Args:
-            arg0 (_type_): _description_
-            arg1 (_type_): _description_
-            arg2 (_type_): _description_
+            stats (VolumeWriterStats): final statistics for the file
         """
-        if self._savingVolumesNow:
-
-            # this is called after the current volume has been written
-            self._savingVolumesThisManySaved = self._savingVolumesThisManySaved + 1
-
-            if self._savingVolumesStopNow or (self._savingVolumesThisMany > 0 and self._savingVolumesThisManySaved == self._savingVolumesThisMany):
+        self._logger.info("Saved {0:d} volumes ({1:d} dropped).".format(stats.written, stats.dropped))
+        for helper in self._guihelpers:
+            if helper.volume_writer is not None and helper.volume_writer.closing:
+                helper.volume_writer = None
+        self._savingVolumesThisMany = 0
+        self._octDialog.gbSaveVolumes.enableSaving(self._vtxengine is not None and self._vtxengine._engine.status().active)
 
-                self._logger.info("Saved {0:d} volumes.".format(self._savingVolumesThisManySaved))
-                # close file
-                self._savingVolumesNow = False
-                self._savingVolumesStopNow = False
-                self._savingVolumesThisManySaved = 0
-                self._savingVolumesThisMany = 0
-                self._savingVolumesRequested = False
-                helper = self._guihelpers[self._params.scn.current_index]
-                helper.components.storage.close()
-                self._octDialog.gbSaveVolumes.enableSaving(True)
+    def _saveQueued(self) -> int:
+        writer = self._guihelpers[self._params.scn.current_index].volume_writer
+        return writer.stats.queued if writer is not None else 0
 
+    def _closeVolumeWriters(self):
+        """Stop saving. Volumes already queued are still written, and _savingFinished 
+        is called when each file is closed.
+        """
+        self._savingVolumesRequested = False
+        for helper in self._guihelpers:
+            if helper.volume_writer is not None:
+                helper.volume_writer.close()
 
     def checkFileSaveStuff(self) -> Tuple[bool, str]:
         """This function will verify that the file save root folder is accessible. If so, 
@@ -396,12 +583,13 @@ class OCTUi(QObject):
         should stop saving.
         """
 
-        if not self._savingVolumesNow:
+        writer = self._guihelpers[self._params.scn.current_index].volume_writer
+        if writer is None:
             self._savingVolumesRequested = True
             self._savingVolumesThisMany = 0
             self._octDialog.gbSaveVolumes.enableSaving(False, True)
         else:
-            self._savingVolumesStopNow = True
+            writer.close()
 
 
 def setup_logging():
@@ -426,13 +614,29 @@ def setup_logging():
 
 
 def setup_plotting():
+    import matplotlib as mpl
     mpl.rcParams['axes.facecolor'] = 'k'
     mpl.rcParams['lines.linewidth'] = 1
 
 
 if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='OCTUi')
+    parser.add_argument('--startup-profile', action='store_true', help='print time spent in each phase of startup')
+    parser.add_argument('--write-version', action='store_true', help='save git version to {0:s} and exit'.format(version_file.name))
+    args, qtargs = parser.parse_known_args()
+
+    if args.write_version:
+        version_file.unlink(missing_ok=True)
+        version_file.write_text(getVersion())
+        sys.exit()
+
+    timer = StartupTimer(_t_import) if args.startup_profile else None
+    if timer:
+        timer.mark('imports')
     setup_logging()
-    setup_plotting()
-    app = QApplication(sys.argv)
-    octui = OCTUi()
+    app = QApplication(sys.argv[:1] + qtargs)
+    if timer:
+        timer.mark('QApplication')
+    octui = OCTUi(timer)
     app.exec_()
@@ -4,7 +4,7 @@ from platformdirs import site_config_dir
 from pathlib import Path, PurePath
 import json
 import logging
-from dataclasses import asdict, dataclass, field
+from dataclasses import asdict, dataclass, field, is_dataclass
 import copyreg
 from vortex import Range, get_console_logger
 from vortex.acquire import alazar
@@ -61,6 +61,11 @@ class _octui_encoder(json.JSONEncoder):
         return super().default(o)
 
 
+def to_json(o) -> str:
+    '''JSON for params (or any dataclass of params), encoded as they are in the config file.'''
+    return json.dumps(asdict(o) if is_dataclass(o) else o, cls=_octui_encoder)
+
+
 class _octui_decoder(json.JSONDecoder):
     def __init__(self):
         json.JSONDecoder.__init__(self, object_hook=_octui_decoder.from_dict)
@@ -0,0 +1,278 @@
+from typing import Dict, List, Tuple, Iterator, Optional
+from dataclasses import dataclass, asdict
+from pathlib import Path
+import json
+import numpy as np
+import logging
+
+LOGGER = logging.getLogger('ProfilerLog')
+
+# The engine writes a binary profiler log when VORTEX_PROFILER_LOG is set (see OCTUi.startClicked).
+# Each record is 32 bytes: event code, task, job (block) and timestamp (ns). The first record is a
+# header with code 0xffff...ff.
+RECORD_DTYPE = np.dtype([('code', '<u8'), ('task', '<u8'), ('job', '<u8'), ('time', '<i8')])
+HEADER_CODE = 0xffffffffffffffff
+
+# Per-job events, in the order they happen to each block. Names follow the engine's job pipeline.
+JOB_EVENTS = {
+    0x100: 'create',
+    0x101: 'clearance',
+    0x102: 'generate_scan',
+    0x103: 'generate_strobe',
+    0x104: 'acquire_dispatch_begin',
+    0x105: 'acquire_dispatch_end',
+    0x106: 'acquire_join',
+    0x107: 'process_dispatch_begin',
+    0x108: 'process_join',
+    0x10001: 'format_begin',
+    0x10002: 'format_plan',
+    0x10003: 'format_execute',
+    0x10004: 'format_end',
+    0x109: 'format_join',
+    0x10a: 'recycle',
+}
+# Completion of one of the job's tasks (acquisition, then each IO) - the task index is in the record.
+TASK_COMPLETE = 0x10000
+
+# (stage, from event, to event)
+STAGES = [
+    ('wait', 'create', 'clearance'),
+    ('dispatch', 'clearance', 'acquire_dispatch_end'),
+    ('acquire', 'acquire_dispatch_end', 'acquire_join'),
+    ('process', 'process_dispatch_begin', 'process_join'),
+    ('format', 'format_begin', 'format_end'),
+    ('recycle', 'format_end', 'recycle'),
+    ('total', 'create', 'recycle'),
+]
+
+# (queue, from event, to event) - number of blocks between the two events at any time
+QUEUES = [
+    ('in_flight', 'create', 'recycle'),
+    ('acquiring', 'acquire_dispatch_end', 'acquire_join'),
+    ('waiting_process', 'acquire_join', 'process_dispatch_begin'),
+    ('process_slots', 'process_dispatch_begin', 'process_join'),
+    ('waiting_format', 'process_join', 'format_begin'),
+]
+
+
+def read_records(path: str, chunk: int=65536) -> Iterator[np.ndarray]:
+    '''Decode a profiler log, chunk records at a time, without reading the whole file.'''
+    with open(path, 'rb') as f:
+        while True:
+            records = np.fromfile(f, dtype=RECORD_DTYPE, count=chunk)
+            if len(records) == 0:
+                break
+            yield records
+
+
+@dataclass
+class StageLatency:
+    '''Latency of one stage over all blocks, in ms.'''
+    stage: str
+    count: int
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+@dataclass
+class QueueDepth:
+    '''Blocks in a queue over the run.'''
+    queue: str
+    mean: float     # time-weighted
+    max: int
+
+
+@dataclass
+class Spike:
+    '''Run of consecutive blocks created while block utilization was above the threshold.'''
+    first_job: int
+    last_job: int
+    start: float    # s
+    end: float      # s
+    peak_utilization: float
+
+
+class ProfilerLog():
+    '''
+    Per-block timeline decoded from a profiler log. Times are in seconds from the first event in the log.
+
+    blocks is a structured array with a 'job' field and one float field for each event in JOB_EVENTS
+    (NaN if the event is missing for that block, e.g. blocks still in flight when the engine stopped).
+    '''
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.header = None
+        self.engine_events: List[Tuple[int, float]] = []
+        self._t0 = None
+        job_times: Dict[int, List[np.ndarray]] = {code: [] for code in JOB_EVENTS}
+        job_ids: Dict[int, List[np.ndarray]] = {code: [] for code in JOB_EVENTS}
+        tasks = []
+        unknown = set()
+
+        for records in read_records(path):
+            if self.header is None:
+                if records[0]['code'] != HEADER_CODE:
+                    raise ValueError("{0:s} is not a profiler log".format(str(path)))
+                self.header = int(records[0]['task'])
+                records = records[1:]
+                if len(records) == 0:
+                    continue
+                self._t0 = int(records['time'].min())
+            codes = records['code']
+            times = (records['time'] - self._t0) * 1e-9
+            for code in np.unique(codes):
+                which = codes == code
+                code = int(code)
+                if code in JOB_EVENTS:
+                    job_times[code].append(times[which])
+                    job_ids[code].append(records['job'][which].astype(np.int64))
+                elif code == TASK_COMPLETE:
+                    tasks.append(np.stack([records['task'][which].astype(np.float64), records['job'][which].astype(np.float64), times[which]], axis=1))
+                elif code < 0x100:
+                    self.engine_events += [(code, float(t)) for t in times[which]]
+                else:
+                    unknown.add(code)
+        if unknown:
+            LOGGER.warning("Unknown event codes ignored: {0:s}".format(', '.join(hex(c) for c in sorted(unknown))))
+
+        njobs = 1 + max([int(ids.max()) for chunks in job_ids.values() for ids in chunks], default=-1)
+        self.blocks = np.zeros(njobs, dtype=[('job', np.int64)] + [(name, np.float64) for name in JOB_EVENTS.values()])
+        self.blocks['job'] = np.arange(njobs)
+        for (code, name) in JOB_EVENTS.items():
+            self.blocks[name] = np.nan
+            for (ids, t) in zip(job_ids[code], job_times[code]):
+                self.blocks[name][ids] = t
+        # (task, job, time) for each task completion
+        self.task_completions = np.concatenate(tasks) if tasks else np.zeros((0, 3))
+
+    def stage_durations(self, stage: str) -> np.ndarray:
+        '''Duration (s) of a stage from STAGES for each block, NaN where either event is missing.'''
+        (_, begin, end) = next(s for s in STAGES if s[0] == stage)
+        return self.blocks[end] - self.blocks[begin]
+
+    def latencies(self) -> List[StageLatency]:
+        result = []
+        for (stage, _, _) in STAGES:
+            d = self.stage_durations(stage)
+            d = d[~np.isnan(d)] * 1000
+            if len(d) == 0:
+                continue
+            (p50, p90, p99) = np.percentile(d, [50, 90, 99])
+            result.append(StageLatency(stage, len(d), float(p50), float(p90), float(p99), float(d.max())))
+        return result
+
+    def depth(self, queue: str) -> Tuple[np.ndarray, np.ndarray]:
+        '''(times, depth) step function: depth is the number of blocks in queue (from QUEUES) from each time on.'''
+        (_, begin, end) = next(q for q in QUEUES if q[0] == queue)
+        b = self.blocks[begin]
+        e = self.blocks[end]
+        # a block that never left the queue stays in it to the end of the log
+        e = np.where(np.isnan(e) & ~np.isnan(b), self.end_time, e)
+        ok = ~np.isnan(b)
+        t = np.concatenate([b[ok], e[ok]])
+        step = np.concatenate([np.ones(ok.sum(), dtype=np.int64), -np.ones(ok.sum(), dtype=np.int64)])
+        # leaving sorts before entering at the same time
+        order = np.lexsort((step, t))
+        return (t[order], np.cumsum(step[order]))
+
+    def queue_depths(self) -> List[QueueDepth]:
+        result = []
+        for (queue, _, _) in QUEUES:
+            (t, n) = self.depth(queue)
+            if len(t) < 2:
+                continue
+            mean = float(np.sum(n[:-1] * np.diff(t)) / (t[-1] - t[0])) if t[-1] > t[0] else 0.0
+            result.append(QueueDepth(queue, mean, int(n.max())))
+        return result
+
+    def spikes(self, blocks_allocated: int, threshold: float=0.5) -> List[Spike]:
+        '''
+        Runs of blocks created while block utilization (blocks in flight / blocks_allocated) was above threshold.
+        '''
+        (t, n) = self.depth('in_flight')
+        created = self.blocks['create']
+        ok = ~np.isnan(created)
+        util = np.full(len(created), np.nan)
+        # depth just after each block was created
+        util[ok] = n[np.searchsorted(t, created[ok], side='right') - 1] / blocks_allocated
+        result = []
+        over = np.flatnonzero(util > threshold)
+        if len(over) == 0:
+            return result
+        # split into runs of consecutive jobs
+        for run in np.split(over, np.flatnonzero(np.diff(over) > 1) + 1):
+            result.append(Spike(int(run[0]), int(run[-1]), float(created[run[0]]), float(created[run[-1]]), float(np.max(util[run]))))
+        return result
+
+    @property
+    def end_time(self) -> float:
+        times = [t for (_, t) in self.engine_events]
+        for name in JOB_EVENTS.values():
+            v = self.blocks[name]
+            if np.any(~np.isnan(v)):
+                times.append(float(np.nanmax(v)))
+        return max(times, default=0.0)
+
+    def chrome_trace(self, path: str):
+        '''
+        Write a Chrome trace (JSON) - open it in chrome://tracing or https://ui.perfetto.dev. Each stage of each
+        block is an async slice (blocks overlap), queue depths are counters, engine events are instants.
+        '''
+        events = []
+        for (stage, begin, end) in STAGES:
+            if stage == 'total':
+                continue
+            b = self.blocks[begin]
+            e = self.blocks[end]
+            for j in np.flatnonzero(~np.isnan(b) & ~np.isnan(e)):
+                common = {'name': stage, 'cat': stage, 'id': int(j), 'pid': 1, 'tid': 1, 'args': {'job': int(j)}}
+                events.append(dict(common, ph='b', ts=b[j] * 1e6))
+                events.append(dict(common, ph='e', ts=e[j] * 1e6))
+        for (queue, _, _) in QUEUES:
+            (t, n) = self.depth(queue)
+            for (ti, ni) in zip(t, n):
+                events.append({'name': queue, 'ph': 'C', 'pid': 1, 'ts': ti * 1e6, 'args': {'blocks': int(ni)}})
+        for (code, t) in self.engine_events:
+            events.append({'name': 'engine {0:d}'.format(code), 'ph': 'i', 's': 'g', 'pid': 1, 'tid': 0, 'ts': t * 1e6})
+        for (task, job, t) in self.task_completions:
+            events.append({'name': 'task {0:d} complete'.format(int(task)), 'ph': 'i', 's': 't', 'pid': 1, 'tid': 2 + int(task), 'ts': t * 1e6, 'args': {'job': int(job)}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO)
+
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+    parser = ArgumentParser(description='Decode an engine profiler log (VORTEX_PROFILER_LOG) and report per-block timing.', formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('path', help='profiler log')
+    parser.add_argument('--blocks-allocated', type=int, default=0, help='blocks_to_allocate of the engine, to report utilization spikes')
+    parser.add_argument('--spike', type=float, default=0.5, help='report blocks created while block utilization was above this')
+    parser.add_argument('--chrome-trace', default='', help='write a Chrome trace JSON file')
+    parser.add_argument('--json', default='', help='write the report to this file')
+    args = parser.parse_args()
+
+    log = ProfilerLog(args.path)
+    print("{0:s}: {1:d} blocks over {2:.3f}s".format(str(log.path), len(log.blocks), log.end_time))
+    print("{0:<10s} {1:>7s} {2:>9s} {3:>9s} {4:>9s} {5:>9s}".format('stage(ms)', 'count', 'p50', 'p90', 'p99', 'max'))
+    latencies = log.latencies()
+    for s in latencies:
+        print("{0:<10s} {1:7d} {2:9.3f} {3:9.3f} {4:9.3f} {5:9.3f}".format(s.stage, s.count, s.p50, s.p90, s.p99, s.max))
+    print("{0:<16s} {1:>7s} {2:>5s}".format('queue(blocks)', 'mean', 'max'))
+    depths = log.queue_depths()
+    for q in depths:
+        print("{0:<16s} {1:7.2f} {2:5d}".format(q.queue, q.mean, q.max))
+    spikes = []
+    if args.blocks_allocated > 0:
+        spikes = log.spikes(args.blocks_allocated, args.spike)
+        print("{0:d} utilization spikes above {1:.2f}".format(len(spikes), args.spike))
+        for s in spikes:
+            print("  blocks {0:d}-{1:d} at {2:.3f}-{3:.3f}s, peak {4:.2f}".format(s.first_job, s.last_job, s.start, s.end, s.peak_utilization))
+    if args.chrome_trace:
+        log.chrome_trace(args.chrome_trace)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'latencies': [asdict(s) for s in latencies], 'queues': [asdict(q) for q in depths], 'spikes': [asdict(s) for s in spikes]}, f, indent=2)
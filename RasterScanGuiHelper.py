@@ -4,17 +4,11 @@ from ScanConfigWidget import RasterScanConfigWidget
 from ScanParams import RasterScanParams
 from OCTUiParams import OCTUiParams
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QTabWidget
-from vortex_tools.ui.display import RasterEnFaceWidget, CrossSectionImageWidget
-from TraceWidget import AscanTraceWidget, SpectraTraceWidget
-from CrossSectionDrawingWidget import CrossSectionDrawingWidget
-from MultiPlotSelectWidget import MPSW, MPSWData
-import matplotlib as mpl
 from math import radians
 import numpy as np
 from vortex.scan import RasterScan, RasterScanConfig
-from vortex.engine import StackDeviceTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, SpectraStackEndpoint, NullEndpoint
+from vortex.engine import StackDeviceTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, NullEndpoint
 from vortex.format import FormatPlanner, FormatPlannerConfig, StackFormatExecutorConfig, StackFormatExecutor, SimpleSlice
-from vortex.storage import SimpleStackUInt16
 from vortex.marker import Flags
 from vortex import get_console_logger as get_logger
 
@@ -23,24 +17,28 @@ class RasterScanGUIHelper(ScanGUIHelper):
     def __init__(self, name: str, flags: int, params: RasterScanParams, settings: Dict[str, Any], octui):
         super().__init__(name, flags, params, settings, octui)
 
-        self._edit_widget = RasterScanConfigWidget()
-        self._edit_widget.setRasterScanParams(self.params)
+        if not self.headless:
+            self._edit_widget = RasterScanConfigWidget()
+            self._edit_widget.setRasterScanParams(self.params)
         self._raster_widget = None
         self._cross_widget = None
         self._ascan_trace_widget = None
         self._spectra_trace_widget = None
         self._mpsw = None
+        self._enface = None
         #self._plot_widget = self.rasterPlotWidget()
 
     def getSettings(self):
         settings = {}
         settings['enface.range'] = self._raster_widget._range
         settings['cross.range'] = self._cross_widget._range
-        settings['ascan.ylim'] = list(self._ascan_trace_widget._axes.get_ylim())
-        settings['spectra.ylim'] = list(self._spectra_trace_widget._axes.get_ylim())
+        settings['ascan.ylim'] = list(self._ascan_trace_widget.get_ylim())
+        settings['spectra.ylim'] = list(self._spectra_trace_widget.get_ylim())
         return settings
 
     def getParams(self):
+        if self.headless:
+            return self.params
         params = self._edit_widget.getRasterScanParams()
         return params
 
@@ -68,18 +66,24 @@ class RasterScanGUIHelper(ScanGUIHelper):
 
     def cb_ascan(self, v):
         if self._tabwidget.currentIndex() == 0:
-            self._cross_widget.notify_segments(v)
-            self._raster_widget.notify_segments(v)
+            self.notifySegments(self._cross_widget, v)
+            self.notifySegments(self._raster_widget, v)
             self._ascan_trace_widget.update_trace(v)
+        elif self._tabwidget.currentIndex() == 1:
+            # keep the en face image for the DAQ tab up to date, a few B-scans at a time
+            self._enface.update(v)
 
     def cb_spectra(self, v):
         if self._tabwidget.currentIndex() == 0:
             self._spectra_trace_widget.update_trace(v)
 
+    def spectraVolume(self, sample_idx, scan_idx, volume_idx):
+        if not self.headless:
+            self.cb_volume(sample_idx, scan_idx, volume_idx)
+
     def cb_volume(self, sample_idx, scan_idx, volume_idx):
-        """volume callback that is (should be) called prior to other volume callbacks. 
-        Because of that arrangement, this callback will open storage. Same storage is closed 
-        in volumeCallback2
+        """volume callback for the spectra endpoint. Called after the volume (if saving) 
+        has been handed to the VolumeWriter.
 
         Args:
             sample_idx (int): sample index
@@ -90,25 +94,29 @@ class RasterScanGUIHelper(ScanGUIHelper):
         # we only care if we are at index 1
         if self._tabwidget.currentIndex() == 1:
             #print("raster cb_volume({0:d},{1:d},{2:d})".format(sample_idx, scan_idx, volume_idx))
+            # While saving, the cell shares the VolumeWriter's copy of the spectra. Otherwise spectra are 
+            # copied once, into a buffer from the MPSW's pool (usually the buffer of the grid cell being 
+            # replaced). If the pool is used up the cell gets only the en face image.
+            spectra_data = None
             with self.components.spectra_endpoint.tensor as volume:
-                shape = volume.shape
-                if isinstance(volume, np.ndarray):
-                    spectra_data = volume.copy()
+                if self.saved_volume is not None:
+                    lease = self.saved_volume.acquire()
+                    spectra_data = lease.data.reshape(volume.shape)
                 else:
-                    spectra_data = volume.copy().get()
+                    lease = self._mpsw.borrow(volume.shape, volume.dtype)
+                    if lease is not None:
+                        if isinstance(volume, np.ndarray):
+                            np.copyto(lease.data, volume)
+                        else:
+                            volume.get(out=lease.data)
+                        spectra_data = lease.data
                 #self._logger.info("spectra nbytes: {0:d}".format(spectra_data.nbytes))
 
-            # ascan_data is a current en face image
-            with self.components.ascan_endpoint.tensor as volume:
-                shape = volume.shape
-                #self._logger.info("ascan shape {0:d} x {1:d} x {2:d}, type {3:s}".format(shape[0], shape[1], shape[2], str(type(volume))))
-                if isinstance(volume, np.ndarray):
-                    ascan_data = volume.max(axis=2).transpose().copy()
-                else:
-                    ascan_data = volume.max(axis=2).transpose().copy().get()
-                    self.components.ascan_endpoint.stream.synchronize()
+            # ascan_data is a current en face image. It has been projected as segments arrived, 
+            # only the finished image is copied here.
+            ascan_data = self._enface.finish().transpose().copy()
             #print("volume cb_volume() spectra shape ", spectra_data.shape, " ascan shape ", ascan_data.shape)
-            self._mpsw.add_data(ascan_data, spectra_data)
+            self._mpsw.add_data(ascan_data, spectra_data, lease)
 
     def getStrobe(self):
         return super().getStrobe()
@@ -126,10 +134,9 @@ class RasterScanGUIHelper(ScanGUIHelper):
         format_planner.initialize(fc)
 
         # For saving volumes, this NullEndpoint is used. The volume_callback for this 
-        # endpoint will be called before that of the other endpoints. If needed, we open
-        # the storage in the volume_callback for this endpoint when needed. The storage 
-        # is closed in the volume_callback for the SpectraStackEndpoint, which does the 
-        # saving/writing of volumes.
+        # endpoint will be called before that of the other endpoints. If needed, the
+        # VolumeWriter is opened in the volume_callback for this endpoint. Volumes are
+        # handed to the writer from the volume_callback of the spectra endpoint.
         null_endpoint = NullEndpoint(get_logger('Traffic cop', self.log_level))
 
         # For DISPLAYING ascans (oct-processed data), slice away half the data. 
@@ -154,24 +161,22 @@ class RasterScanGUIHelper(ScanGUIHelper):
         self._logger.info('Create SpectraStackHostTensorEndpointUInt16 with shape {0:s}'.format(str(shape_spectra)))
         spectra_endpoint = SpectraStackHostTensorEndpointUInt16(sfe_spectra, shape_spectra, get_logger('stack', self.log_level))
 
-        # make an endpoint for saving spectra data
-        shape = (self.params.bscans_per_volume, self.params.ascans_per_bscan, samples_per_record, 1)
-        spectra_storage = SimpleStackUInt16(get_logger('npy-spectra', self.log_level))
-        sfec = StackFormatExecutorConfig()
-        sfe = StackFormatExecutor()
-        sfe.initialize(sfec)
-        storage_endpoint = SpectraStackEndpoint(sfe, spectra_storage, log=get_logger('npy-spectra', self.log_level))
 
 
-        self._components = ScanGUIHelperComponents(format_planner=format_planner, null_endpoint=null_endpoint, storage_endpoint=storage_endpoint, spectra_endpoint=spectra_endpoint, storage=spectra_storage, ascan_endpoint=ascan_endpoint, plot_widget=self.getPlotWidget(ascan_endpoint, spectra_endpoint))
+        self._components = ScanGUIHelperComponents(format_planner=format_planner, null_endpoint=null_endpoint, spectra_endpoint=spectra_endpoint, ascan_endpoint=ascan_endpoint, plot_widget=None if self.headless else self.getPlotWidget(ascan_endpoint, spectra_endpoint))
 
 
     def getPlotWidget(self, ascan_endpoint, spectra_endpoint) -> QWidget:
+        # plot modules (matplotlib etc) are imported here, not at startup
+        from vortex_tools.ui.display import RasterEnFaceWidget, CrossSectionImageWidget
+        from TraceWidget import AscanTraceWidget, SpectraTraceWidget
+        from MultiPlotSelectWidget import MPSW
+        from IncrementalMIP import IncrementalMIP
+        import matplotlib as mpl
 
         # callbacks
-        ascan_endpoint.aggregate_segment_callback = self.cb_ascan
-        spectra_endpoint.aggregate_segment_callback = self.cb_spectra
-        spectra_endpoint.volume_callback = self.cb_volume
+        ascan_endpoint.aggregate_segment_callback = self.instrument(self.cb_ascan)
+        spectra_endpoint.aggregate_segment_callback = self.instrument(self.cb_spectra)
 
 
         # make all widgets
@@ -180,8 +185,10 @@ class RasterScanGUIHelper(ScanGUIHelper):
         self._cross_widget = CrossSectionImageWidget(ascan_endpoint, cmap=mpl.colormaps['gray'])
         self._ascan_trace_widget = AscanTraceWidget(ascan_endpoint, title="ascan")
         self._spectra_trace_widget = SpectraTraceWidget(spectra_endpoint, title="raw spectra")
-        self._mpsw = MPSW(parent=None, columns = 3, rows=3)
+        self._mpsw = MPSW(parent=None, columns = 3, rows=3, max_bytes=int(self.settings.get('daq.max_mb', 0) * 1024 * 1024), spill_dir=self.settings.get('daq.spill_dir'))
         self._mpsw.save.connect(self._savedata)
+        self._enface = IncrementalMIP(ascan_endpoint)
+        self.registerPlots(self._raster_widget, self._cross_widget, self._ascan_trace_widget, self._spectra_trace_widget)
 
         # apply settings
         if 'enface.range' in self.settings:
@@ -196,6 +203,10 @@ class RasterScanGUIHelper(ScanGUIHelper):
         if 'spectra.ylim' in self.settings:
             self._spectra_trace_widget.set_ylim(self.settings['spectra.ylim'])
 
+        if 'autoscale.percentiles' in self.settings:
+            self._ascan_trace_widget.set_autoscale_percentiles(self.settings['autoscale.percentiles'])
+            self._spectra_trace_widget.set_autoscale_percentiles(self.settings['autoscale.percentiles'])
+
         # tab widget
         self._tabwidget.currentChanged.connect(self._tabCurrentChanged)
 
@@ -234,17 +245,31 @@ class RasterScanGUIHelper(ScanGUIHelper):
 
     def _savedata(self, r, c):
         self._logger.info("save data at r={:d} c={:d}".format(r, c))
-        data = self._mpsw.get_data(r, c)
-        self._logger.info("ASCAN shape {:s}, dtype {:s}".format(str(data.ascan_data.shape), str(data.ascan_data.dtype)))
-        self._logger.info("SPECTRA shape {:s}, dtype {:s}".format(str(data.spectra_data.shape), str(data.spectra_data.dtype)))
-        (bOK, baseFilename) = self.octui.checkFileSaveStuff()
-        if bOK:
-            self._logger.info("saving to {0:s}".format(baseFilename))
-            np.savez(baseFilename+".npz", ascan=data.ascan_data, spectra=data.spectra_data)
+        # hold the spectra buffer while writing, in case the grid cell is replaced meanwhile
+        data = self._mpsw.acquire_data(r, c)
+        if data is None:
+            return
+        try:
+            self._logger.info("ASCAN shape {:s}, dtype {:s}".format(str(data.ascan_data.shape), str(data.ascan_data.dtype)))
+            if data.spectra_data is None:
+                self._logger.warning("Spectra for this image were dropped (snapshot memory limit), saving image only")
+            else:
+                self._logger.info("SPECTRA shape {:s}, dtype {:s}".format(str(data.spectra_data.shape), str(data.spectra_data.dtype)))
+            (bOK, baseFilename) = self.octui.checkFileSaveStuff()
+            if bOK:
+                self._logger.info("saving to {0:s}".format(baseFilename))
+                if data.spectra_data is None:
+                    np.savez(baseFilename+".npz", ascan=data.ascan_data)
+                else:
+                    np.savez(baseFilename+".npz", ascan=data.ascan_data, spectra=data.spectra_data)
+        finally:
+            if data.lease is not None:
+                data.lease.release()
 
         #self.components.storage.save(data)
 
     def _tabCurrentChanged(self, newindex):
         #self._logger.info("tabCurrentChanged to {:d}".format(newindex))
         #self._logger.info("current is {:d}".format(self._tabwidget.currentIndex()))
-        pass
\ No newline at end of file
+        # B-scans projected before leaving the DAQ tab are stale now
+        self._enface.reset()
\ No newline at end of file
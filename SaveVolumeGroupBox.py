@@ -1,6 +1,7 @@
 from PyQt5.QtWidgets import QApplication, QWidget, QFileDialog, QGroupBox
 from PyQt5.QtCore import pyqtSignal
 from Ui_SaveVolumeGroupBox import Ui_SaveVolumeGroupBox
+from VolumeWriter import StorageFormat, available_formats
 from platformdirs import user_data_dir
 from pathlib import Path
 from datetime import datetime
@@ -31,9 +32,22 @@ class SaveVolumeGroupBox(QGroupBox, Ui_SaveVolumeGroupBox):
             else:
                 self.pathDataRoot = p
         self.__updateLabels()
+        # only formats whose modules (h5py, zarr, ...) are installed
+        for f in available_formats():
+            self.cbFormat.addItem("{0:s} ({1:s})".format(f.name, f.extension), f.value)
         self.pbSaveContinuous.clicked.connect(self.saveContVolumes)
         self.pbSaveFixedN.clicked.connect(self.__saveFixedN)
 
+    @property
+    def storageFormat(self) -> StorageFormat:
+        return StorageFormat(self.cbFormat.currentData())
+
+    @storageFormat.setter
+    def storageFormat(self, f: StorageFormat):
+        index = self.cbFormat.findData(f.value)
+        if index >= 0:
+            self.cbFormat.setCurrentIndex(index)
+
     def __saveFixedN(self):
         self.saveNVolumes.emit(self.sbN.value())
 
@@ -81,6 +95,7 @@ class SaveVolumeGroupBox(QGroupBox, Ui_SaveVolumeGroupBox):
 
     def enableSaving(self, bEnable: bool=True, bEnableStop = False):
         self.sbN.setEnabled(bEnable)
+        self.cbFormat.setEnabled(bEnable)
         self.pbSaveFixedN.setEnabled(bEnable)
         self.pbSaveContinuous.setEnabled(bEnable)
         if bEnable:
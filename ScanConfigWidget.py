@@ -11,8 +11,6 @@ from Ui_RasterScanConfigWidget import Ui_RasterScanConfigWidget
 from Ui_AimingScanConfigWidget import Ui_AimingScanConfigWidget
 from Ui_LineScanConfigWidget import Ui_LineScanConfigWidget
 from Ui_GalvoTuningScanConfigWidget import Ui_GalvoTuningScanConfigWidget
-from vortex_tools.scan import plot_annotated_waveforms_time, plot_annotated_waveforms_space
-from matplotlib import pyplot
 import traceback
 
 
@@ -72,6 +70,9 @@ class ScanConfigWidget(QGroupBox, Ui_ScanConfigWidget):
         self.cbScanTypes.setCurrentIndex(index)
 
     def showPatternClicked(self):
+        # matplotlib is slow to import, only do it when needed
+        from vortex_tools.scan import plot_annotated_waveforms_time, plot_annotated_waveforms_space
+        from matplotlib import pyplot
         try:
             cfg = self.getScanConfig()
             scan = RasterScan()
@@ -6,26 +6,25 @@ from OCTUiParams import OCTUiParams
 #from OCTUi import OCTUi
 from VtxEngineParams import VtxEngineParams, AcquisitionType
 from vortex.engine import NullEndpoint, VolumeStrobe, SegmentStrobe, SampleStrobe, EventStrobe
-from vortex.engine import StackDeviceTensorEndpointInt8, StackHostTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, SpectraStackEndpoint, NullEndpoint, EventStrobe
+from vortex.engine import StackDeviceTensorEndpointInt8, StackHostTensorEndpointInt8, SpectraStackHostTensorEndpointUInt16, NullEndpoint, EventStrobe
 from vortex.format import FormatPlanner, StackFormatExecutor
-from vortex.storage import SimpleStackUInt16
 from qtpy.QtWidgets import QWidget
 from vortex import get_console_logger
+from CallbackTimers import callback_timers
+import numpy as np
 
 
 class ScanGUIHelperComponents:
-    def __init__(self, format_planner: FormatPlanner, null_endpoint: NullEndpoint, storage_endpoint: SpectraStackEndpoint, spectra_endpoint: SpectraStackHostTensorEndpointUInt16, storage: SimpleStackUInt16, ascan_endpoint: StackDeviceTensorEndpointInt8, plot_widget: QWidget):
+    def __init__(self, format_planner: FormatPlanner, null_endpoint: NullEndpoint, spectra_endpoint: SpectraStackHostTensorEndpointUInt16, ascan_endpoint: StackDeviceTensorEndpointInt8, plot_widget: QWidget):
         self._format_planner = format_planner
         self._null_endpoint = null_endpoint
-        self._storage_endpoint = storage_endpoint
-        self._storage = storage
         self._spectra_endpoint = spectra_endpoint
         self._ascan_endpoint = ascan_endpoint
         self._plot_widget = plot_widget
 
     @property
     def endpoints(self) -> List[Any]:
-        return [self._null_endpoint, self._storage_endpoint, self._spectra_endpoint, self._ascan_endpoint]
+        return [self._null_endpoint, self._spectra_endpoint, self._ascan_endpoint]
     
     @property
     def format_planner(self) -> FormatPlanner:
@@ -35,14 +34,6 @@ class ScanGUIHelperComponents:
     def null_endpoint(self) -> NullEndpoint:
         return self._null_endpoint
 
-    @property
-    def storage_endpoint(self) -> SpectraStackEndpoint:
-        return self._storage_endpoint
-
-    @property
-    def storage(self) -> SimpleStackUInt16:
-        return self._storage
-
     @property
     def spectra_endpoint(self) -> SpectraStackHostTensorEndpointUInt16:
         return self._spectra_endpoint
@@ -74,7 +65,7 @@ class ScanGUIHelper(ABC):
         :param flags: Bit pattern, will be arg for vortex.marker.Flags()
         :param params: Parameters for the helper's edit dialog
         :param settings: Settings for this helper's plots (saved range, etc)
-        :param octui: OCTUi object
+        :param octui: OCTUi object, or None for a headless helper (no edit widget or plots, params are fixed)
         :param log_level: Log level for vortex loggers
         '''
         self.name = name
@@ -82,13 +73,100 @@ class ScanGUIHelper(ABC):
         self.params = params
         self.settings = settings
         self.octui = octui
+        self.headless = octui is None
         self.log_level = log_level
         self._logger = get_console_logger('GUIHelper({0:s})'.format(self.name))
         self._components = None
+        self._components_params = None
+        self.arena = None       # VolumeArena, set by the engine when components are attached
+        self.volume_writer = None   # VolumeWriter, set while volumes are being saved
+        self.saved_volume = None    # VolumeLease with the writer's copy of the volume, only during spectraVolume()
+
+    def registerPlots(self, *widgets):
+        '''
+        Register plot widgets with the display scheduler, which repaints them at a limited frame rate. 
+        Call from getPlotWidget().
+        '''
+        classes = [type(widget).__name__ for widget in widgets]
+        seen = {}
+        for (widget, cls) in zip(widgets, classes):
+            # widgets of the same class are numbered, e.g. 'aiming: CrossWidget 2'
+            seen[cls] = seen.get(cls, 0) + 1
+            name = "{0:s}: {1:s}".format(self.name, cls)
+            if classes.count(cls) > 1:
+                name += " {0:d}".format(seen[cls])
+            self.octui.display.register(widget, name)
+
+    def instrument(self, fn, name: str=None, segments: bool=True):
+        '''
+        Wrap an engine callback for timing (see CallbackTimers) when it is wired to an endpoint. Returns fn
+        itself if timing is not enabled.
+
+        :param name: Name in the timing stats, default the method name
+        :param segments: fn is a segment callback (its argument is a list of segments)
+        '''
+        return callback_timers.instrument("{0:s}.{1:s}".format(self.name, name or fn.__name__), segments)(fn)
+
+    def notifySegments(self, widget, bscan_idxs):
+        '''
+        Pass new segments to a plot widget (one with notify_segments). Called from engine callbacks - the 
+        widget is notified and repainted at the display scheduler's next frame.
+        '''
+        self.octui.display.notify(widget, bscan_idxs)
 
     def has_components(self) -> bool:
         return None != self._components
 
+    def componentsAreStale(self) -> bool:
+        '''
+        True if there are no components, or if the scan parameters in the edit widget have changed 
+        since the components were created. 
+        '''
+        return self._components is None or self._components_params != self.getParams()
+
+    def buildEngineComponents(self, octuiparams: OCTUiParams, samples_per_record: int):
+        '''
+        Fetch current params from the edit widget, then create engine components with them. 
+        The params used are saved so componentsAreStale() can tell when they have changed.
+        
+        :param octuiparams: Current engine parameters. 
+        :type octuiparams: OCTUiParams
+        :param samples_per_record: samples per ascan, as settled on by the base engine
+        :type samples_per_record: int
+        '''
+        self.params = self.getParams()
+        self.createEngineComponents(octuiparams, samples_per_record)
+        self._components_params = self.params
+        self._components.spectra_endpoint.volume_callback = self.instrument(self._spectraVolumeCallback, 'spectra_volume', segments=False)
+
+    def releaseEngineComponents(self):
+        '''
+        Drop components (and the memory their endpoints hold). They will be rebuilt by 
+        buildEngineComponents() if needed. 
+        '''
+        self._components = None
+        self._components_params = None
+
+    def componentsMemory(self) -> Tuple[int, int]:
+        '''
+        Memory held by the tensor endpoints of this helper. Only meaningful after the engine 
+        has been prepared (endpoint tensors are allocated then). 
+
+        :return: (host bytes, device bytes)
+        :rtype: Tuple[int, int]
+        '''
+        host = 0
+        device = 0
+        if self._components is not None:
+            for endpoint in [self._components.spectra_endpoint, self._components.ascan_endpoint]:
+                if endpoint.tensor.valid:
+                    with endpoint.tensor as volume:
+                        if isinstance(volume, np.ndarray):
+                            host += volume.nbytes
+                        else:
+                            device += volume.nbytes
+        return (host, device)
+
     @property
     def components(self) -> ScanGUIHelperComponents:
         if self._components is None:
@@ -108,6 +186,30 @@ class ScanGUIHelper(ABC):
     def volume(self, arg0: int, arg1: int, arg2: int) -> None: 
         pass
 
+    def spectraVolume(self, sample_idx: int, scan_idx: int, volume_idx: int) -> None:
+        '''
+        Called when the spectra endpoint has a complete volume. Subclasses can override to use the spectra.
+        '''
+        pass
+
+    def _spectraVolumeCallback(self, sample_idx: int, scan_idx: int, volume_idx: int):
+        # Hand the volume to the writer (if saving) before anything else. The writer only copies 
+        # it here, the file write happens on the writer's thread.
+        # The writer's copy is shared with spectraVolume() through saved_volume, so a subclass that keeps 
+        # the spectra can acquire() it instead of copying the volume again.
+        writer = self.volume_writer
+        lease = None
+        if writer is not None:
+            with self._components.spectra_endpoint.tensor as volume:
+                lease = writer.submit_shared(volume)
+        self.saved_volume = lease
+        try:
+            self.spectraVolume(sample_idx, scan_idx, volume_idx)
+        finally:
+            self.saved_volume = None
+            if lease is not None:
+                lease.release()
+
 
     @abstractmethod
     def getScan(self):
@@ -0,0 +1,114 @@
+from typing import Iterable, Optional, Tuple
+import threading
+import numpy as np
+
+
+class StreamingStats():
+    '''
+    Running min/max of values over one volume lap, used to autoscale plots. update() is called once per
+    segment batch with the values for those B-scans. For cupy values the reductions stay on the GPU (on the
+    caller's stream), so updates never wait for the device - the result is only read in limits().
+
+    With percentiles set, a strided sample of each update is kept in a fixed-size ring, and the limits are
+    percentiles of the sample instead of min/max, so a few outliers don't flatten the plot.
+
+    A lap starts at the first B-scan after start(), and is complete when the B-scan index has wrapped
+    around and come back to where it started.
+    '''
+    def __init__(self, percentiles: Optional[Tuple[float, float]]=None, sample_size: int=65536):
+        '''
+        :param percentiles: (low, high) percentiles, e.g. (1, 99), or None for min/max
+        :param sample_size: Number of values kept for percentiles
+        '''
+        self.percentiles = percentiles
+        self._sample_size = sample_size
+        self._lock = threading.Lock()
+        self._active = False
+        self._done = False
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def start(self):
+        '''Start collecting a new lap.'''
+        with self._lock:
+            self._start_idx = -1
+            self._last_idx = -1
+            self._wrapped = False
+            self._min = None
+            self._max = None
+            self._samples = None
+            self._nsamples = 0
+            self._event = None
+            self._done = False
+            self._active = True
+
+    def update(self, bscan_idxs: Iterable[int], values):
+        '''
+        Add values (numpy or cupy array, any shape) for the B-scans in bscan_idxs. Does nothing unless
+        collecting. For cupy values, call with the stream that produced them current.
+        '''
+        if not self._active or len(bscan_idxs) == 0:
+            return
+        with self._lock:
+            if not self._active or self._done:
+                return
+            if isinstance(values, np.ndarray):
+                xp = np
+                self._event = None
+            else:
+                import cupy as xp
+            flat = values.reshape(-1)
+            (lo, hi) = (xp.nanmin(flat), xp.nanmax(flat))
+            self._min = lo if self._min is None else xp.minimum(self._min, lo)
+            self._max = hi if self._max is None else xp.maximum(self._max, hi)
+            if self.percentiles is not None:
+                self._sample(xp, flat)
+            if xp is not np:
+                self._event = xp.cuda.Event()
+                self._event.record()
+
+            for b in bscan_idxs:
+                if self._start_idx < 0:
+                    self._start_idx = b
+                elif not self._wrapped and b <= self._last_idx:
+                    self._wrapped = True
+                if self._wrapped and b >= self._start_idx:
+                    self._done = True
+                self._last_idx = b
+
+    def limits(self) -> Optional[Tuple[float, float]]:
+        '''(low, high) once a lap is complete - collecting then stops. None until then.'''
+        with self._lock:
+            if not self._done:
+                return None
+            if self._event is not None:
+                self._event.synchronize()
+            if self.percentiles is not None and self._nsamples > 0:
+                n = min(self._nsamples, self._sample_size)
+                (lo, hi) = (float(v) for v in _percentile(self._samples[:n], self.percentiles))
+            else:
+                (lo, hi) = (float(self._min), float(self._max))
+            self._active = False
+            self._done = False
+            self._samples = None
+        return (lo, hi)
+
+    def _sample(self, xp, flat):
+        if self._samples is None:
+            self._samples = xp.empty(self._sample_size, dtype=np.float32)
+        # keep at most 1/16 of the ring from any one update, evenly strided
+        k = min(flat.size, max(1, self._sample_size // 16))
+        step = flat.size // k
+        pos = (self._nsamples + xp.arange(k)) % self._sample_size
+        self._samples[pos] = flat[::step][:k]
+        self._nsamples += k
+
+
+def _percentile(a, q):
+    if isinstance(a, np.ndarray):
+        return np.nanpercentile(a, q)
+    import cupy
+    a = a[~cupy.isnan(a)]
+    return cupy.percentile(a, cupy.asarray(q, dtype=np.float64)).get()
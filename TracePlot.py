@@ -0,0 +1,205 @@
+from qtpy.QtWidgets import QWidget
+from qtpy.QtGui import QPainter, QPen, QColor, QPixmap, QPolygonF, QPaintEvent, QResizeEvent, QFontMetrics, QKeyEvent
+from qtpy.QtCore import Qt, QPointF, QRectF, QSize
+
+import numpy as np
+from math import floor, ceil, log10
+from typing import List, Tuple, Optional
+from StreamingStats import StreamingStats
+
+# Real-time line plot drawn with QPainter. The axes, grid and labels are drawn into a pixmap which
+# is only redrawn when the size or limits change. Each paint blits the pixmap, then draws the lines
+# as polylines whose points are written straight from numpy into a QPolygonF.
+#
+# Pressing Y autoscales: subclasses feed their data to self.autoscale, and the y limits are set
+# when it has seen a full volume.
+
+class TracePlot(QWidget):
+
+    def __init__(self, parent=None, width=5, height=4, dpi=100, title: str=None, ylabel: str=None, logy: bool=False):
+        super().__init__(parent)
+        self._size_hint = QSize(int(width*dpi), int(height*dpi))
+        self._title = title
+        self._ylabel = ylabel
+        self._logy = logy
+        self._ylim = (0.0, 1.0)
+        self._lines: List[Optional[np.ndarray]] = []
+        self._colors: List[QColor] = []
+        self._polygons: List[QPolygonF] = []
+        self._npoints = 0
+        self._background: QPixmap = None
+        self._plot_rect = QRectF()
+        self.display = None         # DisplayScheduler, set when registered
+        self.autoscale = StreamingStats()
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+        self.setFocusPolicy(Qt.FocusPolicy.ClickFocus)
+
+    def sizeHint(self) -> QSize:
+        return self._size_hint
+
+    def set_ylim(self, lim):
+        ylim = (float(lim[0]), float(lim[1]))
+        if ylim[0] == ylim[1]:
+            ylim = (ylim[0] - 0.5, ylim[1] + 0.5)
+        if ylim != self._ylim:
+            self._ylim = ylim
+            self._background = None
+            self.update()
+
+    def get_ylim(self) -> Tuple[float, float]:
+        return self._ylim
+
+    def set_logy(self, logy: bool):
+        if logy != self._logy:
+            self._logy = logy
+            self._background = None
+            self.update()
+
+    def set_line(self, index: int, ydata: np.ndarray, color=(0,0,1)):
+        '''
+        Set the data for line index. x values are 1..len(ydata). Call update() to show it.
+
+        :param color: RGB tuple, values 0-1 (as matplotlib uses)
+        '''
+        while len(self._lines) <= index:
+            self._lines.append(None)
+            self._colors.append(QColor(0, 0, 255))
+            self._polygons.append(QPolygonF())
+        self._lines[index] = ydata
+        self._colors[index] = QColor.fromRgbF(*color)
+        if len(ydata) != self._npoints:
+            self._npoints = len(ydata)
+            self._background = None
+
+    def set_autoscale_percentiles(self, percentiles: Optional[Tuple[float, float]]):
+        '''Autoscale to these (low, high) percentiles of the data, or to min/max if None.'''
+        self.autoscale.percentiles = None if percentiles is None else tuple(percentiles)
+
+    def request_paint(self):
+        '''Repaint at the display scheduler's next frame (or now, if not registered). Safe to call from the engine thread.'''
+        if self.display is not None:
+            self.display.invalidate(self)
+        else:
+            self.update()
+
+    def clear(self):
+        self._lines = []
+        self._colors = []
+        self._polygons = []
+        self.update()
+
+    def flush(self):
+        self.clear()
+
+    def resizeEvent(self, e: QResizeEvent) -> None:
+        self._background = None
+        super().resizeEvent(e)
+
+    def keyPressEvent(self, e: QKeyEvent) -> None:
+        if e.key() == Qt.Key.Key_Y:
+            if not self.autoscale.active:
+                self.autoscale.start()
+        else:
+            super().keyPressEvent(e)
+
+    def paintEvent(self, e: QPaintEvent) -> None:
+        if self.autoscale.active:
+            ylim = self.autoscale.limits()
+            if ylim is not None:
+                self.set_ylim(ylim)
+        if self._background is None or self._background.size() != self.size():
+            self._background = self._drawBackground()
+        painter = QPainter()
+        painter.begin(self)
+        painter.drawPixmap(0, 0, self._background)
+        painter.setClipRect(self._plot_rect)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        for (i, ydata) in enumerate(self._lines):
+            if ydata is None or len(ydata) < 2:
+                continue
+            painter.setPen(QPen(self._colors[i], 1))
+            painter.drawPolyline(self._toPolygon(i, ydata))
+        painter.end()
+
+    def _toPolygon(self, i: int, ydata: np.ndarray) -> QPolygonF:
+        n = len(ydata)
+        poly = self._polygons[i]
+        if len(poly) != n:
+            poly = QPolygonF()
+            poly.fill(QPointF(), n)
+            self._polygons[i] = poly
+        # write the points in place - a QPolygonF is a contiguous array of (double x, double y)
+        ptr = poly.data()
+        ptr.setsize(n * 2 * np.dtype(np.float64).itemsize)
+        points = np.frombuffer(ptr, np.float64).reshape(n, 2)
+        r = self._plot_rect
+        points[:, 0] = np.linspace(r.left(), r.right(), n)
+        points[:, 1] = r.bottom() - self._scaleY(ydata) * r.height()
+        return poly
+
+    def _scaleY(self, y) -> np.ndarray:
+        '''Map y values to 0 (bottom) - 1 (top).'''
+        (y0, y1) = self._ylim
+        if self._logy:
+            y = np.log10(np.maximum(y, 1e-12))
+            (y0, y1) = (log10(max(y0, 1e-12)), log10(max(y1, 1e-12)))
+        return (np.asarray(y, dtype=np.float64) - y0) / (y1 - y0)
+
+    def _yticks(self) -> Tuple[List[float], List[float]]:
+        '''Major and minor tick values, inside the y limits.'''
+        (y0, y1) = sorted(self._ylim)
+        if self._logy:
+            (d0, d1) = (floor(log10(max(y0, 1e-12))), ceil(log10(max(y1, 1e-12))))
+            major = [10.0**d for d in range(d0, d1 + 1)]
+            minor = [m * 10.0**d for d in range(d0, d1 + 1) for m in range(2, 10)]
+        else:
+            raw = (y1 - y0) / 5
+            mag = 10.0**floor(log10(raw))
+            step = next(s * mag for s in [1, 2, 5, 10] if s * mag >= raw)
+            major = [k * step for k in range(ceil(y0 / step), floor(y1 / step) + 1)]
+            minor = []
+        return ([y for y in major if y0 <= y <= y1], [y for y in minor if y0 <= y <= y1])
+
+    def _drawBackground(self) -> QPixmap:
+        pixmap = QPixmap(self.size())
+        pixmap.fill(Qt.GlobalColor.white)
+        painter = QPainter()
+        painter.begin(pixmap)
+        fm = QFontMetrics(painter.font())
+        (major, minor) = self._yticks()
+        labels = ["{0:g}".format(y) for y in major]
+        left = 6 + max([fm.horizontalAdvance(s) for s in labels], default=0) + (fm.height() + 4 if self._ylabel else 0)
+        top = 6 + (fm.height() + 4 if self._title else 0)
+        bottom = 6 + fm.height() + 4
+        self._plot_rect = QRectF(left, top, max(1, self.width() - left - 10), max(1, self.height() - top - bottom))
+        r = self._plot_rect
+
+        # grid
+        painter.setPen(QPen(QColor(220, 220, 220), 1))
+        for y in minor:
+            yp = r.bottom() - self._scaleY(y) * r.height()
+            painter.drawLine(QPointF(r.left(), yp), QPointF(r.right(), yp))
+        painter.setPen(QPen(QColor(128, 128, 128), 1))
+        for (y, s) in zip(major, labels):
+            yp = r.bottom() - self._scaleY(y) * r.height()
+            painter.drawLine(QPointF(r.left(), yp), QPointF(r.right(), yp))
+            painter.drawText(QRectF(0, yp - fm.height()/2, left - 4, fm.height()), Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, s)
+
+        # x labels at first and last point
+        if self._npoints > 0:
+            painter.drawText(QRectF(r.left() - 20, r.bottom() + 2, 40, fm.height()), Qt.AlignmentFlag.AlignHCenter, "1")
+            painter.drawText(QRectF(r.right() - 40, r.bottom() + 2, 60, fm.height()), Qt.AlignmentFlag.AlignHCenter, str(self._npoints))
+
+        # frame, title, label
+        painter.setPen(QPen(Qt.GlobalColor.black, 1))
+        painter.drawRect(r)
+        if self._title:
+            painter.drawText(QRectF(r.left(), 4, r.width(), fm.height()), Qt.AlignmentFlag.AlignHCenter, self._title)
+        if self._ylabel:
+            painter.save()
+            painter.translate(4 + fm.height(), r.center().y())
+            painter.rotate(-90)
+            painter.drawText(QRectF(-r.height()/2, -fm.height(), r.height(), fm.height()), Qt.AlignmentFlag.AlignHCenter, self._ylabel)
+            painter.restore()
+        painter.end()
+        return pixmap
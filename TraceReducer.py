@@ -0,0 +1,126 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional, Callable, Tuple
+import threading
+import numpy as np
+
+
+# order of the traces in a reduction (and the arguments of a trace function)
+REDUCTIONS = ('mean', 'min', 'max', 'ascan')
+
+
+@dataclass
+class TraceReduction:
+    '''Traces reduced from one B-scan. Each has one value per sample (depth), zeros if it was not reduced.'''
+    bidx: int
+    mean: np.ndarray        # mean over the reduced A-scans
+    min: np.ndarray         # per-sample minimum over the reduced A-scans
+    max: np.ndarray         # per-sample maximum over the reduced A-scans
+    ascan: np.ndarray       # the selected A-scan
+
+
+class TraceReducer():
+    '''
+    Reduces a B-scan of an endpoint's volume to a few traces, once per segment callback instead of once per
+    paint. For a cupy volume the reduction runs on the endpoint's stream and the result is copied (async) to
+    pinned host memory, so neither the engine thread nor the GUI thread waits for the GPU.
+
+    Results are double buffered. update() writes one buffer while result() reads the other, which is only
+    returned after its copy has completed.
+
+    While stats is collecting, every B-scan in the segment batch is reduced (not just the first), and the
+    plotted trace of each is passed to stats.update() on the device.
+    '''
+    def __init__(self, endpoint, ascans: slice=slice(None), aidx: int=0, trace: Callable=None, stats=None, reductions: Tuple[str, ...]=REDUCTIONS):
+        '''
+        :param endpoint: Endpoint with a volume tensor of shape (B, A, samples)
+        :param ascans: A-scans (within the B-scan) used for mean/min/max. All A-scans if none of these are in the B-scan.
+        :param aidx: Index of the selected A-scan (within the B-scan), clamped to the last A-scan
+        :param trace: Function (mean, min, max, ascan) -> plotted trace, works for numpy or cupy. Used for stats.
+        :param stats: StreamingStats fed with the plotted traces
+        :param reductions: Traces to compute, from REDUCTIONS. The others are left zero.
+        '''
+        self._endpoint = endpoint
+        self._ascans = ascans
+        self._aidx = aidx
+        self._trace = trace
+        self._stats = stats
+        self._reductions = tuple(r for r in REDUCTIONS if r in reductions)
+        self._lock = threading.Lock()
+        self._is_cuda = False
+        self._buffers = None        # [(host array (4, samples), event or None)] x 2
+        self._bidx = [-1, -1]
+        self._latest = -1
+
+    def update(self, bscan_idxs: Iterable[int]) -> bool:
+        '''Reduce the first B-scan in bscan_idxs. Call from the endpoint's segment callback.'''
+        if len(bscan_idxs) == 0:
+            return False
+        bidx = bscan_idxs[0]
+        collecting = self._stats is not None and self._trace is not None and self._stats.active
+        bscans = list(bscan_idxs) if collecting else slice(bidx, bidx + 1)
+        with self._endpoint.tensor as volume:
+            if self._buffers is None or self._buffers[0][0].shape[1] != volume.shape[-1]:
+                self._allocate(volume)
+            with self._lock:
+                # never write the buffer result() may be reading
+                which = 1 if self._latest == 0 else 0
+                (host, event) = self._buffers[which]
+                if self._is_cuda:
+                    import cupy
+                    stream = self._endpoint.stream
+                    with stream:
+                        reduced = self._reduce(cupy, volume[bscans])
+                        cupy.ascontiguousarray(reduced[:, 0]).get(stream=stream, out=host, blocking=False)
+                        event.record(stream)
+                        if collecting:
+                            self._stats.update(bscan_idxs, self._trace(*reduced))
+                else:
+                    reduced = self._reduce(np, volume[bscans])
+                    host[...] = reduced[:, 0]
+                    if collecting:
+                        self._stats.update(bscan_idxs, self._trace(*reduced))
+                self._bidx[which] = bidx
+                self._latest = which
+        return True
+
+    def result(self) -> Optional[TraceReduction]:
+        '''Latest reduction (a copy), or None if there is none yet or it is still being copied from the GPU.'''
+        with self._lock:
+            if self._latest < 0:
+                return None
+            (host, event) = self._buffers[self._latest]
+            if event is not None and not event.done:
+                return None
+            data = host.copy()
+            bidx = self._bidx[self._latest]
+        return TraceReduction(bidx, data[0], data[1], data[2], data[3])
+
+    def _reduce(self, xp, bscans):
+        # (4, B, samples), in REDUCTIONS order
+        na = bscans.shape[1]
+        ascans = self._ascans if len(range(*self._ascans.indices(na))) > 0 else slice(None)
+        b = bscans[:, ascans]
+        reduce = {'mean': lambda: b.mean(axis=1), 'min': lambda: b.min(axis=1), 'max': lambda: b.max(axis=1),
+                  'ascan': lambda: bscans[:, min(self._aidx, na - 1)]}
+        reduced = xp.zeros((len(REDUCTIONS), bscans.shape[0], bscans.shape[2]), dtype=xp.float32)
+        for (i, name) in enumerate(REDUCTIONS):
+            if name in self._reductions:
+                reduced[i] = reduce[name]()
+        return reduced
+
+    def _allocate(self, volume):
+        # anything that isn't a numpy array is a cupy array - cupy is only imported in that case
+        self._is_cuda = not isinstance(volume, np.ndarray)
+        shape = (4, volume.shape[-1])
+        buffers = []
+        for i in range(2):
+            if self._is_cuda:
+                import cupy
+                mem = cupy.cuda.alloc_pinned_memory(shape[0] * shape[1] * np.dtype(np.float32).itemsize)
+                buffers.append((np.frombuffer(mem, np.float32, shape[0] * shape[1]).reshape(shape), cupy.cuda.Event()))
+            else:
+                buffers.append((np.zeros(shape, np.float32), None))
+        with self._lock:
+            self._buffers = buffers
+            self._bidx = [-1, -1]
+            self._latest = -1
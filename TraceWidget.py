@@ -1,351 +1,105 @@
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-from qtpy.QtGui import QKeyEvent, QPaintEvent
-from qtpy.QtCore import Qt
+from qtpy.QtGui import QPaintEvent
 
-import numpy
-import cupy
 from typing import Iterable, List
-from qtpy.QtGui import QPaintEvent
-from typing import Tuple
+from TraceReducer import TraceReducer
+from TracePlot import TracePlot
 
-# Inheriting from FigureCanvasQTAgg. 
-# FigureCanvasQTAgg is a widget. Call update() to invalidate and trigger a paintEvent.
+# Inheriting from TracePlot, a QWidget that draws lines with QPainter.
+# Call update() to invalidate and trigger a paintEvent.
 
-class SpectraTraceWidget(FigureCanvas):
+class SpectraTraceWidget(TracePlot):
 
     def __init__(self, endpoint, parent=None, width=5, height=4, dpi=100, title=None):
+        super().__init__(parent, width, height, dpi, title=title)
         self._endpoint = endpoint
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self._axes = fig.add_subplot(111)
-        #self._axes.get_yaxis().set_visible(False)
-        if title:
-            self._axes.set_title(title)
-        fig.tight_layout()
-        self._line2d = None
-        self._xdata = None
         self._ydata = None
         self._invalidated = False
         self._bidx = 0
-        self._update_ylim_start_idx = -1
-        self._update_ylim_last_idx = -1
-        self._update_ylim = False
-        self._update_ylim_ready = False
-        self._ylim_temp = [999999,-999999]
-
-        # call flush() to force a re-draw of the line (including re-doing range)
-        self._is_flushed = False
 
-        # Will check if tensor is a cupy or numpy array on first time 
-        # accessing ydata. After that, assume the endpoint does not change.
-        self._is_cuda_known = False
-        self._is_cuda = False
-        super().__init__(fig)
-        self.setFocusPolicy(Qt.FocusPolicy.ClickFocus)
+        # look at ascan #105, less the mean of ascans 100-110
+        self._reducer = TraceReducer(endpoint, ascans=slice(100,111), aidx=105, trace=self.trace, stats=self.autoscale, reductions=('mean', 'ascan'))
 
-    def set_ylim(self, lim):
-        self._axes.set_ylim(lim[0], lim[1])
+    @staticmethod
+    def trace(mean, min, max, ascan):
+        return ascan - mean
 
-    def flush(self):
-        if self._axes is not None:
-            self._is_flushed = True
-            self._axes.clear()
-            self._line2d = None
-
-
-    def get_xy_data(self) -> Tuple[bool, bool]:
+    def get_ydata(self) -> bool:
         have_data = False
-        must_plot = False
-        if self._bidx >= 0:
-
-            with self._endpoint.tensor as volume:
-
-                if not self._is_cuda_known:
-                    # Do this just one time - check data type
-                    if isinstance(volume, cupy.ndarray):
-                        self._is_cuda = True
-                    else:
-                        self._is_cuda = False
-                    self._is_cuda_known = True
-                    #print("get_xy_data shape: ", self._axes.get_title(), self._endpoint.tensor.shape)
-
-                if self._is_cuda:
-                    with self._endpoint.stream:
-                        # self._ydata = volume[self._bidx].mean(axis=0).get()
-                        # print("volume[bidx]: ", cupy.shape(volume[self._bidx]))
-                        # print("volume[self._bidx].mean(axis=0).get()", numpy.shape(self._ydata))
-
-                        s=slice(100,111)
-                        ztmp = volume[self._bidx, s, :].get()
-                        zavg = ztmp.mean(axis=0)
-                        #print(numpy.shape(ztmp), numpy.shape(zavg))
-                        self._ydata = ztmp[5]-zavg
-
-                else:
-                    # look at ascan #105
-                    # get ascans 100-110
-                    s=slice(100,111)
-                    ztmp = volume[self._bidx, s, :]
-                    zavg = ztmp.mean(axis=0)
-                    #print(numpy.shape(ztmp), numpy.shape(zavg))
-                    self._ydata = ztmp[5]-zavg
-                    # self._ydata = volume[self._bidx].mean(axis=0)
-
-                if self._update_ylim and not self._update_ylim_ready:
-
-                    # This is true on the first time only.
-                    # 'start_idx' is the bscan index right now. We will watch the indices, 
-                    # and look for when the _new_ incoming index is LESS THAN the last one --
-                    # this is when the bscan finished a volume and started the next one.
-                    # Once we see that, we wait until the index is GREATER THAN the first one -- 
-                    # that means we've cycled through an entire volume.
-
-                    if self._update_ylim_start_idx<0:
-                        self._update_ylim_start_idx = self._bidx
-                        self._update_ylim_last_idx = self._bidx
-                        self._update_ylim_lap = False
-                        self._ylim_temp = [999999,-999999]
-
-                    # check how far we've cycled for ylim. Important that on first time through, 
-                    # the last_idx is set to current _bidx
-                    if not self._update_ylim_lap:
-                        if self._bidx < self._update_ylim_last_idx:
-                            self._update_ylim_lap = True
-                    else:
-                        if self._bidx > self._update_ylim_last_idx:
-                            self._update_ylim_ready = True
-
-                    self._update_ylim_last_idx = self._bidx
-                    ylow = numpy.min(self._ydata)
-                    yhi = numpy.max(self._ydata)
-                    if ylow < self._ylim_temp[0]:
-                        self._ylim_temp[0] = ylow
-                    if yhi > self._ylim_temp[1]:
-                        self._ylim_temp[1] = yhi
-                    #print("ylim update first {0:d} last {1:d}, lap , lim ({2:f},{3:f})".format(self._update_ylim_start_idx, self._update_ylim_last_idx, self._ylim_temp[0], self._ylim_temp[1]))
-            have_data = True
 
-            # check for x data
-            if self._xdata is None or len(self._ydata) != len(self._xdata):
-                self._xdata = list(range(1,len(self._ydata)+1))
-                must_plot = True
-
-            # flushed?
-            if self._is_flushed:
-                must_plot = True
-                self._is_flushed = False
+        # traces are reduced in update_trace (once per segment), here they are only read
+        reduction = self._reducer.result()
+        if reduction is not None:
+            self._bidx = reduction.bidx
+            self._ydata = self.trace(reduction.mean, reduction.min, reduction.max, reduction.ascan)
+            have_data = True
 
-        return (have_data, must_plot)
+        return have_data
 
 
     def paintEvent(self, e: QPaintEvent) -> None:
-        if not self._invalidated:
-            return
-
-        (have_data, must_plot) = self.get_xy_data()
-        if not have_data:
-            return
-        
-        if must_plot:
-            line2ds = self._axes.plot(self._xdata, self._ydata)
-            self._line2d = line2ds[0]
-        else:
-            self._line2d.set_ydata(self._ydata)
-
-        if self._update_ylim_ready:
-            self._update_ylim = False
-            self._update_ylim_ready = False
-            self._update_ylim_start_idx = -1
-            self._axes.set_ylim(self._ylim_temp[0], self._ylim_temp[1])
+        if self._invalidated and self.get_ydata():
+            self.set_line(0, self._ydata, (0.12,0.47,0.71))
+            self._invalidated = False
 
-        self._invalidated = False
-
-        self.draw()
         super().paintEvent(e)
 
 
     def update_trace(self, bscan_idxs: Iterable[int] = []):
-        # Set _invalidated to true and call update(). The update() call will move the actual update
-        # to the gui thread, not the daq thread.
+        # Reduce the bscan (on the endpoint's stream), set _invalidated to true and request a paint.
+        # The paint happens on the gui thread, not the daq thread.
 
-        if len(bscan_idxs) > 0:
-            self._bidx = bscan_idxs[0]
+        if self._reducer.update(bscan_idxs):
             self._invalidated = True
-            self.update()
-
-    def clear(self):
-        self._axes.clear()
+            self.request_paint()
 
-    def keyPressEvent(self, e: QKeyEvent) -> None:
-        if e.key() == Qt.Key.Key_Y:
-            if not self._update_ylim:
-                self._update_ylim = True
 
 
 
-
-class AscanTraceWidget(FigureCanvas):
+class AscanTraceWidget(TracePlot):
 
     def __init__(self, endpoint, parent=None, width=5, height=4, dpi=100, title=None):
+        super().__init__(parent, width, height, dpi, title=title, ylabel='dB', logy=True)
+        self.set_ylim((10, 100))
         self._endpoint = endpoint
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self._axes = fig.add_subplot(111)
-
-        #self._axes.get_yaxis().set_visible(False)
-        if title:
-            self._axes.set_title(title)
-        fig.tight_layout()
-        self._line2d = None
-        self._xdata = None
         self._ydata = None
         self._invalidated = False
         self._bidx = 0
-        self._update_ylim_start_idx = -1
-        self._update_ylim_last_idx = -1
-        self._update_ylim = False
-        self._update_ylim_ready = False
-        self._ylim_temp = [999999,-999999]
         self._aidx = 100        # this is the ascan, within the bscan at _bidx, that we will display
 
-        # call flush() to force a re-draw of the line (including re-doing range)
-        self._is_flushed = False
-
-        # Will check if tensor is a cupy or numpy array on first time 
-        # accessing ydata. After that, assume the endpoint does not change.
-        self._is_cuda_known = False
-        self._is_cuda = False
-        super().__init__(fig)
-        self.setFocusPolicy(Qt.FocusPolicy.ClickFocus)
-
-    def set_ylim(self, lim):
-        self._axes.set_ylim(lim[0], lim[1])
+        # mean of all ascans in the bscan
+        self._reducer = TraceReducer(endpoint, aidx=self._aidx, trace=self.trace, stats=self.autoscale, reductions=('mean',))
 
-    def flush(self):
-        if self._axes is not None:
-            self._is_flushed = True
-            self._axes.clear()
-            self._line2d = None
+    @staticmethod
+    def trace(mean, min, max, ascan):
+        # y values are not normalized or anything, straight from CUDA OCT calc.
+        return mean
 
-
-    def get_xy_data(self) -> Tuple[bool, bool]:
+    def get_ydata(self) -> bool:
         have_data = False
-        must_plot = False
-        if self._bidx >= 0:
-
-            with self._endpoint.tensor as volume:
-
-                if not self._is_cuda_known:
-                    # Do this just one time - check data type
-                    if isinstance(volume, cupy.ndarray):
-                        self._is_cuda = True
-                    else:
-                        self._is_cuda = False
-                    self._is_cuda_known = True
-
-
-                # get y values.  These are not normalized or anything, straight from CUDA OCT calc.
-                if self._is_cuda:
-                    with self._endpoint.stream:
-                        ytmp = volume[self._bidx].mean(axis=0).get()
-                else:
-                    ytmp = volume[self._bidx].mean(axis=0)
-
-                self._ydata = ytmp
-
-                if self._update_ylim and not self._update_ylim_ready:
-
-                    # This is true on the first time only.
-                    # 'start_idx' is the bscan index right now. We will watch the indices, 
-                    # and look for when the _new_ incoming index is LESS THAN the last one --
-                    # this is when the bscan finished a volume and started the next one.
-                    # Once we see that, we wait until the index is GREATER THAN the first one -- 
-                    # that means we've cycled through an entire volume.
-
-                    if self._update_ylim_start_idx<0:
-                        self._update_ylim_start_idx = self._bidx
-                        self._update_ylim_last_idx = self._bidx
-                        self._update_ylim_lap = False
-                        self._ylim_temp = [999999,-999999]
-
-                    # check how far we've cycled for ylim. Important that on first time through, 
-                    # the last_idx is set to current _bidx
-                    if not self._update_ylim_lap:
-                        if self._bidx < self._update_ylim_last_idx:
-                            self._update_ylim_lap = True
-                    else:
-                        if self._bidx > self._update_ylim_last_idx:
-                            self._update_ylim_ready = True
-
-                    self._update_ylim_last_idx = self._bidx
-                    ylow = numpy.min(self._ydata)
-                    yhi = numpy.max(self._ydata)
-                    if ylow < self._ylim_temp[0]:
-                        self._ylim_temp[0] = ylow
-                    if yhi > self._ylim_temp[1]:
-                        self._ylim_temp[1] = yhi
-                    #print("ylim update first {0:d} last {1:d}, lap , lim ({2:f},{3:f})".format(self._update_ylim_start_idx, self._update_ylim_last_idx, self._ylim_temp[0], self._ylim_temp[1]))
-            have_data = True
-
-            # check for x data
-            if self._xdata is None or len(self._ydata) != len(self._xdata):
-                self._xdata = list(range(1,len(self._ydata)+1))
-                must_plot = True
 
-            # flushed?
-            if self._is_flushed:
-                must_plot = True
-                self._is_flushed = False
+        # traces are reduced in update_trace (once per segment), here they are only read
+        reduction = self._reducer.result()
+        if reduction is not None:
+            self._bidx = reduction.bidx
+            self._ydata = self.trace(reduction.mean, reduction.min, reduction.max, reduction.ascan)
+            have_data = True
 
-        return (have_data, must_plot)
+        return have_data
 
 
     def paintEvent(self, e: QPaintEvent) -> None:
-        if not self._invalidated:
-            return
-
-        (have_data, must_plot) = self.get_xy_data()
-        if not have_data:
-            return
-        
-        if must_plot:
-            line2ds = self._axes.semilogy(self._xdata, self._ydata, 'r')
-            self._axes.grid()
-            self._axes.grid(which="minor", color="0.5")            
-            self._axes.grid(which="major", color="0.5")            
-            #self._axes.set_ylim(10**-1, 10**2)
-            self._axes.set_ylim(10, 100)
-            self._axes.set_ylabel('dB')
-            
-            self._line2d = line2ds[0]
-        else:
-            self._line2d.set_ydata(self._ydata)
-
-        if self._update_ylim_ready:
-            self._update_ylim = False
-            self._update_ylim_ready = False
-            self._update_ylim_start_idx = -1
-            self._axes.set_ylim(self._ylim_temp[0], self._ylim_temp[1])
-
-        self._invalidated = False
+        if self._invalidated and self.get_ydata():
+            self.set_line(0, self._ydata, (1,0,0))
+            self._invalidated = False
 
-        self.draw()
         super().paintEvent(e)
 
 
     def update_trace(self, bscan_idxs: Iterable[int] = []):
-        # Set _invalidated to true and call update(). The update() call will move the actual update
-        # to the gui thread, not the daq thread.
+        # Reduce the bscan (on the endpoint's stream), set _invalidated to true and request a paint.
+        # The paint happens on the gui thread, not the daq thread.
 
-        if len(bscan_idxs) > 0:
-            self._bidx = bscan_idxs[0]
+        if self._reducer.update(bscan_idxs):
             self._invalidated = True
-            self.update()
-
-    def clear(self):
-        self._axes.clear()
-
-    def keyPressEvent(self, e: QKeyEvent) -> None:
-        if e.key() == Qt.Key.Key_Y:
-            if not self._update_ylim:
-                self._update_ylim = True
+            self.request_paint()
 
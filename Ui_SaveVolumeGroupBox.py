@@ -28,6 +28,14 @@ class Ui_SaveVolumeGroupBox(object):
         self.pbSelectFolder.setObjectName("pbSelectFolder")
         self.verticalLayout.addWidget(self.pbSelectFolder)
         self.verticalLayout_2.addWidget(self.groupBox)
+        self.groupBox_4 = QtWidgets.QGroupBox(SaveVolumeGroupBox)
+        self.groupBox_4.setObjectName("groupBox_4")
+        self.horizontalLayout = QtWidgets.QHBoxLayout(self.groupBox_4)
+        self.horizontalLayout.setObjectName("horizontalLayout")
+        self.cbFormat = QtWidgets.QComboBox(self.groupBox_4)
+        self.cbFormat.setObjectName("cbFormat")
+        self.horizontalLayout.addWidget(self.cbFormat)
+        self.verticalLayout_2.addWidget(self.groupBox_4)
         self.groupBox_2 = QtWidgets.QGroupBox(SaveVolumeGroupBox)
         self.groupBox_2.setObjectName("groupBox_2")
         self.horizontalLayout_2 = QtWidgets.QHBoxLayout(self.groupBox_2)
@@ -59,6 +67,7 @@ class Ui_SaveVolumeGroupBox(object):
         self.groupBox.setTitle(_translate("SaveVolumeGroupBox", "Data folder"))
         self.labelFolder.setText(_translate("SaveVolumeGroupBox", "TextLabel"))
         self.pbSelectFolder.setText(_translate("SaveVolumeGroupBox", "Change"))
+        self.groupBox_4.setTitle(_translate("SaveVolumeGroupBox", "File format"))
         self.groupBox_2.setTitle(_translate("SaveVolumeGroupBox", "Save Fixed # of Volumes"))
         self.pbSaveFixedN.setText(_translate("SaveVolumeGroupBox", "Save Fixed N"))
         self.groupBox_3.setTitle(_translate("SaveVolumeGroupBox", "Save Volumes (user stop)"))
@@ -0,0 +1,106 @@
+from typing import Dict, List, Tuple, Optional
+import threading
+import tempfile
+import numpy as np
+from vortex import get_console_logger
+
+LOGGER = get_console_logger(__name__)
+
+class VolumeLease():
+    '''
+    A volume buffer borrowed from a VolumeArena. The buffer starts with a reference count of 1 (the borrower).
+    Each additional consumer (display, snapshot, disk writer) should call acquire() and later release(). When
+    the count drops to zero the buffer goes back to the arena for reuse. Do not use data after the last release().
+    '''
+    def __init__(self, arena, key: Tuple[Tuple[int, ...], str], data: np.ndarray):
+        self._arena = arena
+        self._key = key
+        self._data = data
+        self._count = 1
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data
+
+    def acquire(self):
+        with self._arena._lock:
+            if self._count <= 0:
+                raise RuntimeError("Cannot acquire a volume that has been returned to the arena")
+            self._count += 1
+        return self
+
+    def release(self):
+        with self._arena._lock:
+            if self._count <= 0:
+                raise RuntimeError("Volume released too many times")
+            self._count -= 1
+            if self._count == 0:
+                self._arena._free[self._key].append(self._data)
+
+
+class VolumeArena():
+    '''
+    Pool of reusable (page-locked, if cupy is available) host buffers for whole volumes. Buffers are keyed by
+    shape and dtype. A buffer is only handed out again after every consumer of its lease has released it.
+    '''
+    def __init__(self, pinned: bool=True, max_buffers: int=0, spill_dir: str=None):
+        '''
+        :param pinned: Use page-locked memory if cupy is available
+        :param max_buffers: Maximum buffers of a single shape/dtype (0 for no limit). When the limit is
+            reached, borrow() returns None.
+        :param spill_dir: If set, buffers are memory-mapped temporary files in this folder (not pinned)
+        '''
+        self._pinned = pinned and spill_dir is None
+        self._max_buffers = max_buffers
+        self._spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._free: Dict[Tuple[Tuple[int, ...], str], List[np.ndarray]] = {}
+        self._allocated: Dict[Tuple[Tuple[int, ...], str], int] = {}
+
+    def borrow(self, shape: Tuple[int, ...], dtype) -> Optional[VolumeLease]:
+        '''A buffer of this shape and dtype, or None if max_buffers are leased or a new buffer cannot be allocated.'''
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if free:
+                return VolumeLease(self, key, free.pop())
+            if self._max_buffers > 0 and self._allocated.get(key, 0) >= self._max_buffers:
+                return None
+            self._allocated[key] = self._allocated.get(key, 0) + 1
+        try:
+            data = self._allocate(key[0], np.dtype(dtype))
+        except (MemoryError, OSError) as e:
+            # borrowers run on engine threads - give back the slot and report no buffer instead of raising
+            LOGGER.warn("Cannot allocate a volume buffer {0:s} ({1:s})".format(str(key[0]), str(e)))
+            with self._lock:
+                self._allocated[key] -= 1
+            return None
+        return VolumeLease(self, key, data)
+
+    def trim(self):
+        '''Drop all buffers not currently leased.'''
+        with self._lock:
+            for key, free in self._free.items():
+                self._allocated[key] -= len(free)
+                free.clear()
+
+    @property
+    def nbytes(self) -> int:
+        '''Total bytes allocated by the arena, leased or not.'''
+        with self._lock:
+            return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize * n for (shape, dtype), n in self._allocated.items())
+
+    def _allocate(self, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        count = int(np.prod(shape))
+        if self._spill_dir is not None:
+            # the file is deleted when the buffer is garbage collected
+            return np.memmap(tempfile.TemporaryFile(dir=self._spill_dir), dtype=dtype, mode='w+', shape=shape)
+        if self._pinned:
+            try:
+                import cupy
+                mem = cupy.cuda.alloc_pinned_memory(count * dtype.itemsize)
+                return np.frombuffer(mem, dtype, count).reshape(shape)
+            except Exception as e:
+                LOGGER.warn("Cannot allocate pinned memory ({0:s}), using pageable memory".format(str(e)))
+                self._pinned = False
+        return np.empty(shape, dtype)
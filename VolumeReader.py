@@ -0,0 +1,232 @@
+from typing import Tuple, Dict, Any, Iterator, Optional
+from pathlib import Path
+import numpy as np
+import logging
+import sys
+
+LOGGER = logging.getLogger('VolumeReader')
+
+
+class VolumeReader():
+    '''
+    Random access to volumes saved by VolumeWriter, without loading the file. The data has shape
+    (volumes, B, A, samples, 1). npy files are memory-mapped, HDF5 and zarr files are read chunk by chunk,
+    so only the slices asked for are read from disk.
+
+    Slices are returned as numpy arrays. For npy files they are views into the memory map - copy them
+    if they are kept after the reader is closed.
+
+    npy files saved by earlier versions of OCTUi.volumeCallback (vortex SimpleStack storage) have shape
+    (B, A, samples, 1), with the volumes one after another. They are read as (volumes, B, A, samples, 1).
+    '''
+    def __init__(self, path: str, bscans_per_volume: int=0):
+        '''
+        :param path: .npy, .h5 or .zarr file written by VolumeWriter (or OCTUi.volumeCallback)
+        :param bscans_per_volume: B-scans per volume, for npy files of shape (B, A, samples, 1). Default is B from
+            the header, which is right unless the header counts the B-scans of all volumes.
+        '''
+        self._path = Path(path)
+        self._file = None
+        self._attrs: Dict[str, Any] = {}
+        suffix = self._path.suffix.lower()
+        if suffix == '.npy':
+            self._data = _memmap_npy(self._path, bscans_per_volume)
+        elif suffix in ['.h5', '.hdf5']:
+            import h5py
+            import hdf5plugin   # registers the blosc filter
+            self._file = h5py.File(self._path, 'r')
+            self._data = self._file['volumes']
+            self._attrs = dict(self._data.attrs)
+        elif suffix == '.zarr':
+            import zarr
+            self._data = zarr.open(str(self._path), mode='r')
+            self._attrs = dict(self._data.attrs)
+        else:
+            raise ValueError("Unknown volume file type: {0:s}".format(str(path)))
+        if len(self._data.shape) != 5:
+            raise ValueError("Expecting volumes of shape (volumes, B, A, samples, 1), got {0:s}".format(str(self._data.shape)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._data = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(self._data.shape)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self._data.dtype)
+
+    @property
+    def attrs(self) -> Dict[str, Any]:
+        '''Metadata saved with the volumes (HDF5 and zarr only).'''
+        return self._attrs
+
+    @property
+    def volumes(self) -> int:
+        return self._data.shape[0]
+
+    @property
+    def bscans_per_volume(self) -> int:
+        return self._data.shape[1]
+
+    @property
+    def ascans_per_bscan(self) -> int:
+        return self._data.shape[2]
+
+    @property
+    def samples_per_ascan(self) -> int:
+        return self._data.shape[3]
+
+    def volume(self, v: int) -> np.ndarray:
+        '''Volume v, shape (B, A, samples). Reads the whole volume.'''
+        return np.asarray(self._data[v, :, :, :, 0])
+
+    def bscan(self, v: int, b: int) -> np.ndarray:
+        '''B-scan b of volume v, shape (A, samples).'''
+        return np.asarray(self._data[v, b, :, :, 0])
+
+    def ascan(self, v: int, b: int, a: int) -> np.ndarray:
+        '''A-scan a of B-scan b of volume v, shape (samples,).'''
+        return np.asarray(self._data[v, b, a, :, 0])
+
+    def enface(self, v: int, samples: int|slice) -> np.ndarray:
+        '''
+        En face slice of volume v at sample index samples, shape (B, A). If samples is a slice, the
+        mean over those samples is returned. This reads every B-scan of the volume.
+        '''
+        if isinstance(samples, slice):
+            return np.stack([self._data[v, b, :, samples, 0].mean(axis=-1) for b in range(self.bscans_per_volume)])
+        return np.stack([self._data[v, b, :, samples, 0] for b in range(self.bscans_per_volume)])
+
+    def blocks(self, ascans_per_block: int, volumes: Optional[range]=None) -> Iterator[np.ndarray]:
+        '''
+        A-scans in acquisition order, in blocks shaped like the engine's spectra blocks
+        (ascans_per_block, samples, 1). Blocks run across B-scan and volume boundaries. The last block is
+        shorter if the A-scans do not divide evenly.
+
+        :param ascans_per_block: A-scans in each block (VtxEngineParams.ascans_per_block)
+        :param volumes: Volumes to read (default is all)
+        '''
+        if volumes is None:
+            volumes = range(self.volumes)
+        (nb, na) = (self.bscans_per_volume, self.ascans_per_bscan)
+        if isinstance(self._data, np.ndarray) and volumes.step == 1:
+            # memory map is contiguous, so blocks are views
+            ascans = self._data[volumes.start:volumes.stop].reshape((-1,) + self._data.shape[3:])
+            for i in range(0, ascans.shape[0], ascans_per_block):
+                yield ascans[i:i+ascans_per_block]
+            return
+        pending = []
+        npending = 0
+        for v in volumes:
+            for b in range(nb):
+                bscan = np.asarray(self._data[v, b])
+                a = 0
+                while a < na:
+                    n = min(na - a, ascans_per_block - npending)
+                    pending.append(bscan[a:a+n])
+                    npending += n
+                    a += n
+                    if npending == ascans_per_block:
+                        yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+                        pending = []
+                        npending = 0
+        if npending > 0:
+            yield np.concatenate(pending)
+
+
+def _memmap_npy(path: Path, bscans_per_volume: int=0) -> np.memmap:
+    '''
+    Memory-map a .npy file of volumes. A file that was not closed properly (e.g. acquisition crashed while
+    saving) has a volume count of 0 in its header, so the count is taken from the file size instead.
+
+    A file of shape (B, A, samples, 1) is mapped as (volumes, B, A, samples, 1), with volumes from the file size.
+    '''
+    with path.open('rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            (shape, fortran_order, dtype) = np.lib.format.read_array_header_1_0(f)
+        else:
+            (shape, fortran_order, dtype) = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if fortran_order:
+        raise ValueError("Fortran-ordered arrays are not supported: {0:s}".format(str(path)))
+    if len(shape) == 4:
+        bscan_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+        bscans = (path.stat().st_size - offset) // bscan_bytes if bscan_bytes > 0 else 0
+        nb = bscans_per_volume if bscans_per_volume > 0 else shape[0]
+        if nb <= 0:
+            raise ValueError("{0:s}: B-scans per volume unknown, give bscans_per_volume".format(str(path)))
+        if bscans % nb != 0:
+            LOGGER.warning("{0:s}: {1:d} B-scans is not a whole number of {2:d}-B-scan volumes, the last {3:d} are skipped".format(str(path), bscans, nb, bscans % nb))
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(bscans // nb, nb) + tuple(shape[1:]))
+    volume_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+    volumes = (path.stat().st_size - offset) // volume_bytes if volume_bytes > 0 else 0
+    if volumes != shape[0]:
+        LOGGER.warning("{0:s}: header has {1:d} volumes, file holds {2:d}".format(str(path), shape[0], volumes))
+    shape = (min(volumes, shape[0]) if shape[0] > 0 else volumes,) + tuple(shape[1:])
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+
+def _self_test():
+    '''Write small files in the current and the legacy (B, A, samples, 1) npy layouts, and check they read back.'''
+    from tempfile import TemporaryDirectory
+    (nv, nb, na, ns) = (3, 4, 5, 6)
+    vols = np.arange(nv * nb * na * ns, dtype=np.uint16).reshape(nv, nb, na, ns, 1)
+    with TemporaryDirectory() as tmp:
+        current = Path(tmp) / 'current.npy'
+        np.save(current, vols)
+        # SimpleStack header is the shape of one volume, with the volumes appended after it
+        legacy = Path(tmp) / 'legacy.npy'
+        with legacy.open('wb') as f:
+            np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(vols.dtype), 'fortran_order': False, 'shape': (nb, na, ns, 1)})
+            f.write(vols.tobytes())
+        # a header that counts the B-scans of all volumes needs bscans_per_volume
+        all_bscans = Path(tmp) / 'all_bscans.npy'
+        np.save(all_bscans, vols.reshape(nv * nb, na, ns, 1))
+        for (path, bscans_per_volume) in [(current, 0), (legacy, 0), (all_bscans, nb)]:
+            with VolumeReader(str(path), bscans_per_volume) as r:
+                assert r.shape == vols.shape, "{0:s}: shape {1:s}".format(path.name, str(r.shape))
+                assert np.array_equal(r.volume(nv - 1), vols[nv - 1, ..., 0]), path.name
+                assert np.array_equal(np.concatenate(list(r.blocks(7))), vols.reshape(-1, ns, 1)), path.name
+    print("VolumeReader self test passed")
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO)
+
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+    parser = ArgumentParser(description='Show the contents of a saved volume file.', formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('path', nargs='?', default='', help='.npy, .h5 or .zarr file')
+    parser.add_argument('--ascans-per-block', type=int, default=0, help='also count the engine blocks in the file')
+    parser.add_argument('--bscans', type=int, default=0, help='B-scans per volume, for npy files of shape (B, A, samples, 1) (default from the header)')
+    parser.add_argument('--self-test', action='store_true', help='check that files in the current and legacy layouts can be read')
+    args = parser.parse_args()
+
+    if args.self_test:
+        _self_test()
+        sys.exit(0)
+    if not args.path:
+        parser.error('path is required')
+
+    with VolumeReader(args.path, args.bscans) as r:
+        print("{0:s}: {1:d} volumes of {2:d} x {3:d} x {4:d}, {5:s}".format(str(r.path), r.volumes, r.bscans_per_volume, r.ascans_per_bscan, r.samples_per_ascan, str(r.dtype)))
+        for (k, v) in r.attrs.items():
+            print("  {0:s}: {1:s}".format(k, str(v)))
+        if args.ascans_per_block > 0:
+            print("{0:d} blocks of {1:d} ascans".format(sum(1 for _ in r.blocks(args.ascans_per_block)), args.ascans_per_block))
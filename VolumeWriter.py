@@ -0,0 +1,350 @@
+from dataclasses import dataclass
+from typing import Tuple, Callable, Optional, Dict, List
+from time import perf_counter, sleep
+from queue import Queue, Full, Empty
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from importlib.metadata import version, PackageNotFoundError
+from enum import Enum
+import threading
+import numpy as np
+from vortex import get_console_logger
+from VolumeArena import VolumeArena, VolumeLease
+
+LOGGER = get_console_logger(__name__)
+
+# npy header is written with a fixed size, so the volume count can be filled in when the file is closed
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+_NPY_HEADER_BYTES = 256
+
+class StorageFormat(Enum):
+    NPY = 0         # raw .npy, readable with np.load/np.memmap
+    HDF5 = 1        # chunked per B-scan, blosc compressed. Readers need hdf5plugin.
+    ZARR = 2        # chunked per B-scan, blosc compressed
+
+    @property
+    def extension(self) -> str:
+        return _EXTENSIONS[self]
+
+    @property
+    def available(self) -> bool:
+        '''True if the modules needed to write this format can be imported, in a version the writer supports.'''
+        return all(_module_ok(m) for m in _REQUIRES[self])
+
+_EXTENSIONS = {StorageFormat.NPY: '.npy', StorageFormat.HDF5: '.h5', StorageFormat.ZARR: '.zarr'}
+_REQUIRES = {StorageFormat.NPY: [], StorageFormat.HDF5: ['h5py', 'hdf5plugin', 'numcodecs'], StorageFormat.ZARR: ['zarr', 'numcodecs']}
+# _ZarrStorage uses the zarr 2 API (compressor=, dimension_separator=, writes to array.store)
+_MAX_MAJOR_VERSION = {'zarr': 2}
+
+def _module_ok(module: str) -> bool:
+    if find_spec(module) is None:
+        return False
+    if module not in _MAX_MAJOR_VERSION:
+        return True
+    try:
+        major = int(version(module).split('.')[0])
+    except (PackageNotFoundError, ValueError):
+        return False
+    return major <= _MAX_MAJOR_VERSION[module]
+
+def available_formats() -> List[StorageFormat]:
+    return [f for f in StorageFormat if f.available]
+
+@dataclass
+class VolumeWriterStats:
+    queued: int = 0             # volumes waiting to be written
+    max_queued: int = 0         # most volumes waiting at once
+    written: int = 0
+    dropped: int = 0            # volumes not saved because the queue was full
+    bytes_written: int = 0      # uncompressed size of volumes written
+    bytes_stored: int = 0       # size of volumes written, after compression
+    elapsed: float = 0.0        # seconds since the file was opened
+    write_time: float = 0.0     # seconds spent in file writes
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes_written / 2**20 / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.bytes_written / self.bytes_stored if self.bytes_stored > 0 else 1.0
+
+
+class _NpyStorage():
+    '''Volumes are appended to a .npy file. The volume count in the header is filled in on close.'''
+    def __init__(self, path: str, shape: Tuple[int, ...], dtype: np.dtype, attrs: Dict[str, str], codec: str, workers: int):
+        self._shape = shape
+        self._dtype = dtype
+        self._file = open(path, 'wb')
+        self._writeHeader(0)
+
+    def write(self, data: np.ndarray) -> int:
+        self._file.write(memoryview(data).cast('B'))
+        return data.nbytes
+
+    def close(self, volumes: int):
+        try:
+            self._file.seek(0)
+            self._writeHeader(volumes)
+        finally:
+            self._file.close()
+
+    def _writeHeader(self, volumes: int):
+        header = "{{'descr': {0!r}, 'fortran_order': False, 'shape': {1!r}, }}".format(np.lib.format.dtype_to_descr(self._dtype), (volumes,) + self._shape)
+        header_len = _NPY_HEADER_BYTES - len(_NPY_MAGIC) - 2
+        self._file.write(_NPY_MAGIC + np.uint16(header_len).tobytes() + header.ljust(header_len - 1).encode('latin1') + b'\n')
+
+
+class _HDF5Storage():
+    '''
+    Volumes go in the dataset 'volumes', shape (volumes, *shape), one chunk per B-scan. B-scans are compressed
+    on the worker pool (blosc releases the GIL) and written with write_direct_chunk, so the HDF5 library (which
+    is not thread safe) is only called from the writer thread.
+    '''
+    def __init__(self, path: str, shape: Tuple[int, ...], dtype: np.dtype, attrs: Dict[str, str], codec: str, workers: int):
+        import h5py
+        import hdf5plugin
+        from numcodecs import Blosc
+        self._shape = shape
+        self._codec = Blosc(cname=codec, clevel=5, shuffle=Blosc.SHUFFLE)
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='VolumeWriter-blosc')
+        self._file = h5py.File(path, 'w')
+        self._dataset = self._file.create_dataset('volumes', shape=(0,) + shape, maxshape=(None,) + shape, chunks=(1, 1) + shape[1:], dtype=dtype,
+                                                  **hdf5plugin.Blosc(cname=codec, clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+        self._dataset.attrs.update(attrs)
+
+    def write(self, data: np.ndarray) -> int:
+        n = self._dataset.shape[0]
+        self._dataset.resize(n + 1, axis=0)
+        stored = 0
+        zeros = (0,) * (len(self._shape) - 1)
+        for (b, chunk) in enumerate(self._pool.map(self._codec.encode, data)):
+            self._dataset.id.write_direct_chunk((n, b) + zeros, chunk)
+            stored += len(chunk)
+        return stored
+
+    def close(self, volumes: int):
+        self._pool.shutdown()
+        self._file.close()
+
+
+class _ZarrStorage():
+    '''
+    Volumes go in a zarr array of shape (volumes, *shape), one chunk per B-scan. Chunks are independent, so
+    B-scans are compressed and stored in parallel on the worker pool. Chunks are encoded here and put in the
+    store directly, so the stored size is known without listing the store.
+    '''
+    def __init__(self, path: str, shape: Tuple[int, ...], dtype: np.dtype, attrs: Dict[str, str], codec: str, workers: int):
+        import zarr
+        from numcodecs import Blosc
+        self._shape = shape
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='VolumeWriter-zarr')
+        self._codec = Blosc(cname=codec, clevel=5, shuffle=Blosc.SHUFFLE)
+        self._array = zarr.open(path, mode='w', shape=(0,) + shape, chunks=(1, 1) + shape[1:], dtype=dtype,
+                                compressor=self._codec, dimension_separator='.')
+        self._array.attrs.update(attrs)
+
+    def write(self, data: np.ndarray) -> int:
+        n = self._array.shape[0]
+        self._array.resize((n + 1,) + self._shape)
+        zeros = ('0',) * (len(self._shape) - 1)
+        def store(b: int) -> int:
+            chunk = self._codec.encode(np.ascontiguousarray(data[b]))
+            self._array.store['.'.join((str(n), str(b)) + zeros)] = chunk
+            return len(chunk)
+        return sum(self._pool.map(store, range(data.shape[0])))
+
+    def close(self, volumes: int):
+        self._pool.shutdown()
+
+_STORAGE = {StorageFormat.NPY: _NpyStorage, StorageFormat.HDF5: _HDF5Storage, StorageFormat.ZARR: _ZarrStorage}
+
+
+class VolumeWriter():
+    '''
+    Writes volumes to a file on its own thread, so a slow disk does not hold up the engine's callback
+    thread (and block recycling). submit() copies the volume into a buffer borrowed from the arena and puts it
+    on a bounded queue. If the queue is full the volume is dropped and counted, acquisition is never blocked.
+    close() never blocks either - the writer thread finishes the queue and closes the file.
+
+    The file holds an array of shape (volumes, *shape), in one of the StorageFormats.
+    '''
+    def __init__(self, path: str, shape: Tuple[int, ...], dtype, arena: VolumeArena=None, count: int=0, max_queued: int=4, finished: Callable[[VolumeWriterStats], None]=None,
+                 format: StorageFormat=StorageFormat.NPY, attrs: Dict[str, str]=None, codec: str='lz4', workers: int=4):
+        '''
+        :param path: File to write
+        :param shape: Shape of a single volume
+        :param dtype: Volume data type
+        :param arena: Buffers for queued volumes. If None, buffers are allocated for each volume.
+        :param count: Close after this many volumes have been accepted for writing - dropped volumes don't count (0 means until close() is called)
+        :param max_queued: Maximum volumes waiting to be written
+        :param finished: Called (on the writer thread) with final stats after the file is closed
+        :param format: File format
+        :param attrs: Metadata saved with the volumes (HDF5 and zarr only)
+        :param codec: blosc compressor (e.g. 'lz4', 'zstd') for the compressed formats
+        :param workers: Threads used to compress B-scans
+        '''
+        self._path = path
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        self._arena = arena
+        self._count = count
+        self._finished = finished
+        self._queue = Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._stats = VolumeWriterStats()
+        self._accepted = 0
+        self._submitting = 0        # submit() calls between the closing check and the put
+        self._closing = False
+        self._closed = threading.Event()
+        self._t0 = perf_counter()
+        self._storage = _STORAGE[format](path, self._shape, self._dtype, attrs or {}, codec, workers)
+        self._thread = threading.Thread(target=self._run, name='VolumeWriter', daemon=True)
+        self._thread.start()
+        LOGGER.info("Saving volumes {0:s} to {1:s} ({2:s}, queue {3:d})".format(str(self._shape), path, format.name, max_queued))
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def closing(self) -> bool:
+        return self._closing
+
+    @property
+    def stats(self) -> VolumeWriterStats:
+        with self._lock:
+            s = VolumeWriterStats(**vars(self._stats))
+        s.queued = self._queue.qsize()
+        if self._thread.is_alive():
+            s.elapsed = perf_counter() - self._t0
+        return s
+
+    def submit(self, volume) -> bool:
+        '''
+        Queue a copy of volume (numpy or cupy) for writing. Call from the engine callback, while the endpoint
+        tensor is held. Returns False if the volume was dropped, or if the writer is closing.
+        '''
+        (accepted, _) = self._submit(volume, False)
+        return accepted
+
+    def submit_shared(self, volume) -> Optional[VolumeLease]:
+        '''
+        Like submit(), but the caller shares the arena buffer holding the copy, so it need not copy the volume
+        again. Returns the lease (release it when done), or None if the volume was dropped, the writer is
+        closing, or the copy is not in an arena buffer (no arena, or the arena is used up).
+        '''
+        (_, lease) = self._submit(volume, True)
+        return lease
+
+    def _submit(self, volume, share: bool) -> Tuple[bool, Optional[VolumeLease]]:
+        with self._lock:
+            if self._closing:
+                return (False, None)
+            self._submitting += 1
+        accepted = False
+        shared = None
+        if self._queue.full():
+            self._drop()
+        else:
+            lease = None
+            if self._arena is not None:
+                lease = self._arena.borrow(self._shape, self._dtype)
+            data = np.empty(self._shape, self._dtype) if lease is None else lease.data
+            if isinstance(volume, np.ndarray):
+                np.copyto(data, volume.reshape(self._shape))
+            else:
+                volume.reshape(self._shape).get(out=data)
+            # the caller's reference is taken before the writer thread can see (and release) the lease
+            if share and lease is not None:
+                shared = lease.acquire()
+            try:
+                self._queue.put_nowait((data, lease))
+                accepted = True
+            except Full:
+                if lease is not None:
+                    lease.release()
+                if shared is not None:
+                    shared.release()
+                    shared = None
+                self._drop()
+        with self._lock:
+            self._submitting -= 1
+            if accepted:
+                self._accepted += 1
+                self._stats.max_queued = max(self._stats.max_queued, self._queue.qsize())
+            last = accepted and self._count > 0 and self._accepted >= self._count
+        if last:
+            self.close()
+        return (accepted, shared)
+
+    def close(self):
+        '''Stop accepting volumes. The file is closed after queued volumes are written.'''
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+        # Called from the engine callback (by submit()) too, so it must not wait for the queue - the
+        # writer thread polls for this.
+        self._closed.set()
+
+    def wait(self, timeout: Optional[float]=None) -> bool:
+        '''Wait for the file to be closed. Returns False on timeout.'''
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _drop(self):
+        with self._lock:
+            self._stats.dropped += 1
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=0.1)
+                except Empty:
+                    # done when closed, with nothing queued and no submit() about to queue something
+                    if self._closed.is_set():
+                        with self._lock:
+                            if self._submitting == 0 and self._queue.empty():
+                                break
+                    continue
+                data, lease = item
+                t = perf_counter()
+                try:
+                    stored = self._storage.write(data)
+                finally:
+                    if lease is not None:
+                        lease.release()
+                dt = perf_counter() - t
+                with self._lock:
+                    self._stats.written += 1
+                    self._stats.bytes_written += data.nbytes
+                    self._stats.bytes_stored += stored
+                    self._stats.write_time += dt
+        except Exception as e:
+            LOGGER.error("Error writing {0:s}: {1:s}".format(self._path, str(e)))
+            with self._lock:
+                self._closing = True
+            # a submit() already past the closing check may still queue a volume - wait for it, then
+            # release anything still queued
+            while True:
+                with self._lock:
+                    if self._submitting == 0:
+                        break
+                sleep(0.001)
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item[1] is not None:
+                    item[1].release()
+        finally:
+            try:
+                self._storage.close(self._stats.written)
+            except Exception as e:
+                LOGGER.error("Error closing {0:s}: {1:s}".format(self._path, str(e)))
+            with self._lock:
+                self._stats.elapsed = perf_counter() - self._t0
+        s = self.stats
+        LOGGER.info("Closed {0:s}: {1:d} volumes written, {2:d} dropped, {3:.1f} MB/s, compression {4:.2f}x, max queued {5:d}".format(self._path, s.written, s.dropped, s.mb_per_second, s.compression_ratio, s.max_queued))
+        if self._finished is not None:
+            self._finished(s)
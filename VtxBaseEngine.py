@@ -6,12 +6,17 @@ from vortex.io import DAQmxIO, DAQmxConfig, daqmx
 from VtxEngineParams import VtxEngineParams, AcquisitionType
 from DAQConst import getAlazarChannel
 import numpy as np
-from typing import Tuple
+from typing import Tuple, Deque
+from collections import deque
+from functools import lru_cache
+from time import perf_counter
 
 LOGGER = get_console_logger(__name__)
 class VtxBaseEngine():
     def __init__(self, cfg: VtxEngineParams):
 
+        self._change_times = deque(maxlen=100)
+
         #
         # acquisition
         #
@@ -197,12 +202,40 @@ class VtxBaseEngine():
             self._io_out = None
 
 
-    def get_spectral_filter(self, dispersion: Tuple[float, float], samples_per_record: int) -> np.ndarray:
-        window = np.hanning(samples_per_record)
-        phasor = dispersion_phasor(len(window), list(dispersion))
-        filter = window * phasor
-        return filter
+    def get_spectral_filter(self, dispersion: Tuple[float, float], samples_per_record: int, window: str = 'hanning') -> np.ndarray:
+        return _spectral_filter(tuple(dispersion), samples_per_record, window)
+
+    def update_dispersion(self, dispersion: Tuple[float, float]) -> float:
+        """Apply new dispersion to the processor. 
+
+        Args:
+            dispersion (Tuple[float, float]): dispersion (c2, c3)
 
-    def update_dispersion(self, dispersion: Tuple[float, float]):
+        Returns:
+            float: time, in seconds, that processor.change() took
+        """
         self._processor_config.spectral_filter = self.get_spectral_filter(dispersion, self._samples_per_record)
+        t0 = perf_counter()
         self._processor.change(self._processor_config)
+        dt = perf_counter() - t0
+        self._change_times.append(dt)
+        return dt
+
+    @property
+    def change_times(self) -> Deque[float]:
+        """Durations (s) of the most recent processor.change() calls"""
+        return self._change_times
+
+
+# Filters are cached, so that stepping back and forth through dispersion values 
+# does not recompute them.
+_WINDOWS = {'hanning': np.hanning, 'hamming': np.hamming, 'blackman': np.blackman}
+
+@lru_cache(maxsize=128)
+def _spectral_filter(dispersion: Tuple[float, float], samples_per_record: int, window: str) -> np.ndarray:
+    w = _WINDOWS[window](samples_per_record)
+    phasor = dispersion_phasor(len(w), list(dispersion))
+    result = w * phasor
+    # every caller with the same arguments gets this same array
+    result.flags.writeable = False
+    return result
@@ -6,14 +6,19 @@ from vortex.io import DAQmxIO, DAQmxConfig, daqmx
 from vortex.format import StackFormatExecutorConfig, StackFormatExecutor
 from vortex.storage import SimpleStackUInt16
 from typing import Tuple, Any, List
+from dataclasses import replace
 from OCTUiParams import OCTUiParams
 from ScanGUIHelper import ScanGUIHelper
+from VolumeArena import VolumeArena
+
+# Most host volume buffers of one shape in the engine arena. Enough for a VolumeWriter queue 
+# (OCTUi default 4) plus the volume being written; past this, borrowers get None and fall back 
+# to pageable memory, so page-locked memory cannot grow without bound.
+ARENA_MAX_BUFFERS = 8
 
 class VtxEngine(VtxBaseEngine):
     def __init__(self, params: OCTUiParams, helpers: List[ScanGUIHelper]):
 
-        cfg = params.vtx
-
         # base class 
         super().__init__(params.vtx)
         self._logger = get_console_logger(__name__)
@@ -22,6 +27,114 @@ class VtxEngine(VtxBaseEngine):
         # self._octprocess  - CUDA based processing
         # self._io_out
 
+        # Keep a copy of the engine parameters used to build the base class. If these 
+        # are unchanged at the next Start, the acquisition/processing parts are reused.
+        self._vtx = replace(params.vtx)
+        self._strobe = None
+        self._engine = None
+        self._attached = set()
+        self._peak_memory = {}
+
+        # Page-locked host volume buffers for saving, capped at ARENA_MAX_BUFFERS per shape
+        self._arena = VolumeArena(max_buffers=ARENA_MAX_BUFFERS)
+
+        # In lazy mode, only the current scan gets components now. Any components left 
+        # over from a previous engine were made with other engine params, so drop them.
+        attach = self._helpers_to_attach(params, helpers)
+        for helper in helpers:
+            if helper not in attach:
+                helper.releaseEngineComponents()
+        self._build_engine(params, attach, reuse_components=False)
+
+    def is_compatible(self, params: OCTUiParams) -> bool:
+        """Check whether the acquisition, processor and IO built for this engine can be 
+        used with params. Dispersion is ignored, because it can be changed on a running engine.
+
+        Args:
+            params (OCTUiParams): current parameters
+
+        Returns:
+            bool: True if this engine can be restarted without rebuilding the base engine.
+        """
+        return replace(self._vtx, dispersion=params.vtx.dispersion) == params.vtx
+
+    def restart(self, params: OCTUiParams, helpers: List[ScanGUIHelper]) -> bool:
+        """Prepare a stopped engine for a warm restart. Caller should check is_compatible() first. 
+        Helpers whose scan parameters have not changed keep their endpoints and plots. If no helper 
+        changed, the engine itself (and its allocated blocks) is reused, and prepared again. 
+
+        Args:
+            params (OCTUiParams): current parameters
+            helpers (List[ScanGUIHelper]): helpers, same list used to create this engine
+
+        Returns:
+            bool: True if the engine was reused as-is, False if it was rebuilt.
+        """
+        if self._vtx.dispersion != params.vtx.dispersion:
+            self.update_dispersion(params.vtx.dispersion)
+            self._vtx.dispersion = params.vtx.dispersion
+
+        attach = self._helpers_to_attach(params, helpers)
+        stale = [helper.name for helper in attach if helper.name not in self._attached or helper.componentsAreStale()]
+        if self._engine is not None and not stale:
+            self._logger.info('Warm restart, reusing engine.')
+            for helper in attach:
+                helper.components.format_planner.reset()
+            # prepare() again so the engine starts from a clean state; blocks already allocated are kept
+            self._engine.prepare()
+            return True
+
+        self._logger.info('Warm restart, rebuilding components for {0:s}'.format(', '.join(stale)))
+        self._engine = None
+        self._build_engine(params, attach, reuse_components=True)
+        return False
+
+    @property
+    def arena(self) -> VolumeArena:
+        """Page-locked host volume buffers, at most ARENA_MAX_BUFFERS of each shape/dtype. 
+        borrow() returns None when they are all leased."""
+        return self._arena
+
+    def is_attached(self, helper: ScanGUIHelper) -> bool:
+        """True if the helper's formatter and endpoints are part of the engine"""
+        return helper.name in self._attached
+
+    def attach_current(self, params: OCTUiParams, helpers: List[ScanGUIHelper]):
+        """Lazy mode: build components for the current scan (params.scn.current_index) and 
+        rebuild the engine with it attached. Components of scans already attached are reused. 
+        The engine must be stopped.
+
+        Args:
+            params (OCTUiParams): current parameters
+            helpers (List[ScanGUIHelper]): helpers, same list used to create this engine
+        """
+        helper = helpers[params.scn.current_index]
+        self._logger.info('Attaching scan {0:s} to engine.'.format(helper.name))
+        self._engine = None
+        self._build_engine(params, self._helpers_to_attach(params, helpers), reuse_components=True)
+
+    def _helpers_to_attach(self, params: OCTUiParams, helpers: List[ScanGUIHelper]) -> List[ScanGUIHelper]:
+        if params.vtx.lazy_components:
+            current = helpers[params.scn.current_index]
+            return [helper for helper in helpers if helper is current or helper.name in self._attached]
+        else:
+            return list(helpers)
+
+    def _log_memory(self, helpers: List[ScanGUIHelper]):
+        # Endpoint tensors are allocated when the engine is prepared
+        host_total = 0
+        device_total = 0
+        for helper in helpers:
+            (host, device) = helper.componentsMemory()
+            host_total += host
+            device_total += device
+            self._peak_memory[helper.name] = max(self._peak_memory.get(helper.name, 0), host + device)
+            self._logger.info("Scan {0:s} endpoints: host {1:.1f} MB, device {2:.1f} MB (peak {3:.1f} MB)".format(helper.name, host/2**20, device/2**20, self._peak_memory[helper.name]/2**20))
+        self._logger.info("All endpoints: host {0:.1f} MB, device {1:.1f} MB".format(host_total/2**20, device_total/2**20))
+
+    def _build_engine(self, params: OCTUiParams, helpers: List[ScanGUIHelper], reuse_components: bool):
+
+        cfg = params.vtx
 
         # Engine configuration
         ec = EngineConfig()
@@ -37,8 +150,13 @@ class VtxEngine(VtxBaseEngine):
         # Pre-populate the strobes with a single universal VolumeStrobe
         # TODO make this part of config
         strobes = [VolumeStrobe(7)]
+        self._arena.trim()
         for helper in helpers:
-            helper.createEngineComponents(params, self._processor.config.samples_per_record)
+            helper.arena = self._arena
+            if not reuse_components or helper.componentsAreStale():
+                helper.buildEngineComponents(params, self._processor.config.samples_per_record)
+            else:
+                helper.components.format_planner.reset()
             ec.add_processor(self._processor, [helper.components.format_planner])
             ec.add_formatter(helper.components.format_planner, helper.components.endpoints)
             s = helper.getStrobe()
@@ -47,20 +165,21 @@ class VtxEngine(VtxBaseEngine):
                 strobes.append(s)
 
 
-        # strobe
+        # strobe - the DAQmxIO depends only on engine params, so it is made once
         if cfg.strobe_enabled and cfg.acquisition_type == AcquisitionType.ALAZAR_ACQUISITION:
             if len(strobes) > 0:
-                strobec = DAQmxConfig()
-                strobec.samples_per_block = cfg.ascans_per_block
-                strobec.samples_per_second = cfg.ssrc_triggers_per_second
-                strobec.blocks_to_buffer = cfg.preload_count
-                strobec.clock.source = cfg.strobe_clock_source
-                strobec.name = 'strobe'
-                self._logger.info("Adding DigitalOutput channel for strobes on device {0:s}".format(cfg.strobe_device_channel))
-                strobec.channels.append(daqmx.DigitalOutput(cfg.strobe_device_channel, Block.StreamIndex.Strobes))
-                strobe = DAQmxIO(get_console_logger(strobec.name, cfg.log_level))
-                strobe.initialize(strobec)
-                self._strobe = strobe
+                if self._strobe is None:
+                    strobec = DAQmxConfig()
+                    strobec.samples_per_block = cfg.ascans_per_block
+                    strobec.samples_per_second = cfg.ssrc_triggers_per_second
+                    strobec.blocks_to_buffer = cfg.preload_count
+                    strobec.clock.source = cfg.strobe_clock_source
+                    strobec.name = 'strobe'
+                    self._logger.info("Adding DigitalOutput channel for strobes on device {0:s}".format(cfg.strobe_device_channel))
+                    strobec.channels.append(daqmx.DigitalOutput(cfg.strobe_device_channel, Block.StreamIndex.Strobes))
+                    strobe = DAQmxIO(get_console_logger(strobec.name, cfg.log_level))
+                    strobe.initialize(strobec)
+                    self._strobe = strobe
             else:
                 self._logger.warn('Strobe is enabled, but no strobe outputs are configured.')
                 self._strobe = None
@@ -90,6 +209,8 @@ class VtxEngine(VtxBaseEngine):
         engine.initialize(ec)
         engine.prepare()
         self._engine = engine
+        self._attached = set(helper.name for helper in helpers)
+        self._log_memory(helpers)
 
     def stop(self):
         # only if we are running
@@ -101,4 +222,4 @@ class VtxEngine(VtxBaseEngine):
             self._logger.info('stopped.')
         else:
             self._logger.warn('engine is not running')
-            
\ No newline at end of file
+            
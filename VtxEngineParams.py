@@ -62,6 +62,9 @@ class VtxEngineParams:
     # processing control
     process_slots: int = 2
 
+    # only build endpoints for the current scan type at Start; others are built when selected
+    lazy_components: bool = False
+
     # logging
     log_level: int = 1
 
@@ -119,6 +122,7 @@ DEFAULT_VTX_ENGINE_PARAMS = VtxEngineParams(
 
     # engine memory parameters
     process_slots=2,                    # I think this is for in-stream processing?
+    lazy_components=False,              # build other scan types' endpoints when first selected
 
     # logging
     log_level=1,                        # 1 is normal, 0 is debug-level
@@ -181,6 +181,9 @@ class VtxEngineParamsDialog(QDialog, Ui_VtxEngineParamsDialog):
         s.galvo_fast_device_channel = self.lineEditGalvoFASTDevice.text()
         s.strobe_clock_source = self.lineEditStrobeClockSource.text()
         s.strobe_device_channel = self.lineEditStrobeDevice.text()
+
+        # not in dialog (config file only), keep whatever we were given
+        s.lazy_components = self._cfg.lazy_components
         return s
 
 
@@ -0,0 +1,184 @@
+from time import perf_counter, sleep
+from dataclasses import dataclass, replace, asdict
+from itertools import product
+from typing import List, Optional
+from pathlib import Path
+import json
+import sys
+import logging
+
+from vortex import Range, get_console_logger as get_logger
+from vortex.scan import RasterScan, RasterScanConfig
+from vortex.engine import EngineConfig, Engine, StackDeviceTensorEndpointInt8, StackHostTensorEndpointInt8
+from vortex.process import CUDAProcessor, CUDAProcessorConfig
+from vortex.format import FormatPlanner, FormatPlannerConfig, StackFormatExecutorConfig, StackFormatExecutor, SimpleSlice
+
+from VtxBaseEngine import VtxBaseEngine
+from VtxEngineParams import VtxEngineParams, AcquisitionType
+from OCTUiParams import OCTUiParams, default_config_path
+
+LOGGER = get_logger('autotune')
+
+@dataclass
+class TuneResult:
+    ascans_per_block: int
+    blocks_to_allocate: int
+    preload_count: int
+    process_slots: int
+    ascans_per_second: float = 0.0
+    max_block_utilization: float = 0.0
+    scan_change_latency: float = 0.0    # seconds, at the swept-source rate
+    block_memory: int = 0               # bytes allocated for blocks
+    error: str = ''
+
+
+def use_cuda_processor(base: VtxBaseEngine, log_level: int):
+    '''
+    VtxBaseEngine pairs FileAcquisition with the CPU processor. Swap in a CUDA processor with the same settings.
+    '''
+    cpu = base._processor_config
+    pc = CUDAProcessorConfig()
+    pc.samples_per_record = cpu.samples_per_record
+    pc.ascans_per_block = cpu.ascans_per_block
+    pc.slots = cpu.slots
+    pc.resampling_samples = cpu.resampling_samples
+    pc.spectral_filter = cpu.spectral_filter
+    pc.average_window = cpu.average_window
+    processor = CUDAProcessor(get_logger('process', log_level))
+    processor.initialize(pc)
+    base._processor_config = pc
+    base._processor = processor
+
+
+def run_trial(vtx: VtxEngineParams, cuda: bool, blocks: int, bscans_per_volume: int=100, ascans_per_bscan: int=500) -> TuneResult:
+    result = TuneResult(vtx.ascans_per_block, vtx.blocks_to_allocate, vtx.preload_count, vtx.process_slots)
+    try:
+        base = VtxBaseEngine(vtx)
+        if cuda:
+            use_cuda_processor(base, vtx.log_level)
+        samples_per_record = base._processor.config.samples_per_record
+
+        scfg = RasterScanConfig()
+        scfg.bscans_per_volume = bscans_per_volume
+        scfg.ascans_per_bscan = ascans_per_bscan
+        scfg.bscan_extent = Range(0, 0)
+        scfg.volume_extent = Range(0, 0)
+        scfg.loop = True
+        scan = RasterScan()
+        scan.initialize(scfg)
+
+        fc = FormatPlannerConfig()
+        fc.segments_per_volume = bscans_per_volume
+        fc.records_per_segment = ascans_per_bscan
+        fc.adapt_shape = False
+        format_planner = FormatPlanner(get_logger('format', vtx.log_level))
+        format_planner.initialize(fc)
+
+        sfec = StackFormatExecutorConfig()
+        sfec.sample_slice = SimpleSlice(samples_per_record // 2)
+        sfe = StackFormatExecutor()
+        sfe.initialize(sfec)
+        shape = (bscans_per_volume, ascans_per_bscan, sfec.sample_slice.count())
+        if cuda:
+            endpoint = StackDeviceTensorEndpointInt8(sfe, shape, get_logger('stack', vtx.log_level))
+        else:
+            endpoint = StackHostTensorEndpointInt8(sfe, shape, get_logger('stack', vtx.log_level))
+
+        ec = EngineConfig()
+        ec.add_acquisition(base._acquire, [base._processor])
+        ec.add_processor(base._processor, [format_planner])
+        ec.add_formatter(format_planner, [endpoint])
+        ec.preload_count = vtx.preload_count
+        ec.records_per_block = vtx.ascans_per_block
+        ec.blocks_to_allocate = vtx.blocks_to_allocate
+        ec.blocks_to_acquire = blocks
+
+        engine = Engine(get_logger('engine', vtx.log_level))
+        engine.initialize(ec)
+        engine.prepare()
+        engine.scan_queue.append(scan)
+
+        t0 = perf_counter()
+        engine.start()
+        while not engine.done:
+            status = engine.status()
+            result.max_block_utilization = max(result.max_block_utilization, status.block_utilization)
+            sleep(0.01)
+        engine.wait()
+        dt = perf_counter() - t0
+        engine.stop()
+
+        result.ascans_per_second = blocks * vtx.ascans_per_block / dt
+        result.block_memory = vtx.blocks_to_allocate * vtx.ascans_per_block * samples_per_record * 2
+
+        # A scan change waits for the preloaded blocks to drain. FileAcquisition runs faster
+        # than real time, so this is computed for the swept-source rate rather than measured.
+        result.scan_change_latency = vtx.preload_count * vtx.ascans_per_block / vtx.ssrc_triggers_per_second
+    except RuntimeError as e:
+        result.error = str(e)
+    return result
+
+
+def best_result(results: List[TuneResult], required_rate: float, max_utilization: float) -> Optional[TuneResult]:
+    '''
+    Among trials that keep up with the swept source and stay under the utilization limit, prefer
+    low scan-change latency, then low memory.
+    '''
+    ok = [r for r in results if not r.error and r.ascans_per_second >= required_rate and r.max_block_utilization <= max_utilization]
+    if not ok:
+        return None
+    return min(ok, key=lambda r: (r.scan_change_latency, r.block_memory, -r.ascans_per_second))
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO)
+
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+    parser = ArgumentParser(description='Sweep engine memory parameters and write the best ones to the config file.', formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--config', default='', help='path to config file [default = {0:s}]'.format(str(default_config_path)))
+    parser.add_argument('--input-file', default='', help='spectra file for FileAcquisition (default is input_file from config)')
+    parser.add_argument('--cuda', action='store_true', help='use CUDA processor instead of CPU processor')
+    parser.add_argument('--ascans-per-block', type=int, nargs='+', default=[500, 1000, 2000])
+    parser.add_argument('--blocks-to-allocate', type=int, nargs='+', default=[32, 64, 128])
+    parser.add_argument('--preload-count', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--process-slots', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--blocks', type=int, default=500, help='blocks to acquire per trial')
+    parser.add_argument('--max-utilization', type=float, default=0.5, help='reject trials whose block utilization exceeds this')
+    parser.add_argument('--json', default='', help='write all trial results to this file')
+    parser.add_argument('--dry-run', action='store_true', help='do not update config file')
+    args = parser.parse_args()
+
+    params = OCTUiParams(config_file=args.config)
+    vtx = replace(params.vtx, acquisition_type=AcquisitionType.FILE_ACQUISITION, galvo_enabled=False, strobe_enabled=False)
+    if args.input_file:
+        vtx.input_file = args.input_file
+    if not Path(vtx.input_file).exists():
+        LOGGER.error("Input file \"{0:s}\" not found. Use --input-file.".format(vtx.input_file))
+        sys.exit(1)
+
+    results = []
+    for (apb, bta, pc, ps) in product(args.ascans_per_block, args.blocks_to_allocate, args.preload_count, args.process_slots):
+        if pc > bta:
+            continue
+        trial = replace(vtx, ascans_per_block=apb, blocks_to_allocate=bta, preload_count=pc, process_slots=ps)
+        r = run_trial(trial, args.cuda, args.blocks)
+        results.append(r)
+        if r.error:
+            LOGGER.warn("apb {0:d} bta {1:d} preload {2:d} slots {3:d}: {4:s}".format(apb, bta, pc, ps, r.error))
+        else:
+            LOGGER.info("apb {0:d} bta {1:d} preload {2:d} slots {3:d}: {4:.0f} ascans/s, max blk_util {5:.2f}, latency {6:.1f}ms, blocks {7:.1f} MB".format(apb, bta, pc, ps, r.ascans_per_second, r.max_block_utilization, r.scan_change_latency*1000, r.block_memory/2**20))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+    best = best_result(results, vtx.ssrc_triggers_per_second, args.max_utilization)
+    if best is None:
+        LOGGER.error("No configuration kept up with {0:d} ascans/s.".format(vtx.ssrc_triggers_per_second))
+        sys.exit(1)
+
+    LOGGER.info("Best: ascans_per_block {0:d}, blocks_to_allocate {1:d}, preload_count {2:d}, process_slots {3:d}".format(best.ascans_per_block, best.blocks_to_allocate, best.preload_count, best.process_slots))
+    if not args.dry_run:
+        params.vtx = replace(params.vtx, ascans_per_block=best.ascans_per_block, blocks_to_allocate=best.blocks_to_allocate, preload_count=best.preload_count, process_slots=best.process_slots)
+        params.save()
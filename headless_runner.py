@@ -0,0 +1,138 @@
+from time import perf_counter, sleep
+from dataclasses import dataclass, field, replace, asdict
+from typing import List, Dict
+from pathlib import Path
+import json
+import sys
+import logging
+
+from vortex import get_console_logger as get_logger
+
+from OCTUiParams import OCTUiParams, default_config_path
+from VtxEngineParams import AcquisitionType
+from VtxEngine import VtxEngine
+from ScanGUIHelper import ScanGUIHelper
+from scanGUIHelperFactory import scanGUIHelperFactory
+from CallbackTimers import callback_timers
+
+LOGGER = get_logger('headless')
+
+@dataclass
+class RunStats:
+    scan: str
+    elapsed: float = 0.0
+    volumes: int = 0
+    segments: int = 0
+    ascans: int = 0
+    ascans_per_second: float = 0.0
+    volumes_per_second: float = 0.0
+    max_block_utilization: float = 0.0
+    setup_time: float = 0.0
+    callbacks: List[Dict] = field(default_factory=list)     # timing of each callback, if instrumented
+
+
+class HeadlessRunner():
+    '''
+    Runs the VtxEngine pipeline for one scan type without Qt. Scan helpers are created headless, so they
+    build their engine components (format planner and endpoints) but no edit widgets or plots.
+    '''
+    def __init__(self, params: OCTUiParams, scan_name: str=''):
+        self._params = params
+        self._helpers: List[ScanGUIHelper] = []
+        for number,(name,cfg) in enumerate(params.scn.scans.items()):
+            self._helpers.append(scanGUIHelperFactory(name, 1<<number, cfg, {}, None))
+            if name == scan_name:
+                params.scn.current_index = number
+        self._helper = self._helpers[params.scn.current_index]
+        self._stats = RunStats(self._helper.name)
+
+        t0 = perf_counter()
+        self._vtxengine = VtxEngine(params, self._helpers)
+        self._stats.setup_time = perf_counter() - t0
+
+        # count what comes out of the current scan's endpoints
+        self._helper.components.null_endpoint.aggregate_segment_callback = callback_timers.instrument('headless.segments')(self._cb_segments)
+        self._helper.components.null_endpoint.volume_callback = callback_timers.instrument('headless.volume', segments=False)(self._cb_volume)
+        callback_timers.segment_time = self._helper.params.ascans_per_bscan / params.vtx.ssrc_triggers_per_second
+
+    @property
+    def engine(self) -> VtxEngine:
+        return self._vtxengine
+
+    @property
+    def helper(self) -> ScanGUIHelper:
+        return self._helper
+
+    def _cb_segments(self, v):
+        self._stats.segments += len(v)
+
+    def _cb_volume(self, sample_idx, scan_idx, volume_idx):
+        self._stats.volumes += 1
+
+    def run(self, volumes: int=0, seconds: float=0) -> RunStats:
+        '''
+        Run until the given number of volumes have been completed, or the given time has passed,
+        whichever is first. Zero means no limit, but at least one should be nonzero.
+        '''
+        engine = self._vtxengine._engine
+        engine.scan_queue.clear()
+        engine.scan_queue.append(self._helper.getScan())
+
+        t0 = perf_counter()
+        engine.start()
+        try:
+            while not engine.done:
+                status = engine.status()
+                self._stats.max_block_utilization = max(self._stats.max_block_utilization, status.block_utilization)
+                if volumes > 0 and self._stats.volumes >= volumes:
+                    break
+                if seconds > 0 and perf_counter() - t0 >= seconds:
+                    break
+                sleep(0.05)
+        finally:
+            self._vtxengine.stop()
+        s = self._stats
+        s.elapsed = perf_counter() - t0
+        s.ascans = s.segments * self._helper.params.ascans_per_bscan
+        s.ascans_per_second = s.ascans / s.elapsed
+        s.volumes_per_second = s.volumes / s.elapsed
+        s.callbacks = [dict(asdict(c), mean=c.mean, p99=c.percentile(99)) for c in callback_timers.stats()]
+        return s
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO)
+
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+    parser = ArgumentParser(description='Run the OCT engine pipeline without a GUI, using FileAcquisition, and report throughput.', formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--config', default='', help='path to config file [default = {0:s}]'.format(str(default_config_path)))
+    parser.add_argument('--input-file', default='', help='spectra file for FileAcquisition (default is input_file from config)')
+    parser.add_argument('--scan', default='', help='name of scan to run (default is current scan in config)')
+    parser.add_argument('--volumes', type=int, default=0, help='stop after this many volumes')
+    parser.add_argument('--seconds', type=float, default=10, help='stop after this many seconds')
+    parser.add_argument('--json', default='', help='write results to this file')
+    parser.add_argument('--instrument', action='store_true', help='time the engine callbacks')
+    args = parser.parse_args()
+
+    params = OCTUiParams(config_file=args.config)
+    params.vtx = replace(params.vtx, acquisition_type=AcquisitionType.FILE_ACQUISITION)
+    if args.input_file:
+        params.vtx.input_file = args.input_file
+    if not Path(params.vtx.input_file).exists():
+        LOGGER.error("Input file \"{0:s}\" not found. Use --input-file.".format(params.vtx.input_file))
+        sys.exit(1)
+    if args.scan and args.scan not in params.scn.scans:
+        LOGGER.error("No scan named \"{0:s}\" in config. Choose from {1:s}".format(args.scan, ', '.join(params.scn.scans.keys())))
+        sys.exit(1)
+
+    # must be enabled before the helpers' components are built
+    callback_timers.enabled = args.instrument
+    runner = HeadlessRunner(params, args.scan)
+    stats = runner.run(args.volumes, args.seconds)
+    LOGGER.info("scan {0:s}: {1:d} volumes, {2:d} segments in {3:.2f}s; {4:.0f} ascans/s, {5:.2f} volumes/s, max blk_util {6:.2f}, setup {7:.2f}s".format(stats.scan, stats.volumes, stats.segments, stats.elapsed, stats.ascans_per_second, stats.volumes_per_second, stats.max_block_utilization, stats.setup_time))
+    for line in callback_timers.report():
+        LOGGER.info("callback " + line)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(asdict(stats), f, indent=2)
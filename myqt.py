@@ -1,6 +1,7 @@
 from typing import List, Tuple, Iterable, Optional, Callable
 from enum import Enum, IntFlag
 from math import floor, ceil
+from time import perf_counter
 from pathlib import Path
 from warnings import warn
 
@@ -84,6 +85,12 @@ class MyNumpyImageWidget(BaseImageWidget, QWidget):
             Relative zoom factor per wheel step.
         range_step `int`: `1`
             Value to adjust range bounds per key press.
+        percentile_interval `int`: `8`
+            In `Percentile` scaling, bounds are recomputed (from a subsample of the data) every this many images.
+
+        2-D data is drawn through a 256-entry RGBA lookup table made from the colormap. For 8-bit data the 
+        table is indexed directly by the data bytes, otherwise the scaled data is first quantized to 8 bits.
+        Only the displayed region is converted, into a buffer reused between images.
         '''
 
         self._transform = kwargs.pop('transform', None)
@@ -110,9 +117,16 @@ class MyNumpyImageWidget(BaseImageWidget, QWidget):
         self._zoom_mouse_step: float = kwargs.pop('zoom_mouse_step', 0.001)
 
         self._range_step: int = kwargs.pop('range_step', 1)
+        self._percentile_interval: int = kwargs.pop('percentile_interval', 8)
 
         self._vmin = 0
         self._vmax = 0
+        self._render_time = 0.0
+        self._lut_key = None            # (colormap, vmin, vmax, dtype) of _lut
+        self._lut: Optional[np.ndarray] = None
+        self._rgba: Optional[np.ndarray] = None
+        self._percentile_key = None     # (data shape, dtype, range) of cached percentile bounds
+        self._percentile_age = 0
 
         self.__pixmap: Optional[QPixmap] = None
         self.__pixmap_draw_rect: Optional[QRectF] = None
@@ -429,6 +443,8 @@ class MyNumpyImageWidget(BaseImageWidget, QWidget):
         step = np.where(step < 1, 1, step)
         data = self.data[start[0]:end[0]:step[0], start[1]:end[1]:step[1], ...]
 
+        t0 = perf_counter()
+
         # determine scale bounds on full data
         if self._range_mode == MyNumpyImageWidget.Scaling.Absolute:
             (self._vmin, self._vmax) = self._range
@@ -436,10 +452,19 @@ class MyNumpyImageWidget(BaseImageWidget, QWidget):
             self._vmin = self.data.min()
             self._vmax = self.data.max()
         elif self._range_mode == MyNumpyImageWidget.Scaling.Percentile:
-            (self._vmin, self._vmax) = np.percentile(self.data, self._range)
+            self._update_percentile_bounds()
         else:
             raise ValueError(f'unknown data range mode: {self._range_mode}')
 
+        # fast path - lookup table straight into the RGBA buffer
+        if data.ndim == 2:
+            rgba = self._lut_rgba(data)
+            if rgba is not None:
+                self.__pixmap = QPixmap.fromImage(QImage(rgba.data, rgba.shape[1], rgba.shape[0], rgba.strides[0], QImage.Format_RGBA8888))
+                self.__pixmap_draw_rect = QRectF(QPointF(start[1], start[0]), QPointF(end[1], end[0])).translated(-shape[1] / 2, -shape[0] / 2)
+                self._render_time = perf_counter() - t0
+                return
+
         # apply scale and colormap
         data = (data.astype(np.float32) - self._vmin) / (self._vmax - self._vmin)
         data = self._colormap(data, bytes=True)
@@ -474,6 +499,66 @@ class MyNumpyImageWidget(BaseImageWidget, QWidget):
         # self.__pixmap = QPixmap.fromImage(QImage(data, data.shape[1], data.shape[0], QImage.Format_ARGB32_Premultiplied))
         self.__pixmap = QPixmap.fromImage(QImage(data, data.shape[1], data.shape[0], QImage.Format_RGBA8888))
         self.__pixmap_draw_rect = QRectF(QPointF(start[1], start[0]), QPointF(end[1], end[0])).translated(-shape[1] / 2, -shape[0] / 2)
+        self._render_time = perf_counter() - t0
+
+    def _update_percentile_bounds(self) -> None:
+        '''
+        Percentile bounds from a subsample (about 64k values) of the data. The data is usually edited in place, 
+        so the bounds are kept for percentile_interval images, unless the shape, dtype or range changes.
+        8-bit data uses a histogram of the byte values instead of sorting.
+        '''
+        key = (self.data.shape, self.data.dtype, tuple(self._range))
+        if key == self._percentile_key and self._percentile_age < self._percentile_interval:
+            self._percentile_age += 1
+            return
+        self._percentile_key = key
+        self._percentile_age = 1
+
+        stride = max(1, int(np.sqrt(self.data.size / 65536)))
+        sample = self.data[::stride, ::stride, ...]
+        if self.data.dtype in (np.uint8, np.int8):
+            counts = np.bincount(np.ascontiguousarray(sample).view(np.uint8).ravel(), minlength=256)
+            values = np.arange(256, dtype=np.uint8).view(self.data.dtype).astype(np.float64)
+            order = np.argsort(values)
+            cdf = np.cumsum(counts[order]) / max(1, counts.sum())
+            q = np.asanyarray(self._range, dtype=np.float64) / 100
+            (self._vmin, self._vmax) = values[order][np.minimum(np.searchsorted(cdf, q), 255)]
+        else:
+            (self._vmin, self._vmax) = np.percentile(sample, self._range)
+
+    def _lut_rgba(self, data: np.ndarray) -> Optional[np.ndarray]:
+        '''
+        Color-map 2-D data through a 256-entry RGBA lookup table into a reused buffer (uint32 per pixel, 
+        RGBA byte order). Returns None if the colormap cannot make a table.
+        '''
+        eight_bit = data.dtype in (np.uint8, np.int8)
+        span = float(self._vmax - self._vmin) or 1.0
+        key = (self._colormap, float(self._vmin), float(self._vmax), data.dtype if eight_bit else None)
+        if key != self._lut_key:
+            try:
+                colors = np.ascontiguousarray(self._colormap(np.linspace(0, 1, 256), bytes=True), dtype=np.uint8)
+            except TypeError:
+                return None
+            if colors.shape != (256, 4):
+                return None
+            colors = colors.view(np.uint32).ravel()
+            if eight_bit:
+                # index by byte value - colormap index of each possible value, as _colormap would quantize it
+                values = np.arange(256, dtype=np.uint8).view(data.dtype).astype(np.float32)
+                index = np.clip((values - self._vmin) / span * 256, 0, 255).astype(np.intp)
+                self._lut = colors[index]
+            else:
+                self._lut = colors
+            self._lut_key = key
+
+        if self._rgba is None or self._rgba.shape != data.shape:
+            self._rgba = np.empty(data.shape, dtype=np.uint32)
+        if eight_bit:
+            np.take(self._lut, data.view(np.uint8), out=self._rgba)
+        else:
+            scaled = (data.astype(np.float32) - self._vmin) * (256 / span)
+            np.take(self._lut, np.clip(scaled, 0, 255).astype(np.uint8), out=self._rgba)
+        return self._rgba
 
 
     def _get_drawn_image_dimensions(self, shape: Optional[Iterable[int]]=None) -> Tuple[float, float]:
@@ -565,6 +650,7 @@ class MyNumpyImageWidget(BaseImageWidget, QWidget):
             lines += [f'Image: {self.__pixmap.height()} x {self.__pixmap.width()}']
         lines += ['']
         lines += [f'Range: {self._vmin} - {self._vmax}']
+        lines += [f'Render: {self._render_time * 1000:.2f} ms']
         lines += [f'Pan: ({self._pan[0]}, {self._pan[1]})']
         lines += [f'Angle: {self._angle}']
         lines += [f'Flip: {self._flip % 4}']
@@ -0,0 +1,228 @@
+from dataclasses import dataclass, field, replace, asdict, fields
+from itertools import product
+from tempfile import TemporaryDirectory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import platform
+import json
+import sys
+import logging
+import numpy as np
+
+from vortex import get_console_logger as get_logger, __version__ as vortex_version
+
+from OCTUiParams import OCTUiParams, default_config_path
+from VtxEngineParams import VtxEngineParams, AcquisitionType
+from VolumeWriter import VolumeWriter, StorageFormat
+from headless_runner import HeadlessRunner
+
+LOGGER = get_logger('benchmark')
+
+# Seed for the synthetic spectra, so runs on different machines (or different commits) see the same input
+SEED = 20251016
+
+
+@dataclass
+class BenchmarkResult:
+    scan: str
+    processor: str                  # 'cpu' (VtxEngine with every scan's endpoints) or 'cuda' (single stack endpoint)
+    ascans_per_block: int
+    samples_per_ascan: int
+    bscans_per_volume: int
+    ascans_per_bscan: int
+    storage: str = ''               # StorageFormat name if volumes were saved
+    elapsed: float = 0.0
+    volumes: int = 0
+    ascans_per_second: float = 0.0
+    volumes_per_second: float = 0.0
+    max_block_utilization: float = 0.0
+    volumes_written: int = 0
+    volumes_dropped: int = 0
+    error: str = ''
+
+    @property
+    def key(self) -> str:
+        '''Identifies the configuration, for comparing runs.'''
+        return "{0:s}/{1:s}/apb{2:d}/spa{3:d}/{4:d}x{5:d}/{6:s}".format(self.scan, self.processor, self.ascans_per_block, self.samples_per_ascan,
+                                                                    self.bscans_per_volume, self.ascans_per_bscan, self.storage or 'nosave')
+
+
+def gpu_available() -> bool:
+    try:
+        import cupy
+        return cupy.cuda.runtime.getDeviceCount() > 0
+    except Exception:
+        return False
+
+
+def environment() -> Dict[str, str]:
+    '''What the results depend on besides the configuration.'''
+    env = {'vortex': vortex_version, 'numpy': np.__version__, 'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor()}
+    if gpu_available():
+        import cupy
+        env['gpu'] = cupy.cuda.runtime.getDeviceProperties(0)['name'].decode()
+    version_file = Path(__file__).parent / 'version.txt'
+    if version_file.exists():
+        env['vortup'] = version_file.read_text().strip()
+    return env
+
+
+def synthetic_spectra(path: str, samples_per_ascan: int, records: int):
+    '''Write records A-scans of uint16 spectra (a few fringes plus noise) for FileAcquisition.'''
+    rng = np.random.default_rng(SEED)
+    x = np.linspace(0, 1, samples_per_ascan)
+    fringes = sum(np.sin(2 * np.pi * f * x) for f in (8, 19, 100, 371))
+    spectra = 2**11 + 2**8 * fringes[None, :] + rng.normal(0, 2**5, (records, samples_per_ascan))
+    # NOTE: FileAcquisition reads raw uint16 records
+    spectra.clip(0, 2**16 - 1).astype(np.uint16).tofile(path)
+
+
+def with_shape(scan, bscans_per_volume: int, ascans_per_bscan: int):
+    '''Scan params with a different shape. Line and galvo tuning scans have lines instead of B-scans.'''
+    if hasattr(scan, 'bscans_per_volume'):
+        return replace(scan, bscans_per_volume=bscans_per_volume, ascans_per_bscan=ascans_per_bscan)
+    return replace(scan, lines_per_volume=bscans_per_volume, ascans_per_bscan=ascans_per_bscan)
+
+
+def run_pipeline(params: OCTUiParams, scan: str, volumes: int, seconds: float, storage: Optional[StorageFormat], save_dir: str) -> BenchmarkResult:
+    '''Run one configuration through VtxEngine, with the endpoints of every scan helper attached.'''
+    vtx = params.vtx
+    cfg = params.scn.scans[scan]
+    bscans = getattr(cfg, 'bscans_per_volume', getattr(cfg, 'lines_per_volume', 0))
+    result = BenchmarkResult(scan, 'cpu', vtx.ascans_per_block, vtx.samples_per_ascan, bscans, cfg.ascans_per_bscan, storage.name if storage else '')
+    try:
+        runner = HeadlessRunner(params, scan)
+        writer = None
+        if storage is not None:
+            tensor = runner.helper.components.spectra_endpoint.tensor
+            shape = tensor.shape
+            writer = VolumeWriter(str(Path(save_dir) / (result.key.replace('/', '-') + storage.extension)), (shape[0], shape[1], shape[2], 1), tensor.dtype,
+                                  arena=runner.engine.arena, format=storage)
+            runner.helper.volume_writer = writer
+        stats = runner.run(volumes, seconds)
+        if writer is not None:
+            writer.close()
+            writer.wait()
+            runner.helper.volume_writer = None
+            ws = writer.stats
+            (result.volumes_written, result.volumes_dropped) = (ws.written, ws.dropped)
+        result.elapsed = stats.elapsed
+        result.volumes = stats.volumes
+        result.ascans_per_second = stats.ascans_per_second
+        result.volumes_per_second = stats.volumes_per_second
+        result.max_block_utilization = stats.max_block_utilization
+    except RuntimeError as e:
+        result.error = str(e)
+    return result
+
+
+def run_cuda(vtx: VtxEngineParams, blocks: int, bscans_per_volume: int, ascans_per_bscan: int) -> BenchmarkResult:
+    '''The cuda_benchmark.py configuration (CUDA processor, one device stack endpoint), with FileAcquisition input.'''
+    from engine_autotune import run_trial
+    r = run_trial(vtx, True, blocks, bscans_per_volume, ascans_per_bscan)
+    result = BenchmarkResult('stack', 'cuda', vtx.ascans_per_block, vtx.samples_per_ascan, bscans_per_volume, ascans_per_bscan,
+                             ascans_per_second=r.ascans_per_second, max_block_utilization=r.max_block_utilization, error=r.error)
+    result.elapsed = blocks * vtx.ascans_per_block / r.ascans_per_second if r.ascans_per_second > 0 else 0.0
+    return result
+
+
+def compare(results: List[BenchmarkResult], baseline: List[Dict], tolerance: float) -> List[Tuple[str, float, float]]:
+    '''
+    (key, baseline ascans/s, ascans/s) for each configuration that is slower than baseline by more than tolerance
+    (a fraction). Configurations that are not in both runs, or failed in either, are not compared.
+    '''
+    base = {BenchmarkResult(**{f.name: b[f.name] for f in fields(BenchmarkResult) if f.name in b}).key: b for b in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(r.key)
+        if b is None or r.error or b.get('error') or b['ascans_per_second'] <= 0:
+            continue
+        if r.ascans_per_second < b['ascans_per_second'] * (1 - tolerance):
+            regressions.append((r.key, b['ascans_per_second'], r.ascans_per_second))
+    return regressions
+
+
+def parse_shape(s: str) -> Tuple[int, int]:
+    (b, a) = s.lower().split('x')
+    return (int(b), int(a))
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO)
+
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+    parser = ArgumentParser(description='Benchmark the engine pipeline (FileAcquisition, every scan helper\'s endpoints) over a grid of block sizes, A-scan lengths and scan shapes.', formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--config', default='', help='path to config file [default = {0:s}]'.format(str(default_config_path)))
+    parser.add_argument('--input-file', default='', help='spectra file for FileAcquisition (default is synthetic spectra, made for each A-scan length)')
+    parser.add_argument('--scan', nargs='+', default=[], help='scans to run (default is every scan in config)')
+    parser.add_argument('--ascans-per-block', type=int, nargs='+', default=[500, 1000])
+    parser.add_argument('--samples-per-ascan', type=int, nargs='+', default=[1024, 2048])
+    parser.add_argument('--shape', nargs='+', default=['100x500'], help='scan shapes, BxA (B-scans or lines per volume x A-scans per B-scan)')
+    parser.add_argument('--save', nargs='+', default=[], choices=[f.name.lower() for f in StorageFormat], help='also run with spectra saved in these formats')
+    parser.add_argument('--volumes', type=int, default=10, help='volumes per trial')
+    parser.add_argument('--seconds', type=float, default=60, help='longest time per trial')
+    parser.add_argument('--cuda', choices=['auto', 'yes', 'no'], default='auto', help='also run the CUDA processor trials (auto: if a GPU is present)')
+    parser.add_argument('--json', default='', help='write results to this file')
+    parser.add_argument('--compare', default='', help='baseline results (from --json) to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='fail if A-scans/s is below baseline by more than this fraction')
+    args = parser.parse_args()
+
+    params = OCTUiParams(config_file=args.config)
+    scans = args.scan if args.scan else list(params.scn.scans.keys())
+    for scan in scans:
+        if scan not in params.scn.scans:
+            LOGGER.error("No scan named \"{0:s}\" in config. Choose from {1:s}".format(scan, ', '.join(params.scn.scans.keys())))
+            sys.exit(1)
+    if args.input_file and not Path(args.input_file).exists():
+        LOGGER.error("Input file \"{0:s}\" not found.".format(args.input_file))
+        sys.exit(1)
+    cuda = args.cuda == 'yes' or (args.cuda == 'auto' and gpu_available())
+    shapes = [parse_shape(s) for s in args.shape]
+    storages = [None] + [StorageFormat[s.upper()] for s in args.save]
+
+    results: List[BenchmarkResult] = []
+    with TemporaryDirectory() as tmp:
+        for spa in args.samples_per_ascan:
+            input_file = args.input_file
+            if not input_file:
+                input_file = str(Path(tmp) / 'spectra-{0:d}.bin'.format(spa))
+                synthetic_spectra(input_file, spa, 4 * int(np.lcm.reduce(args.ascans_per_block)))
+            for (apb, (bscans, ascans)) in product(args.ascans_per_block, shapes):
+                vtx = replace(params.vtx, acquisition_type=AcquisitionType.FILE_ACQUISITION, galvo_enabled=False, strobe_enabled=False,
+                              input_file=input_file, ascans_per_block=apb, samples_per_ascan=spa, blocks_to_acquire=0)
+                trials = []
+                for (scan, storage) in product(scans, storages):
+                    # fresh params for each trial - the runner changes the current scan
+                    p = OCTUiParams(config_file=args.config)
+                    p.vtx = vtx
+                    p.scn.scans = {name: with_shape(cfg, bscans, ascans) for (name, cfg) in p.scn.scans.items()}
+                    trials.append(lambda p=p, scan=scan, storage=storage: run_pipeline(p, scan, args.volumes, args.seconds, storage, tmp))
+                if cuda:
+                    trials.append(lambda: run_cuda(vtx, args.volumes * bscans * ascans // apb, bscans, ascans))
+                for trial in trials:
+                    r = trial()
+                    results.append(r)
+                    if r.error:
+                        LOGGER.warn("{0:s}: {1:s}".format(r.key, r.error))
+                    else:
+                        LOGGER.info("{0:s}: {1:.0f} ascans/s, {2:.2f} volumes/s, max blk_util {3:.2f}".format(r.key, r.ascans_per_second, r.volumes_per_second, r.max_block_utilization)
+                                    + (", {0:d} written, {1:d} dropped".format(r.volumes_written, r.volumes_dropped) if r.storage else ""))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'environment': environment(), 'results': [asdict(r) for r in results]}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for (key, before, after) in regressions:
+            LOGGER.error("{0:s}: {1:.0f} -> {2:.0f} ascans/s ({3:+.1f}%)".format(key, before, after, 100 * (after / before - 1)))
+        if regressions:
+            LOGGER.error("{0:d} configurations slower than baseline by more than {1:.0f}%".format(len(regressions), 100 * args.tolerance))
+            sys.exit(1)
+        LOGGER.info("No throughput regressions against {0:s}".format(args.compare))
+
+    if any(r.error for r in results):
+        sys.exit(1)